@@ -11,4 +11,5 @@ app = src_app.app
 DB = src_app.DB  # Expose DB for pytest fixtures to patch
 
 if __name__ == "__main__":
+    src_app.create_app(init_db=True)  # local runs set up the schema themselves
     app.run()
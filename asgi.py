@@ -0,0 +1,12 @@
+"""ASGI entry point for the async serving mode: ``uvicorn asgi:app`` (see src/async_app.py)"""
+import sys
+import os
+
+# Add src directory to path so imports work
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+import app as flask_app  # noqa: E402  (src/app.py)
+from async_app import AsyncApp  # noqa: E402
+
+flask_app.create_app()
+app = AsyncApp(flask_app)
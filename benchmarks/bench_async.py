@@ -0,0 +1,252 @@
+"""Concurrent-generation capacity: sync (gunicorn) vs async (uvicorn) serving.
+
+Usage:
+    python benchmarks/bench_async.py [--levels 25,50,100,200,400] [--slo 15]
+                                     [--sync-workers 4] [--sync-threads 8] [--async-workers 1]
+                                     [--llm-latency 1.0] [--llm-token-delay 0.05] [--llm-tokens 100]
+                                     [--long-every 4] [--long-chunks 4] [--chunk-chars 2000]
+                                     [--modes sync,async] [--out results.json]
+
+Both servers run as subprocesses on a throwaway SQLite file (set up with
+``flask init-db``), pointed at one fake Anthropic server
+(benchmarks/fake_anthropic.py) whose streams take roughly
+``llm-latency + llm-tokens * llm-token-delay`` seconds, as real ones do. For
+each level N, N clients open ``POST /generate/stream`` at once, each with
+distinct text so the AI cache never answers; a stream counts as served when
+its ``done`` event arrives within ``--slo`` seconds. Every ``--long-every``-th
+client sends text of ``--long-chunks`` chunks (servers run with
+``SUMMARY_CHUNK_CHARS=--chunk-chars``), so those streams go through the
+map-reduce path: one model call per chunk, then the streamed merge. The
+resident memory of the server's whole process tree is sampled from /proc
+meanwhile.
+
+Capacity is the highest level at which every stream was served, and the
+headline figure is capacity per GB of peak RSS at that level. The gateway
+limits (LLM_MAX_CONCURRENCY, LLM_ASYNC_MAX_CONCURRENCY) are raised out of the
+way so the serving model is what is measured. Linux only (reads /proc).
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_anthropic import FakeAnthropic  # noqa: E402
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def process_tree(pid):
+    pids, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        pids.append(current)
+        try:
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children') as f:
+                    stack.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def tree_rss(pid):
+    """Resident bytes of a process and all its descendants"""
+    total = 0
+    for p in process_tree(pid):
+        try:
+            with open(f'/proc/{p}/statm') as f:
+                total += int(f.read().split()[1]) * PAGE_SIZE
+        except OSError:
+            pass
+    return total
+
+
+class RSSSampler(threading.Thread):
+    def __init__(self, pid, interval=0.1):
+        super().__init__(daemon=True)
+        self.pid, self.interval = pid, interval
+        self.peak = tree_rss(pid)
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.peak = max(self.peak, tree_rss(self.pid))
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return self.peak
+
+
+def server_command(mode, port, args):
+    if mode == 'sync':
+        return [sys.executable, '-m', 'gunicorn', '-w', str(args.sync_workers), '--threads', str(args.sync_threads),
+                '-b', f'127.0.0.1:{port}', '--timeout', '120', '--log-level', 'warning', 'app:app']
+    return [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(port),
+            '--workers', str(args.async_workers), '--log-level', 'warning']
+
+
+def start_server(mode, env, args):
+    port = free_port()
+    proc = subprocess.Popen(server_command(mode, port, args), cwd=ROOT, env=env)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f'{mode} server exited with {proc.returncode}')
+        try:
+            urllib.request.urlopen(url + '/jobs/stats', timeout=1).read()
+            return proc, url
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit(f'{mode} server did not come up on {url}')
+
+
+def material(chunks, chunk_chars):
+    """Distinct text that splits into ``chunks`` chunks of at most ``chunk_chars``"""
+    if chunks <= 1:
+        return f'Benchmark material {uuid.uuid4().hex}'
+    sentence = f'Benchmark material {uuid.uuid4().hex}. '
+    section = sentence * max(1, int(chunk_chars * 0.9) // len(sentence))
+    return '\n\n'.join(f'Section {i}. {section}' for i in range(chunks))
+
+
+def stream_once(url, slo, chunks=1, chunk_chars=2000):
+    """One generation stream; returns (served, seconds)"""
+    data = urllib.parse.urlencode({'raw_text': material(chunks, chunk_chars)}).encode()
+    started = time.monotonic()
+    try:
+        with urllib.request.urlopen(url + '/generate/stream', data=data, timeout=slo) as response:
+            body = response.read().decode()
+    except OSError:
+        return False, time.monotonic() - started
+    elapsed = time.monotonic() - started
+    return 'event: done' in body and elapsed <= slo, elapsed
+
+
+def run_level(url, pid, n, args):
+    results = [None] * n
+    barrier = threading.Barrier(n)
+    long = [bool(args.long_every) and i % args.long_every == 0 for i in range(n)]
+
+    def client(i):
+        barrier.wait()
+        results[i] = stream_once(url, args.slo, args.long_chunks if long[i] else 1, args.chunk_chars)
+
+    sampler = RSSSampler(pid)
+    sampler.start()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    peak = sampler.stop()
+
+    times = sorted(seconds for served, seconds in results if served)
+    return {
+        'streams': n,
+        'served': len(times),
+        'long_streams': sum(long),
+        'long_served': sum(served for (served, _), is_long in zip(results, long) if is_long),
+        'p50': round(statistics.median(times), 3) if times else None,
+        'max': round(times[-1], 3) if times else None,
+        'peak_rss_mb': round(peak / 2 ** 20, 1),
+    }
+
+
+def bench_mode(mode, env, args):
+    proc, url = start_server(mode, env, args)
+    try:
+        idle = tree_rss(proc.pid)
+        levels = []
+        for n in args.levels:
+            level = run_level(url, proc.pid, n, args)
+            levels.append(level)
+            print(f"  {mode:<5} {n:>5} streams: {level['served']:>5} served "
+                  f"({level['long_served']}/{level['long_streams']} multi-chunk)  p50 {level['p50']}s  "
+                  f"max {level['max']}s  peak RSS {level['peak_rss_mb']} MB", flush=True)
+            if level['served'] < n:
+                break
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+    passing = [level for level in levels if level['served'] == level['streams']]
+    best = passing[-1] if passing else None
+    return {
+        'idle_rss_mb': round(idle / 2 ** 20, 1),
+        'levels': levels,
+        'capacity': best['streams'] if best else 0,
+        'capacity_per_gb': round(best['streams'] / (best['peak_rss_mb'] / 1024), 1) if best else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--levels', default='25,50,100,200,400',
+                        type=lambda s: [int(n) for n in s.split(',')], help='concurrent streams per step')
+    parser.add_argument('--slo', type=float, default=15.0, help='seconds a stream may take and still count')
+    parser.add_argument('--modes', default='sync,async', type=lambda s: s.split(','))
+    parser.add_argument('--sync-workers', type=int, default=4, help='gunicorn worker processes')
+    parser.add_argument('--sync-threads', type=int, default=8, help='gunicorn threads per worker')
+    parser.add_argument('--async-workers', type=int, default=1, help='uvicorn worker processes')
+    parser.add_argument('--llm-latency', type=float, default=1.0, help='fake Anthropic: seconds to first token')
+    parser.add_argument('--llm-token-delay', type=float, default=0.05, help='fake Anthropic: seconds per token')
+    parser.add_argument('--llm-tokens', type=int, default=100, help='fake Anthropic: words per response')
+    parser.add_argument('--long-every', type=int, default=4, help='every Nth stream is multi-chunk (0: none)')
+    parser.add_argument('--long-chunks', type=int, default=4, help='chunks in a multi-chunk stream')
+    parser.add_argument('--chunk-chars', type=int, default=2000, help='SUMMARY_CHUNK_CHARS for the servers')
+    parser.add_argument('--out', help='JSON output path (default benchmarks/results/<time>-async.json)')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='bench-async-')
+    fake = FakeAnthropic(latency=args.llm_latency, token_delay=args.llm_token_delay, tokens=args.llm_tokens).start()
+    env = dict(os.environ, SQLITE_PATH=os.path.join(tmp, 'bench.db'), ANTHROPIC_BASE_URL=fake.base_url,
+               ANTHROPIC_API_KEY='fake-key', LOG_LEVEL='WARNING', LLM_SLOTS_DIR=tmp,
+               LLM_MAX_CONCURRENCY='10000', LLM_ASYNC_MAX_CONCURRENCY='10000', LLM_TIMEOUT=str(args.slo * 2),
+               SUMMARY_CHUNK_CHARS=str(args.chunk_chars))
+    env.pop('DATABASE_URL', None)
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'], cwd=ROOT, env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+
+    print(f"fake Anthropic: {args.llm_latency}s to first token, {args.llm_tokens} tokens x {args.llm_token_delay}s; "
+          f"SLO {args.slo}s")
+    report = {'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'config': vars(args), 'modes': {}}
+    try:
+        for mode in args.modes:
+            report['modes'][mode] = bench_mode(mode, env, args)
+    finally:
+        fake.stop()
+
+    print(f"\n{'mode':<6} {'capacity':>9} {'idle MB':>8} {'streams/GB':>11}")
+    for mode, result in report['modes'].items():
+        print(f"{mode:<6} {result['capacity']:>9} {result['idle_rss_mb']:>8} {result['capacity_per_gb']:>11}")
+
+    out = args.out or os.path.join(ROOT, 'benchmarks', 'results', time.strftime('%Y%m%d-%H%M%S') + '-async.json')
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nwrote {out}')
+
+
+if __name__ == '__main__':
+    main()
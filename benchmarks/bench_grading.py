@@ -0,0 +1,50 @@
+"""Micro-benchmark for batch quiz grading.
+
+Usage:
+    python benchmarks/bench_grading.py [repeats]
+
+Prints answers/second for 10, 100 and 1000-answer submissions, comparing the
+stored-token path with tokenizing definitions on every request.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from grading import definition_tokens, grade_batch  # noqa: E402
+
+WORDS = ('virtual cloud network subnet gateway route table security list compartment tenancy region '
+         'availability domain object storage bucket block volume instance shape autonomous database').split()
+
+
+def make_submission(size, rng):
+    rows = []
+    for _ in range(size):
+        definition = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(4, 12)))
+        answer = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 8)))
+        rows.append((answer, definition_tokens(definition), definition))
+    return rows
+
+
+def bench(rows, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        grade_batch(rows)
+    return len(rows) * repeats / (time.perf_counter() - start)
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rng = random.Random(42)
+    print(f"{'answers':>8}  {'stored tokens':>16}  {'tokenize each time':>20}")
+    for size in (10, 100, 1000):
+        rows = make_submission(size, rng)
+        stored = bench(rows, max(repeats * 10 // size, 1))
+        unstored = bench([(a, None, d) for a, _, d in rows], max(repeats * 10 // size, 1))
+        print(f"{size:>8}  {stored:>12,.0f}/s  {unstored:>16,.0f}/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Worker startup benchmark.
+
+Usage:
+    python benchmarks/bench_startup.py [runs]
+
+Each run imports the app in a fresh interpreter (as a gunicorn worker does)
+and times the import, ``create_app()`` and the first request. Runs use a
+throwaway SQLite file. In the default row the schema is set up beforehand
+(``flask init-db``, untimed), as a deploy does; the ``DB_INIT_ON_START=1`` row
+does it during import instead. The last row is the Anthropic SDK import that
+is deferred to the first AI request.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, sys, time
+sys.path.insert(0, 'src')
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+app.create_app()
+t2 = time.perf_counter()
+status = app.app.test_client().get('/notes').status_code
+t3 = time.perf_counter()
+print(json.dumps({'import': t1 - t0, 'create_app': t2 - t1, 'first_request': t3 - t2, 'status': status,
+                  'anthropic_loaded': 'anthropic' in sys.modules}))
+"""
+
+SDK_PROBE = """
+import json, time
+t0 = time.perf_counter()
+import anthropic
+anthropic.Anthropic(api_key='x')
+print(json.dumps({'import': time.perf_counter() - t0}))
+"""
+
+
+def run(code, env):
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def measure(runs, code, init_first=False, **extra_env):
+    samples = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, SQLITE_PATH=os.path.join(tmp, 'bench.db'), FLASK_ENV='development', **extra_env)
+            env.pop('DATABASE_URL', None)
+            if init_first:
+                subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'], cwd=ROOT, env=env,
+                               capture_output=True, check=True)
+            samples.append(run(code, env))
+    return samples
+
+
+def summarize(label, samples, keys):
+    cells = []
+    for key in keys:
+        values = [s[key] * 1000 for s in samples]
+        cells.append(f"{statistics.median(values):>15.1f}")
+    print(f"{label:<24}" + ''.join(cells))
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    keys = ('import', 'create_app', 'first_request')
+    print(f"median ms over {runs} runs")
+    print(f"{'':<24}" + ''.join(f"{k:>15}" for k in keys))
+    samples = measure(runs, PROBE, init_first=True)
+    summarize('default', samples, keys)
+    summarize('DB_INIT_ON_START=1', measure(runs, PROBE, DB_INIT_ON_START='1'), keys)
+    print(f"anthropic loaded at boot: {any(s['anthropic_loaded'] for s in samples)}")
+    sdk = [s['import'] * 1000 for s in measure(runs, SDK_PROBE)]
+    print(f"{'anthropic SDK (deferred)':<24}{statistics.median(sdk):>15.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""SQLite write throughput: a commit per write vs group commit.
+
+Usage:
+    python benchmarks/bench_writes.py [--processes 4] [--threads 16] [--duration 10]
+                                      [--modes direct,group] [--out results.json]
+
+Each mode starts ``--processes`` processes (standing in for gunicorn
+workers) with ``--threads`` posters each, all inserting notes into one
+throwaway SQLite file for ``--duration`` seconds. ``direct`` is the old write
+path: a pooled connection per thread, one INSERT and one commit per note,
+SQLite's busy_timeout as the only arbitration. ``group`` posts through
+``write_queue`` (src/write_queue.py). Reported per mode: committed writes per
+second, p50/p99/max latency, and failed writes (``database is locked``).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def poster_process(path, mode, threads, duration, start_at, results):
+    os.environ['SQLITE_PATH'] = path
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    sys.path.insert(0, os.path.join(ROOT, 'src'))
+    import logging
+    logging.getLogger('studybuddy.sql').setLevel(logging.ERROR)
+    from database import get_db_connection
+    from write_queue import WriteQueue
+
+    queue = WriteQueue(enabled=True)
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def direct(content):
+        conn = get_db_connection()
+        try:
+            conn.cursor().execute('INSERT INTO notes (topic_id, content) VALUES (?, ?)', (1, content))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def group(content):
+        queue.execute('INSERT INTO notes (topic_id, content) VALUES (?, ?)', (1, content))
+
+    write = direct if mode == 'direct' else group
+
+    def poster(n):
+        mine, failed, i = [], [], 0
+        time.sleep(max(0.0, start_at - time.time()))
+        stop = start_at + duration
+        while time.time() < stop:
+            started = time.perf_counter()
+            try:
+                write(f'bench note {os.getpid()}-{n}-{i}')
+                mine.append(time.perf_counter() - started)
+            except Exception as e:
+                failed.append(type(e).__name__ + ': ' + str(e))
+            i += 1
+        with lock:
+            latencies.extend(mine)
+            errors.extend(failed)
+
+    workers = [threading.Thread(target=poster, args=(n,)) for n in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    queue.close()
+    results.put({'latencies': latencies, 'errors': errors, 'stats': queue.stats() if mode == 'group' else None})
+
+
+def bench_mode(mode, args):
+    tmp = tempfile.mkdtemp(prefix='bench-writes-')
+    path = os.path.join(tmp, 'bench.db')
+    sys.path.insert(0, os.path.join(ROOT, 'src'))
+    import sqlite3
+    from migrations import migrate
+
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.execute("INSERT INTO topics (name, description) VALUES ('General', 'Default study topic')")
+    conn.commit()
+    conn.close()
+
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    start_at = time.time() + 2.0  # let every process import before the clock starts
+    procs = [ctx.Process(target=poster_process, args=(path, mode, args.threads, args.duration, start_at, results))
+             for _ in range(args.processes)]
+    for p in procs:
+        p.start()
+    outputs = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    latencies = sorted(x for out in outputs for x in out['latencies'])
+    errors = [e for out in outputs for e in out['errors']]
+    conn = sqlite3.connect(path)
+    rows = conn.execute('SELECT COUNT(*) FROM notes').fetchone()[0]
+    conn.close()
+
+    def pct(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2) if latencies else None
+
+    stats = [out['stats'] for out in outputs if out['stats']]
+    return {
+        'writes': len(latencies),
+        'rows': rows,
+        'writes_per_second': round(len(latencies) / args.duration, 1),
+        'p50_ms': pct(0.50),
+        'p99_ms': pct(0.99),
+        'max_ms': round(latencies[-1] * 1000, 2) if latencies else None,
+        'failed': len(errors),
+        'sample_errors': sorted(set(errors))[:3],
+        'mean_batch_size': round(sum(s['writes'] for s in stats) / max(1, sum(s['batches'] for s in stats)), 2)
+        if stats else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=16, help='posters per process')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--modes', default='direct,group', type=lambda s: s.split(','))
+    parser.add_argument('--out', help='JSON output path (default benchmarks/results/<time>-writes.json)')
+    args = parser.parse_args()
+
+    report = {'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'config': vars(args), 'modes': {}}
+    print(f'{args.processes} processes x {args.threads} posters, {args.duration:g}s per mode')
+    print(f"{'mode':<8} {'writes/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'failed':>7} {'batch':>6}")
+    for mode in args.modes:
+        r = report['modes'][mode] = bench_mode(mode, args)
+        print(f"{mode:<8} {r['writes_per_second']:>9} {r['p50_ms']:>8} {r['p99_ms']:>8} {r['max_ms']:>8} "
+              f"{r['failed']:>7} {r['mean_batch_size'] or '-':>6}")
+        for error in r['sample_errors']:
+            print(f'         {error}')
+
+    out = args.out or os.path.join(ROOT, 'benchmarks', 'results', time.strftime('%Y%m%d-%H%M%S') + '-writes.json')
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nwrote {out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""Local stand-in for the Anthropic Messages API.
+
+Serves ``POST /v1/messages`` in the shape the official SDK expects, both as a
+single JSON response and as a Server-Sent Events stream, with configurable
+latency, output length and error rate. Point the app at it with
+``ANTHROPIC_BASE_URL`` (any ``ANTHROPIC_API_KEY`` value is accepted).
+
+Usage:
+    python benchmarks/fake_anthropic.py [--port 8089] [--latency 0.5] [--token-delay 0.01]
+                                        [--tokens 120] [--error-rate 0]
+
+Prompts that ask for flashcards get ``Term: Definition`` lines back, so the
+flashcard parser has something to insert; everything else gets prose.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ('virtual cloud network subnet gateway route table security list compartment tenancy region '
+         'availability domain object storage bucket block volume instance shape autonomous database').split()
+
+
+class FakeAnthropic:
+    """A fake Messages API server running on a background thread"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.5, token_delay=0.01, tokens=120, error_rate=0.0,
+                 seed=None):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.tokens = tokens
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-anthropic', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reply_text(self, prompt):
+        with self._lock:
+            words = [self.rng.choice(WORDS) for _ in range(self.tokens)]
+        if 'flashcards' in prompt.lower():
+            per_card = max(len(words) // 5, 2)
+            return '\n'.join(f"Term {i + 1} {words[i * per_card]}: {' '.join(words[i * per_card + 1:(i + 1) * per_card])}"
+                             for i in range(5))
+        return ' '.join(words).capitalize() + '.'
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+                with fake._lock:
+                    fake.requests += 1
+                    fail = fake.rng.random() < fake.error_rate
+                time.sleep(fake.latency)
+                if self.path.split('?')[0] != '/v1/messages':
+                    return self._json(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': 'Not found'}})
+                if fail:
+                    return self._json(529, {'type': 'error', 'error': {'type': 'overloaded_error', 'message': 'Overloaded'}})
+                prompt = ' '.join(m.get('content', '') if isinstance(m.get('content'), str) else ''
+                                  for m in body.get('messages', []))
+                text = fake.reply_text(prompt)
+                input_tokens = len(prompt.split())
+                if body.get('stream'):
+                    return self._stream(body, text, input_tokens)
+                return self._json(200, self._message(body, text, input_tokens))
+
+            def _message(self, body, text, input_tokens):
+                return {
+                    'id': f'msg_{uuid.uuid4().hex[:24]}',
+                    'type': 'message',
+                    'role': 'assistant',
+                    'model': body.get('model', 'fake'),
+                    'content': [{'type': 'text', 'text': text}],
+                    'stop_reason': 'end_turn',
+                    'stop_sequence': None,
+                    'usage': {'input_tokens': input_tokens, 'output_tokens': len(text.split())},
+                }
+
+            def _json(self, status, payload):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _event(self, name, payload):
+                data = f'event: {name}\ndata: {json.dumps(payload)}\n\n'.encode('utf-8')
+                self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+                self.wfile.flush()
+
+            def _stream(self, body, text, input_tokens):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                message = self._message(body, '', input_tokens)
+                message.update(content=[], stop_reason=None, usage={'input_tokens': input_tokens, 'output_tokens': 1})
+                self._event('message_start', {'type': 'message_start', 'message': message})
+                self._event('content_block_start', {'type': 'content_block_start', 'index': 0,
+                                                    'content_block': {'type': 'text', 'text': ''}})
+                for i, word in enumerate(text.split(' ')):
+                    if fake.token_delay:
+                        time.sleep(fake.token_delay)
+                    self._event('content_block_delta', {'type': 'content_block_delta', 'index': 0,
+                                                        'delta': {'type': 'text_delta', 'text': word if i == 0 else ' ' + word}})
+                self._event('content_block_stop', {'type': 'content_block_stop', 'index': 0})
+                self._event('message_delta', {'type': 'message_delta',
+                                              'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+                                              'usage': {'output_tokens': len(text.split())}})
+                self._event('message_stop', {'type': 'message_stop'})
+                self.wfile.write(b'0\r\n\r\n')
+                self.wfile.flush()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.5, help='seconds before the response / first token')
+    parser.add_argument('--token-delay', type=float, default=0.01, help='seconds between streamed tokens')
+    parser.add_argument('--tokens', type=int, default=120, help='words per response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered 529')
+    args = parser.parse_args()
+    fake = FakeAnthropic(args.host, args.port, args.latency, args.token_delay, args.tokens, args.error_rate)
+    print(f"Fake Anthropic API on {fake.base_url} (set ANTHROPIC_BASE_URL={fake.base_url})")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
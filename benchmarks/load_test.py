@@ -0,0 +1,372 @@
+"""Load test: scripted traffic mixes against the app.
+
+Usage:
+    python benchmarks/load_test.py [--mix browse|quiz|ai|mixed|topics=1,notes=3,...] [--concurrency 8]
+                                   [--duration 30 | --requests N] [--db data/bench.db] [--url http://host:port]
+                                   [--llm-latency 0.5] [--out results.json] [--compare baseline.json]
+
+Seed the database first (benchmarks/seed.py). By default the app runs in
+this process against ``--db``, with a fake Anthropic server
+(benchmarks/fake_anthropic.py) started on a random port, and each client
+thread drives its own Flask test client; this measures the app without a
+WSGI server in front. With ``--url`` the requests go over HTTP to a running
+server instead, which must be pointed at a fake (or real) Anthropic API by
+its own ``ANTHROPIC_BASE_URL``.
+
+Operations:
+    topics           GET /topics/
+    notes            GET /<topic>/notes
+    flashcards       GET /<topic>/flashcards
+    quiz             GET /<topic>/quiz, then POST answers (reported as quiz_draw and quiz_grade)
+    generate_job     POST /<topic>/flashcards with raw_text, then poll the job until it finishes
+                     (reported as generate_submit and generate_job, the latter end to end)
+    generate_stream  POST /generate/stream and read the whole event stream
+
+Per operation it reports p50/p95/p99 latency, requests/second and SQL
+queries per request (from the ``Server-Timing`` header), and writes the run
+with its settings to JSON; ``--compare`` prints the change against an
+earlier run's file.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_anthropic import WORDS, FakeAnthropic  # noqa: E402
+
+MIXES = {
+    'browse': {'topics': 2, 'notes': 4, 'flashcards': 4},
+    'quiz': {'quiz': 1},
+    'ai': {'generate_job': 1, 'generate_stream': 1},
+    'mixed': {'topics': 2, 'notes': 4, 'flashcards': 3, 'quiz': 2, 'generate_job': 1, 'generate_stream': 1},
+}
+JOB_POLL_INTERVAL = 0.05
+JOB_TIMEOUT = 120.0
+QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+TOPIC_RE = re.compile(r'/(\d+)/quiz"')
+CARD_FIELD_RE = re.compile(r'name="(\d+)"')
+SESSION_RE = re.compile(r'name="session_id" value="([^"]*)"')
+
+
+class InProcessClient:
+    """One Flask test client per thread"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        body = response.get_data()
+        return response.status_code, response.headers, body
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode('utf-8') if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=JOB_TIMEOUT) as response:
+                return response.status, response.headers, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read()
+
+
+def queries(headers):
+    match = QUERIES_RE.search(headers.get('Server-Timing', '') or '')
+    return int(match.group(1)) if match else None
+
+
+def raw_text(rng):
+    # A unique marker keeps each prompt out of the AI response cache
+    return f"{uuid.uuid4().hex} " + ' '.join(rng.choice(WORDS) for _ in range(rng.randint(80, 200)))
+
+
+class Worker:
+    """Runs operations from the mix and appends ``(op, started, seconds, ok, queries)`` samples"""
+
+    def __init__(self, client, topic_ids, mix, samples, rng):
+        self.client = client
+        self.topic_ids = topic_ids
+        self.ops = list(mix)
+        self.weights = [mix[op] for op in self.ops]
+        self.samples = samples
+        self.rng = rng
+
+    def timed(self, op, method, path, data=None, ok=(200,)):
+        started = time.perf_counter()
+        try:
+            status, headers, body = self.client.request(method, path, data)
+        except Exception:
+            self.samples.append((op, started, time.perf_counter() - started, False, None))
+            return None, None, b''
+        self.samples.append((op, started, time.perf_counter() - started, status in ok, queries(headers)))
+        return status, headers, body
+
+    def run_one(self):
+        op = self.rng.choices(self.ops, self.weights)[0]
+        getattr(self, 'op_' + op)(self.rng.choice(self.topic_ids))
+
+    def op_topics(self, topic_id):
+        self.timed('topics', 'GET', '/topics/')
+
+    def op_notes(self, topic_id):
+        self.timed('notes', 'GET', f'/{topic_id}/notes')
+
+    def op_flashcards(self, topic_id):
+        self.timed('flashcards', 'GET', f'/{topic_id}/flashcards')
+
+    def op_quiz(self, topic_id):
+        status, _, body = self.timed('quiz_draw', 'GET', f'/{topic_id}/quiz', ok=(200, 302))
+        if status != 200:
+            return
+        html = body.decode('utf-8', 'replace')
+        session = SESSION_RE.search(html)
+        form = {card_id: ' '.join(self.rng.choice(WORDS) for _ in range(4)) for card_id in CARD_FIELD_RE.findall(html)}
+        form['session_id'] = session.group(1) if session else ''
+        self.timed('quiz_grade', 'POST', f'/{topic_id}/quiz', form)
+
+    def op_generate_job(self, topic_id):
+        started = time.perf_counter()
+        status, _, body = self.timed('generate_submit', 'POST', f'/{topic_id}/flashcards',
+                                     {'raw_text': raw_text(self.rng)}, ok=(202,))
+        ok = False
+        if status == 202:
+            status_url = json.loads(body)['status_url']
+            while time.perf_counter() - started < JOB_TIMEOUT:
+                status, _, body = self.client.request('GET', status_url)
+                job = json.loads(body) if status == 200 else {}
+                if job.get('status') in ('done', 'failed'):
+                    ok = job['status'] == 'done'
+                    break
+                time.sleep(JOB_POLL_INTERVAL)
+        self.samples.append(('generate_job', started, time.perf_counter() - started, ok, None))
+
+    def op_generate_stream(self, topic_id):
+        status, _, body = self.timed('generate_stream', 'POST', '/generate/stream', {'raw_text': raw_text(self.rng)})
+        if status == 200 and b'event: done' not in body:
+            # The response was 200 but the stream ended with an error event
+            op, started, seconds, _, count = self.samples[-1]
+            self.samples[-1] = (op, started, seconds, False, count)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct / 100.0 * len(sorted_values)), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(samples, seconds):
+    def stats(group):
+        latencies = sorted(s[2] for s in group)
+        counted = [s[4] for s in group if s[4] is not None]
+        return {
+            'count': len(group),
+            'errors': sum(1 for s in group if not s[3]),
+            'requests_per_second': round(len(group) / seconds, 2) if seconds else None,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+            'max_ms': round(latencies[-1] * 1000, 2) if latencies else None,
+            'queries_per_request': round(sum(counted) / len(counted), 2) if counted else None,
+        }
+
+    by_op = {}
+    for sample in samples:
+        by_op.setdefault(sample[0], []).append(sample)
+    # generate_job wraps generate_submit plus polls, so it isn't counted twice in the total
+    requests = [s for s in samples if s[0] != 'generate_job']
+    return {'overall': stats(requests), 'operations': {op: stats(group) for op, group in sorted(by_op.items())}}
+
+
+def parse_mix(value):
+    if value in MIXES:
+        return dict(MIXES[value])
+    mix = {}
+    for part in value.split(','):
+        op, _, weight = part.partition('=')
+        if not hasattr(Worker, 'op_' + op.strip()):
+            raise argparse.ArgumentTypeError(f'unknown operation: {op}')
+        mix[op.strip()] = float(weight or 1)
+    return mix
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def discover_topics(client):
+    status, _, body = client.request('GET', '/topics/?per_page=100')
+    ids = sorted({int(i) for i in TOPIC_RE.findall(body.decode('utf-8', 'replace'))}) if status == 200 else []
+    if not ids:
+        raise SystemExit('No topics found; seed the database first (benchmarks/seed.py)')
+    return ids
+
+
+def run(make_client, mix, concurrency, duration=None, requests=None, warmup=0.0, seed=42):
+    """Drive ``concurrency`` threads through the mix; returns ``(samples, measured_seconds)``"""
+    topic_ids = discover_topics(make_client())
+    samples = []
+    lock = threading.Lock()
+    issued = [0]
+    started = time.perf_counter()
+    measure_from = started + warmup
+    deadline = measure_from + duration if duration else None
+
+    def loop(index):
+        worker = Worker(make_client(), topic_ids, mix, [], random.Random(seed + index))
+        while True:
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            if requests is not None:
+                with lock:
+                    if issued[0] >= requests:
+                        break
+                    issued[0] += 1
+            worker.run_one()
+        with lock:
+            samples.extend(s for s in worker.samples if s[1] >= measure_from)
+
+    threads = [threading.Thread(target=loop, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - measure_from
+
+
+def print_report(report):
+    print(f"{'operation':<16} {'count':>7} {'err':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'q/req':>6}")
+    rows = list(report['operations'].items()) + [('TOTAL', report['overall'])]
+    for op, s in rows:
+        fmt = lambda v, spec: format(v, spec) if v is not None else '-'  # noqa: E731
+        print(f"{op:<16} {s['count']:>7} {s['errors']:>5} {fmt(s['requests_per_second'], '>8.1f')} "
+              f"{fmt(s['p50_ms'], '>9.1f')} {fmt(s['p95_ms'], '>9.1f')} {fmt(s['p99_ms'], '>9.1f')} "
+              f"{fmt(s['queries_per_request'], '>6.1f')}")
+
+
+def print_comparison(report, baseline):
+    print(f"\nvs {baseline['config'].get('label') or baseline['started_at']}:")
+    print(f"{'operation':<16} {'req/s':>16} {'p95 ms':>18} {'q/req':>14}")
+    ops = dict(report['operations'], TOTAL=report['overall'])
+    old_ops = dict(baseline['operations'], TOTAL=baseline['overall'])
+    for op, s in ops.items():
+        old = old_ops.get(op)
+        if not old:
+            continue
+
+        def delta(key):
+            if s[key] is None or old[key] is None:
+                return '-'
+            change = f' ({(s[key] - old[key]) / old[key] * 100:+.0f}%)' if old[key] else ''
+            return f'{old[key]:.1f}->{s[key]:.1f}{change}'
+        print(f"{op:<16} {delta('requests_per_second'):>16} {delta('p95_ms'):>18} {delta('queries_per_request'):>14}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--mix', default='mixed', type=parse_mix,
+                        help=f"one of {', '.join(MIXES)} or weights like topics=1,notes=3")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds to measure (after warmup)')
+    parser.add_argument('--requests', type=int, help='stop after this many operations instead of a duration')
+    parser.add_argument('--warmup', type=float, default=2.0, help='seconds of traffic to discard first')
+    parser.add_argument('--db', default=os.path.join(ROOT, 'data', 'bench.db'), help='SQLite file (in-process mode)')
+    parser.add_argument('--url', help='drive a running server over HTTP instead of an in-process app')
+    parser.add_argument('--llm-latency', type=float, default=0.5, help='fake Anthropic: seconds to first token')
+    parser.add_argument('--llm-token-delay', type=float, default=0.01, help='fake Anthropic: seconds per token')
+    parser.add_argument('--llm-tokens', type=int, default=120, help='fake Anthropic: words per response')
+    parser.add_argument('--llm-error-rate', type=float, default=0.0, help='fake Anthropic: fraction answered 529')
+    parser.add_argument('--label', help='name for this run in the JSON and comparisons')
+    parser.add_argument('--out', help='JSON output path (default benchmarks/results/<time>-<label>.json)')
+    parser.add_argument('--compare', help='earlier JSON result to compare against')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    if args.requests:
+        args.duration, args.warmup = None, 0.0
+
+    fake = None
+    if args.url:
+        make_client = lambda: HttpClient(args.url)  # noqa: E731
+        backend = 'http'
+    else:
+        fake = FakeAnthropic(latency=args.llm_latency, token_delay=args.llm_token_delay, tokens=args.llm_tokens,
+                             error_rate=args.llm_error_rate, seed=args.seed).start()
+        # The app reads these at import time
+        os.environ['SQLITE_PATH'] = os.path.abspath(args.db)
+        os.environ['ANTHROPIC_BASE_URL'] = fake.base_url
+        os.environ.setdefault('ANTHROPIC_API_KEY', 'fake-key')
+        os.environ.setdefault('LOG_LEVEL', 'WARNING')
+        if not os.path.exists(args.db) and not os.getenv('DATABASE_URL'):
+            raise SystemExit(f'{args.db} does not exist; seed it first (benchmarks/seed.py --db {args.db})')
+        import app as app_module
+        app_module.create_app()
+        make_client = lambda: InProcessClient(app_module.app)  # noqa: E731
+        backend = 'postgres' if os.getenv('DATABASE_URL') else 'sqlite'
+
+    label = args.label or '-'.join(f'{op}{w:g}' for op, w in args.mix.items())
+    started_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+    try:
+        samples, seconds = run(make_client, args.mix, args.concurrency, args.duration, args.requests,
+                               args.warmup, args.seed)
+        server_stats = {}
+        for path in ('/cache/stats', '/jobs/stats'):
+            status, _, body = make_client().request('GET', path)
+            if status == 200:
+                server_stats[path] = json.loads(body)
+    finally:
+        if fake:
+            fake.stop()
+
+    report = {
+        'started_at': started_at,
+        'seconds': round(seconds, 3),
+        'config': {
+            'label': label, 'mix': args.mix, 'concurrency': args.concurrency, 'duration': args.duration,
+            'requests': args.requests, 'warmup': args.warmup, 'target': args.url or 'in-process',
+            'backend': backend, 'db': None if args.url else os.path.abspath(args.db),
+            'llm': None if args.url else {'latency': args.llm_latency, 'token_delay': args.llm_token_delay,
+                                          'tokens': args.llm_tokens, 'error_rate': args.llm_error_rate},
+            'git_revision': git_revision(), 'python': platform.python_version(), 'cpus': os.cpu_count(),
+        },
+        **summarize(samples, seconds),
+        'server': server_stats,
+    }
+    print_report(report)
+    out = args.out or os.path.join(ROOT, 'benchmarks', 'results',
+                                   f"{started_at.replace(':', '')}-{re.sub(r'[^A-Za-z0-9_.-]', '_', label)}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nSaved {out}')
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
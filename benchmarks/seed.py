@@ -0,0 +1,102 @@
+"""Seed a database with synthetic topics, notes and flashcards.
+
+Usage:
+    python benchmarks/seed.py [--rows 10000] [--topics 20] [--notes-fraction 0.3] [--db data/bench.db] [--reset]
+
+Writes to ``--db`` (SQLite) or, with ``DATABASE_URL`` set, to PostgreSQL.
+``--rows`` is the total number of notes plus flashcards (1k to 1M is the
+useful range); they are spread evenly over ``--topics`` topics, 'General'
+included, so both the legacy and the topic routes have data. Rows are
+written in batches through ``bulk.insert_flashcards`` (COPY on PostgreSQL)
+and ``executemany``, committing every ``--batch`` rows.
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+WORDS = ('virtual cloud network subnet gateway route table security list compartment tenancy region '
+         'availability domain object storage bucket block volume instance shape autonomous database').split()
+
+
+def sentence(rng, low, high):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def seed(conn, rows, topics, notes_fraction=0.3, batch=10000, seed=42, log=print):
+    """Insert the synthetic data set; returns ``{'topic_ids', 'notes', 'flashcards', 'seconds'}``"""
+    from bulk import insert_flashcards
+    from database import get_placeholder
+
+    p = get_placeholder()
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    c = conn.cursor()
+    names = ['General'] + [f'Bench topic {i:04d}' for i in range(1, topics)]
+    c.executemany(f'INSERT INTO topics (name, description) VALUES ({p}, {p}) ON CONFLICT (name) DO NOTHING',
+                  [(name, sentence(rng, 4, 10)) for name in names])
+    c.execute(f"SELECT id FROM topics WHERE name IN ({', '.join([p] * len(names))}) ORDER BY id", names)
+    topic_ids = [row[0] for row in c.fetchall()]
+    conn.commit()
+
+    n_notes = int(rows * notes_fraction)
+    n_cards = rows - n_notes
+    for kind, total in (('notes', n_notes), ('flashcards', n_cards)):
+        done = 0
+        for i, topic_id in enumerate(topic_ids):
+            share = total // len(topic_ids) + (1 if i < total % len(topic_ids) else 0)
+            while share:
+                size = min(batch, share)
+                if kind == 'notes':
+                    c.executemany(f'INSERT INTO notes (topic_id, content) VALUES ({p}, {p})',
+                                  [(topic_id, sentence(rng, 30, 120)) for _ in range(size)])
+                else:
+                    insert_flashcards(c, topic_id, [(f'{sentence(rng, 1, 3)} {done + j}', sentence(rng, 4, 12))
+                                                    for j in range(size)])
+                conn.commit()
+                share -= size
+                done += size
+        log(f'  {kind}: {done:,}')
+    return {'topic_ids': topic_ids, 'notes': n_notes, 'flashcards': n_cards,
+            'seconds': time.perf_counter() - started}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, default=10000, help='notes + flashcards to insert')
+    parser.add_argument('--topics', type=int, default=20)
+    parser.add_argument('--notes-fraction', type=float, default=0.3)
+    parser.add_argument('--batch', type=int, default=10000)
+    parser.add_argument('--db', default=os.path.join(ROOT, 'data', 'bench.db'), help='SQLite file')
+    parser.add_argument('--reset', action='store_true', help='delete the SQLite file first')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    # database.py reads its settings at import time
+    os.environ['SQLITE_PATH'] = os.path.abspath(args.db)
+    if args.reset and not os.getenv('DATABASE_URL'):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.db + suffix):
+                os.unlink(args.db + suffix)
+    from database import get_db_connection, init_database_locked
+
+    # Every batch is a "slow query"; don't log each one
+    logging.getLogger('studybuddy.sql').setLevel(logging.ERROR)
+
+    init_database_locked()
+    conn = get_db_connection()
+    try:
+        result = seed(conn, args.rows, args.topics, args.notes_fraction, args.batch, args.seed)
+    finally:
+        conn.close()
+    print(f"Seeded {len(result['topic_ids'])} topics, {result['notes']:,} notes and {result['flashcards']:,} "
+          f"flashcards in {result['seconds']:.1f}s ({args.rows / result['seconds']:,.0f} rows/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -125,6 +125,7 @@ User=$SERVER_USER
 Group=$SERVER_USER
 WorkingDirectory=$REMOTE_DIR
 Environment=PATH=$REMOTE_DIR/venv/bin
+ExecStartPre=$REMOTE_DIR/venv/bin/flask --app app init-db
 ExecStart=$REMOTE_DIR/venv/bin/gunicorn --bind 127.0.0.1:$APP_PORT --workers 2 --timeout 60 --keep-alive 5 --max-requests 1000 --preload app:app
 ExecReload=/bin/kill -s HUP \$MAINPID
 KillMode=mixed
@@ -0,0 +1,194 @@
+"""Content-addressed cache for Anthropic responses.
+
+Responses are stored in the app database (``ai_response_cache``) under a
+SHA-256 of (model, prompt template, raw text, max_tokens), so pasting the
+same material twice costs one API call. Entries expire after ``ttl`` seconds
+and the table is trimmed to ``max_entries`` by least-recent use.
+
+Identical requests that arrive while the first is still waiting on the API
+are coalesced within the process: they block on the first caller's result
+instead of making their own call.
+
+Lookups and stores use a connection of their own (``get_dedicated_connection``),
+never the request's, so a cache commit can't commit the request's pending
+writes with it. The exception is a SQLite request that already holds the
+write lock: a store then joins its transaction, since another connection
+would only wait for that lock.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from database import USE_POSTGRES, get_db_connection, get_dedicated_connection
+from write_queue import in_write_transaction
+
+AI_CACHE_TTL = int(os.getenv('AI_CACHE_TTL', str(7 * 24 * 3600)))
+AI_CACHE_MAX_ENTRIES = int(os.getenv('AI_CACHE_MAX_ENTRIES', '5000'))
+
+# Refresh last_used at most this often per entry, so hits rarely write
+TOUCH_INTERVAL = 60
+# Trim the table every N stores rather than on every write
+EVICT_EVERY = 50
+
+
+def cache_key(model, template, raw_text, max_tokens):
+    payload = json.dumps([model, template, raw_text, max_tokens], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class AIResponseCache:
+    def __init__(self, ttl=AI_CACHE_TTL, max_entries=AI_CACHE_MAX_ENTRIES, connect=get_dedicated_connection):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._connect = connect
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> Future
+        self._stores = 0
+        self._counters = {'hits': 0, 'misses': 0, 'coalesced': 0, 'errors': 0, 'evictions': 0}
+
+    def get_or_create(self, key, compute):
+        """Return the cached text for ``key``, calling ``compute()`` on a miss"""
+        text = self.get(key)
+        if text is not None:
+            return text
+
+        future, leader = self._claim(key)
+        if not leader:
+            return future.result()
+        try:
+            text = compute()
+        except BaseException as e:
+            self._fail(key, future, e)
+            raise
+        try:
+            self.put(key, text)
+        finally:
+            self._finish(key, future, text)
+        return text
+
+    async def aget_or_create(self, key, compute):
+        """Coroutine version of ``get_or_create``: awaits ``compute()`` on a miss.
+
+        Shares the in-flight table with the sync path, so a stream on the event
+        loop and a worker thread asking for the same prompt make one call.
+        """
+        text = await asyncio.to_thread(self.get, key)
+        if text is not None:
+            return text
+
+        future, leader = self._claim(key)
+        if not leader:
+            # Shielded: a follower that disconnects must not cancel the shared Future
+            return await asyncio.shield(asyncio.wrap_future(future))
+        try:
+            text = await compute()
+        except BaseException as e:
+            self._fail(key, future, e)
+            raise
+        try:
+            await asyncio.to_thread(self.put, key, text)
+        finally:
+            self._finish(key, future, text)
+        return text
+
+    def _claim(self, key):
+        """Return (future, leader): the in-flight Future for ``key``, and whether this caller must compute it"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self._counters['coalesced'] += 1
+                return future, False
+            future = self._inflight[key] = Future()
+            return future, True
+
+    def _fail(self, key, future, error):
+        with self._lock:
+            self._counters['errors'] += 1
+            del self._inflight[key]
+        if not isinstance(error, Exception):
+            # The leader was cancelled (client gone); waiters get an ordinary error, not its cancellation
+            error = RuntimeError('the request computing this response was cancelled')
+        future.set_exception(error)
+
+    def _finish(self, key, future, text):
+        with self._lock:
+            del self._inflight[key]
+        future.set_result(text)
+
+    def get(self, key):
+        now = time.time()
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute('SELECT response, created_at, last_used FROM ai_response_cache WHERE key = ?', (key,))
+        row = c.fetchone()
+        if row is None or now - row[1] > self.ttl:
+            conn.close()
+            with self._lock:
+                self._counters['misses'] += 1
+            return None
+        conn.close()
+        if now - row[2] > TOUCH_INTERVAL:
+            self._write(lambda c: c.execute('UPDATE ai_response_cache SET last_used = ?, hits = hits + 1'
+                                            ' WHERE key = ?', (now, key)))
+        with self._lock:
+            self._counters['hits'] += 1
+        return row[0]
+
+    def put(self, key, text):
+        now = time.time()
+        with self._lock:
+            self._stores += 1
+            evict = self._stores % EVICT_EVERY == 0
+
+        def store(c):
+            c.execute('DELETE FROM ai_response_cache WHERE key = ?', (key,))
+            c.execute('INSERT INTO ai_response_cache (key, response, created_at, last_used, hits)'
+                      ' VALUES (?, ?, ?, ?, 0)', (key, text, now, now))
+            if evict:
+                self._evict(c, now)
+        self._write(store)
+
+    def _write(self, fn):
+        """Run ``fn(cursor)`` and commit it apart from the request's transaction"""
+        if not USE_POSTGRES and in_write_transaction():
+            fn(get_db_connection().cursor())  # committed with the request's own writes
+            return
+        conn = self._connect()
+        try:
+            fn(conn.cursor())
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _evict(self, c, now):
+        c.execute('DELETE FROM ai_response_cache WHERE created_at < ?', (now - self.ttl,))
+        expired = c.rowcount
+        c.execute('SELECT last_used FROM ai_response_cache ORDER BY last_used DESC LIMIT 1 OFFSET ?', (self.max_entries,))
+        row = c.fetchone()
+        overflow = 0
+        if row is not None:
+            c.execute('DELETE FROM ai_response_cache WHERE last_used <= ?', (row[0],))
+            overflow = c.rowcount
+        with self._lock:
+            self._counters['evictions'] += max(expired, 0) + max(overflow, 0)
+
+    def clear(self):
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute('DELETE FROM ai_response_cache')
+        conn.commit()
+        conn.close()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters, inflight=len(self._inflight))
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+ai_cache = AIResponseCache()
@@ -1,8 +1,30 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify
+from flask import Flask, Response, render_template, request, redirect, url_for, jsonify, stream_with_context
+import io
+import math
 import os
+import threading
 from dotenv import load_dotenv
-from anthropic import Anthropic
-from database import get_db_connection, init_database, get_placeholder, USE_POSTGRES
+
+# Before the imports below: several modules read their settings from the environment at import
+load_dotenv()
+
+from database import (get_db_connection, init_database_locked, init_app, pool_headroom, pool_stats, get_placeholder,
+                      USE_POSTGRES)
+from pagination import InvalidCursor, decode_cursor, fetch_page, page_size
+from scheduler import due_cards
+from quiz_sessions import create_session, grade_cards, grade_session, load_session
+from ai_cache import ai_cache, cache_key
+from jobs import QueueFull, job_queue
+from bulk import IMPORT_BATCH_SIZE, IMPORT_FORMATS, MAX_IMPORT_BATCH_SIZE, InvalidUpload, import_flashcards, insert_flashcards
+from summarizer import SUMMARY_CONCURRENCY, summarize
+from summary_stream import stream_summary, summary_steps
+from search import MAX_SEARCH_PAGE_SIZE, SEARCH_KINDS, SEARCH_PAGE_SIZE, search
+from topic_cache import topic_cache
+from conditional import conditional_topic_get, content_version
+from fragment_cache import fragment_cache
+from llm_gateway import LLMGateway, LLMUnavailable, backend_from_env
+from write_queue import WriteQueueFull, WriteTimeout, write_queue
+import metrics
 import sqlite3  # Still needed for backwards compatibility
 
 # Helper function for database connections
@@ -22,13 +44,8 @@ static_dir = os.path.join(project_root, 'static')
 
 app = Flask(__name__, template_folder=template_dir, static_folder=static_dir)
 
-# Register topics blueprint
-try:
-    from topics_manager import bp as topics_bp
-    app.register_blueprint(topics_bp)
-except Exception:
-    # If import fails (during early init), continue; blueprint can be registered later
-    pass
+# Run schema setup in create_app() (off by default; deploys run `flask --app app init-db` once)
+DB_INIT_ON_START = os.getenv('DB_INIT_ON_START') == '1'
 
 # Configure app for subdirectory deployment
 class SubdirectoryMiddleware:
@@ -47,20 +64,225 @@ class SubdirectoryMiddleware:
             environ['SCRIPT_NAME'] = script_name
             return self.app(environ, start_response)
 
-# Only apply middleware in production
-if os.getenv('FLASK_ENV') != 'development':
-    app.wsgi_app = SubdirectoryMiddleware(app.wsgi_app)
 
-load_dotenv()
-api_key = os.getenv('ANTHROPIC_API_KEY')
-if api_key:
-    client = Anthropic(api_key=api_key)
-else:
-    client = None
-    print("Warning: ANTHROPIC_API_KEY not found in environment variables. AI features will be disabled.")
+def create_app(init_db=None):
+    """Wire the app up for serving and return it.
+
+    Routes are registered on the module-level ``app`` at import; this adds the
+    blueprint, per-request connections, the job queue and the middleware. It
+    does no database or network I/O unless ``init_db`` (default:
+    ``DB_INIT_ON_START``) asks for schema setup, which then runs behind a
+    cross-process lock. Safe to call more than once.
+    """
+    if init_db if init_db is not None else DB_INIT_ON_START:
+        init_database_locked()
+    if 'studybuddy' in app.extensions:
+        return app
+    app.extensions['studybuddy'] = True
+
+    # One pooled connection per request, released on teardown
+    init_app(app)
+    job_queue.init_app(app)
+    # Each worker process starts its job threads, and resumes what a previous one left, on its first request
+    app.before_request(job_queue.start)
+    metrics.configure_logging()
+    metrics.init_app(app)
+    metrics.register_gauges('studybuddy_db_pool', 'Connection pool counter', pool_stats)
+    metrics.register_gauges('studybuddy_jobs', 'AI job queue statistic', job_queue.stats)
+    metrics.register_gauges('studybuddy_topic_cache', 'Topic cache statistic', topic_cache.stats)
+    metrics.register_gauges('studybuddy_fragment_cache', 'Fragment cache statistic', fragment_cache.stats)
+    metrics.register_gauges('studybuddy_ai_cache', 'AI response cache statistic', ai_cache.stats)
+    metrics.register_gauges('studybuddy_llm_gateway', 'LLM gateway statistic', gateway.stats)
+    metrics.register_gauges('studybuddy_write_queue', 'SQLite group commit statistic', write_queue.stats)
+
+    from topics_manager import bp as topics_bp
+    app.register_blueprint(topics_bp)
+
+    # Only apply middleware in production
+    if os.getenv('FLASK_ENV') != 'development':
+        app.wsgi_app = SubdirectoryMiddleware(app.wsgi_app)
+
+    if not os.getenv('ANTHROPIC_API_KEY'):
+        print("Warning: ANTHROPIC_API_KEY not found in environment variables. AI features will be disabled.")
+    return app
+
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Apply pending migrations and seed the default topic"""
+    init_database_locked()
+
+
+# The Anthropic SDK is imported and its clients built on first use, not at import
+client = None
+async_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The shared Anthropic client, or None when ANTHROPIC_API_KEY is unset"""
+    global client
+    if client is None and os.getenv('ANTHROPIC_API_KEY'):
+        with _client_lock:
+            if client is None:
+                from anthropic import Anthropic
+                # Retries, timeouts and concurrency are the gateway's job
+                client = Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'), max_retries=0)
+    return client
+
+
+def get_async_client():
+    """The shared async Anthropic client for the ASGI entry point, or None when ANTHROPIC_API_KEY is unset"""
+    global async_client
+    if async_client is None and os.getenv('ANTHROPIC_API_KEY'):
+        with _client_lock:
+            if async_client is None:
+                from anthropic import AsyncAnthropic
+                async_client = AsyncAnthropic(api_key=os.getenv('ANTHROPIC_API_KEY'), max_retries=0)
+    return async_client
+
+
+# Every model call goes through the gateway (limits, deadlines, retries, circuit breaker)
+gateway = LLMGateway(backend_from_env(lambda: get_client(), lambda: get_async_client()))
+
+AI_MAX_TOKENS = 400
+SUMMARY_PROMPT = "Summarize this training content into clear, organized, well-structured study notes:\n\n{raw_text}"
+FLASHCARDS_PROMPT = ("Generate 5 concise flashcards based on the following study content. "
+                     "Format as 'Term: Definition' pairs, one per line:\n\n{raw_text}")
+
+
+def generate_text(template, raw_text, max_tokens=AI_MAX_TOKENS):
+    """Run a prompt through Claude, answering repeats from the response cache"""
+    def call():
+        return gateway.complete(template.format(raw_text=raw_text), max_tokens)
+    return ai_cache.get_or_create(cache_key(gateway.model, template, raw_text, max_tokens), call)
+
+
+def summary_concurrency():
+    """Chunks to summarize at once: ``SUMMARY_CONCURRENCY``, fewer while the connection pool is short.
+
+    Each chunk's cache lookup and store takes a pooled connection of its own
+    (see ai_cache), so a wide fan-out on a busy pool would queue on it.
+    """
+    headroom = pool_headroom()
+    return SUMMARY_CONCURRENCY if headroom is None else max(1, min(SUMMARY_CONCURRENCY, headroom))
+
+
+def parse_flashcards(text):
+    """Yield (term, definition) pairs from 'Term: Definition' lines"""
+    for line in text.split('\n'):
+        if ':' in line:
+            term, definition = line.split(':', 1)
+            term = term.strip()
+            definition = definition.strip()
+            if term and definition:
+                yield term, definition
+
+
+@job_queue.handler('summary')
+def summary_job(job):
+    summary = summarize(job['payload']['raw_text'], generate_text, SUMMARY_PROMPT, AI_MAX_TOKENS,
+                        max_workers=summary_concurrency())
+    job_queue.set_progress(job['id'], 'saving')
+    # On the job's connection, not write_queue: the insert commits with the job's status (see jobs.py)
+    c = get_db().cursor()
+    c.execute('INSERT INTO notes (topic_id, content) VALUES (?, ?)', (job['topic_id'], summary))
+    return {"summary": summary}
+
+
+@job_queue.handler('flashcards')
+def flashcards_job(job):
+    flashcards_text = generate_text(FLASHCARDS_PROMPT, job['payload']['raw_text'])
+    job_queue.set_progress(job['id'], 'saving')
+    # On the job's connection, like summary_job
+    count = insert_flashcards(get_db().cursor(), job['topic_id'], parse_flashcards(flashcards_text))
+    return {"flashcards": flashcards_text, "count": count}
+
+
+def enqueue_ai_job(kind, topic_id, raw_text):
+    """Queue an AI generation job and answer 202 with its status URL"""
+    try:
+        # Fail fast while the circuit is open rather than queueing work that will fail
+        gateway.check()
+    except LLMUnavailable as e:
+        return jsonify({"error": str(e)}), 503
+    try:
+        job_id = job_queue.submit(kind, topic_id, {"raw_text": raw_text})
+    except QueueFull:
+        return jsonify({"error": "Too many AI requests in progress. Please try again shortly."}), 503
+    status_url = url_for('job_status', job_id=job_id)
+    return jsonify({"job_id": job_id, "status": "queued", "status_url": status_url}), 202, {"Location": status_url}
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    del job['payload']
+    return jsonify(job)
+
+
+@app.route('/jobs/stats')
+def job_stats():
+    return jsonify(job_queue.stats())
+
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify({"topics": topic_cache.stats(), "fragments": fragment_cache.stats(),
+                    "ai_responses": ai_cache.stats()})
+
+
+# Columns shown in the listings (templates index rows positionally)
+NOTE_COLUMNS = 'id, content, created_at'
+FLASHCARD_COLUMNS = 'id, term, definition, created_at'
+
+
+@app.errorhandler(InvalidCursor)
+def invalid_cursor(e):
+    return jsonify({"error": str(e)}), 400
+
+
+@app.errorhandler(WriteQueueFull)
+@app.errorhandler(WriteTimeout)
+def write_backlogged(e):
+    """The write was not applied: the writer is backed up, so ask the client to retry"""
+    retry_after = max(1, math.ceil(write_queue.timeout))
+    return (jsonify({"error": "The database is busy. Please try again shortly."}), 503,
+            {"Retry-After": str(retry_after)})
+
+
+def render_listing(c, table, columns, topic, template, key):
+    """Render one keyset page of a topic's notes or flashcards as HTML or JSON (?format=json).
+
+    The HTML list block is a cached fragment keyed by the topic's content version,
+    so an unchanged page skips the page query as well as the render.
+    """
+    after = decode_cursor(request.args.get('cursor'))
+    limit = page_size(request.args.get('limit', type=int))
+    if request.args.get('format') == 'json':
+        rows, next_cursor = fetch_page(c, table, columns, topic[0], after=after, limit=limit)
+        names = [col.strip() for col in columns.split(',')]
+        return jsonify({
+            "topic": {"id": topic[0], "name": topic[1]},
+            key: [dict(zip(names, row)) for row in rows],
+            "next_cursor": next_cursor,
+        })
+
+    def render():
+        rows, next_cursor = fetch_page(c, table, columns, topic[0], after=after, limit=limit)
+        return render_template(f'partials/{key}_list.html', next_cursor=next_cursor,
+                               first_page=not request.args.get('cursor'), **{key: rows})
+
+    fragment_key = (key, request.endpoint, topic[0], content_version(get_db_connection(), topic[0]), after, limit)
+    return render_template(template, topic=topic, listing=fragment_cache.render(fragment_key, render))
+
+
+def insert_flashcard(topic_id, term, definition):
+    """Insert a card along with its pre-tokenized definition for grading"""
+    write_queue.write(lambda c: insert_flashcards(c, topic_id, [(term, definition)]))
 
-# Initialize database when app starts
-init_database()
 
 @app.route('/')
 def index():
@@ -71,125 +293,88 @@ def notes():
     conn = get_db()
     c = conn.cursor()
     
-    # Get default topic
-    c.execute('SELECT id FROM topics WHERE name = ?', ('General',))
-    topic = c.fetchone()
-    if not topic:
-        # Create default topic if it doesn't exist
-        c.execute('INSERT INTO topics (name, description) VALUES (?, ?)', 
-                  ('General', 'Default study topic'))
-        conn.commit()
-        topic_id = c.lastrowid
-    else:
-        topic_id = topic[0]
+    # Get default topic (created if missing)
+    topic = topic_cache.default_topic(conn)
+    topic_id = topic[0]
     
     if request.method == 'POST':
         content = request.form['content']
         if content.strip():
-            c.execute('INSERT INTO notes (topic_id, content) VALUES (?, ?)', (topic_id, content))
-            conn.commit()
+            write_queue.execute('INSERT INTO notes (topic_id, content) VALUES (?, ?)', (topic_id, content))
         return redirect(url_for('notes'))
     
-    c.execute('SELECT * FROM notes WHERE topic_id = ? ORDER BY id DESC', (topic_id,))
-    notes_list = c.fetchall()
-    # pass topic tuple to template for display
-    c.execute('SELECT id, name FROM topics WHERE id = ?', (topic_id,))
-    topic_tuple = c.fetchone()
+    response = render_listing(c, 'notes', NOTE_COLUMNS, topic, 'notes.html', 'notes')
     conn.close()
-    return render_template('notes.html', notes=notes_list, topic=topic_tuple)
+    return response
 
 @app.route('/delete-note/<int:note_id>', methods=['POST'])
 def delete_note(note_id):
     conn = get_db()
-    c = conn.cursor()
     # Get default topic id
-    c.execute('SELECT id FROM topics WHERE name = ?', ('General',))
-    topic = c.fetchone()
+    topic = topic_cache.by_name(conn, 'General')
     topic_id = topic[0] if topic else 1
     
-    c.execute('DELETE FROM notes WHERE id = ? AND topic_id = ?', (note_id, topic_id))
-    conn.commit()
+    write_queue.execute('DELETE FROM notes WHERE id = ? AND topic_id = ?', (note_id, topic_id))
     conn.close()
     return redirect(url_for('notes'))
 
 @app.route('/generate', methods=['POST'])
 def generate_summary():
-    if not client:
+    if not gateway.enabled():
         return jsonify({"error": "AI features are disabled. Please set ANTHROPIC_API_KEY in your .env file."}), 400
     
     try:
         # Get default topic
         conn = get_db()
-        c = conn.cursor()
-        c.execute('SELECT id FROM topics WHERE name = ?', ('General',))
-        topic = c.fetchone()
+        topic = topic_cache.by_name(conn, 'General')
         topic_id = topic[0] if topic else 1
         conn.close()
         
-        raw_text = request.form['raw_text']
-        prompt = f"Summarize this training content into clear, organized, well-structured study notes:\n\n{raw_text}"
-        response = client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=400,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        summary = response.content[0].text.strip()
-
-        conn = get_db()
-        c = conn.cursor()
-        c.execute('INSERT INTO notes (topic_id, content) VALUES (?, ?)', (topic_id, summary))
-        conn.commit()
-        conn.close()
-
-        return jsonify({"summary": summary})
+        return enqueue_ai_job('summary', topic_id, request.form['raw_text'])
     except Exception as e:
         return jsonify({"error": f"Error generating summary: {str(e)}"}), 500
 
+@app.route('/generate/stream', methods=['POST'])
+def generate_summary_stream():
+    """Stream a summary to the browser as it is generated, then save it as a note"""
+    if not gateway.enabled():
+        return jsonify({"error": "AI features are disabled. Please set ANTHROPIC_API_KEY in your .env file."}), 400
+    raw_text = request.form.get('raw_text', '')
+    if not raw_text.strip():
+        return jsonify({"error": "raw_text is required"}), 400
+    try:
+        gateway.check()
+    except LLMUnavailable as e:
+        return jsonify({"error": str(e)}), 503
+
+    topic = topic_cache.by_name(get_db(), 'General')
+    topic_id = topic[0] if topic else 1
+
+    def save(summary):
+        write_queue.execute('INSERT INTO notes (topic_id, content) VALUES (?, ?)', (topic_id, summary))
+
+    steps = summary_steps(raw_text, gateway.model, SUMMARY_PROMPT, AI_MAX_TOKENS)
+    events = stream_summary(steps, gateway, generate_text, summary_concurrency, save)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(events), mimetype='text/event-stream', headers=headers)
+
 @app.route('/flashcards', methods=['GET', 'POST'])
 def flashcards():
     conn = get_db()
     c = conn.cursor()
     
-    # Get default topic
-    c.execute('SELECT id FROM topics WHERE name = ?', ('General',))
-    topic = c.fetchone()
-    if not topic:
-        c.execute('INSERT INTO topics (name, description) VALUES (?, ?)', 
-                  ('General', 'Default study topic'))
-        conn.commit()
-        topic_id = c.lastrowid
-    else:
-        topic_id = topic[0]
+    # Get default topic (created if missing)
+    topic = topic_cache.default_topic(conn)
+    topic_id = topic[0]
     
     if request.method == 'POST':
         if 'raw_text' in request.form:
             # AI-generated flashcards
-            if not client:
+            if not gateway.enabled():
                 return jsonify({"error": "AI features are disabled. Please set ANTHROPIC_API_KEY in your .env file."}), 400
             
             try:
-                raw_text = request.form['raw_text']
-                prompt = f"Generate 5 concise flashcards based on the following study content. Format as 'Term: Definition' pairs, one per line:\n\n{raw_text}"
-                response = client.messages.create(
-                    model="claude-3-5-sonnet-20241022",
-                    max_tokens=400,
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                flashcards_text = response.content[0].text.strip()
-                
-                # Parse and save flashcards
-                lines = flashcards_text.split('\n')
-                for line in lines:
-                    if ':' in line:
-                        term, definition = line.split(':', 1)
-                        term = term.strip()
-                        definition = definition.strip()
-                        if term and definition:
-                            c.execute('INSERT INTO flashcards (topic_id, term, definition) VALUES (?, ?, ?)', 
-                                      (topic_id, term, definition))
-                
-                conn.commit()
-                return jsonify({"flashcards": flashcards_text})
+                return enqueue_ai_job('flashcards', topic_id, request.form['raw_text'])
             except Exception as e:
                 return jsonify({"error": f"Error generating flashcards: {str(e)}"}), 500
         else:
@@ -197,20 +382,22 @@ def flashcards():
             term = request.form['term'].strip()
             definition = request.form['definition'].strip()
             if term and definition:
-                c.execute('INSERT INTO flashcards (topic_id, term, definition) VALUES (?, ?, ?)', 
-                          (topic_id, term, definition))
-                conn.commit()
+                insert_flashcard(topic_id, term, definition)
             conn.close()
             return redirect(url_for('flashcards'))
     
     # GET request - display flashcards
-    c.execute('SELECT * FROM flashcards WHERE topic_id = ? ORDER BY id DESC', (topic_id,))
-    fc_list = c.fetchall()
-    # pass topic info to template
-    c.execute('SELECT id, name FROM topics WHERE id = ?', (topic_id,))
-    topic_tuple = c.fetchone()
+    response = render_listing(c, 'flashcards', FLASHCARD_COLUMNS, topic, 'flashcards.html', 'flashcards')
     conn.close()
-    return render_template('flashcards.html', flashcards=fc_list, topic=topic_tuple)
+    return response
+
+def grade_submission(c, topic_id):
+    """Grade the posted quiz against its session, or by submitted card ids if the session is gone"""
+    session = load_session(c, request.form.get('session_id'))
+    if session and session['topic_id'] == topic_id:
+        return grade_session(c, session, request.form), session['cards']
+    return grade_cards(c, topic_id, request.form)
+
 
 @app.route('/quiz', methods=['GET', 'POST'])
 def quiz():
@@ -218,49 +405,61 @@ def quiz():
     c = conn.cursor()
     
     # Get default topic
-    c.execute('SELECT id FROM topics WHERE name = ?', ('General',))
-    topic = c.fetchone()
+    topic = topic_cache.by_name(conn, 'General')
     topic_id = topic[0] if topic else 1
     
     if request.method == 'POST':
         # Process quiz answers
-        c.execute('SELECT id, topic_id, term, definition FROM flashcards WHERE topic_id = ?', (topic_id,))
-        cards = c.fetchall()
-        
-        score = 0
-        for card in cards:
-            card_id = str(card[0])
-            if card_id in request.form:
-                user_answer = request.form[card_id].strip().lower()
-                correct_answer = card[3].strip().lower()  # definition is at index 3
-                if user_answer in correct_answer or correct_answer in user_answer:
-                    score += 1
-        
+        score, cards = grade_submission(c, topic_id)
+        conn.commit()
         conn.close()
         return render_template('quiz.html', submitted=True, score=score, cards=cards)
     
     # GET request - show quiz
-    c.execute('SELECT id, topic_id, term, definition FROM flashcards WHERE topic_id = ? ORDER BY RANDOM() LIMIT 10', (topic_id,))
-    cards = c.fetchall()
-    # get topic info for display
-    c.execute('SELECT id, name FROM topics WHERE id = ?', (topic_id,))
-    topic_tuple = c.fetchone()
-    conn.close()
-    
+    cards = due_cards(c, topic_id)
     if not cards:
+        conn.close()
         return redirect(url_for('flashcards'))
     
-    return render_template('quiz.html', submitted=False, cards=cards, topic=topic_tuple)
+    session_id = create_session(c, topic_id, cards)
+    conn.commit()
+    conn.close()
+    return render_template('quiz.html', submitted=False, cards=cards, topic=topic, session_id=session_id)
 
 
 # Topic-scoped routes (Phase 2)
+@app.route('/search')
+def search_view():
+    """Full-text search over notes and flashcards, optionally within one topic (?topic_id=) and kind (?kind=)"""
+    q = request.args.get('q', '').strip()
+    topic_id = request.args.get('topic_id', type=int)
+    kind = request.args.get('kind')
+    kinds = (kind,) if kind in SEARCH_KINDS else SEARCH_KINDS
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', SEARCH_PAGE_SIZE, type=int), 1), MAX_SEARCH_PAGE_SIZE)
+
+    conn = get_db_connection()
+    hits, has_more = search(conn, q, topic_id, kinds, limit=per_page, offset=(page - 1) * per_page) if q else ([], False)
+    conn.close()
+
+    pagination = {'page': page, 'per_page': per_page, 'has_prev': page > 1, 'has_next': has_more}
+    if request.args.get('format') == 'json':
+        return jsonify({
+            "query": q,
+            "results": [dict(hit, snippet=str(hit['snippet'])) for hit in hits],
+            **pagination,
+        })
+    return render_template('search.html', q=q, topic_id=topic_id, kind=kind if kind in SEARCH_KINDS else None,
+                           hits=hits, pagination=pagination)
+
+
 @app.route('/<int:topic_id>/notes', methods=['GET', 'POST'])
+@conditional_topic_get
 def notes_for_topic(topic_id):
     conn = get_db()
     c = conn.cursor()
     # verify topic
-    c.execute('SELECT id, name FROM topics WHERE id = ?', (topic_id,))
-    t = c.fetchone()
+    t = topic_cache.get(conn, topic_id)
     if not t:
         conn.close()
         return 'Topic not found', 404
@@ -268,32 +467,26 @@ def notes_for_topic(topic_id):
     if request.method == 'POST':
         content = request.form.get('content', '').strip()
         if content:
-            c.execute('INSERT INTO notes (topic_id, content) VALUES (?, ?)', (topic_id, content))
-            conn.commit()
+            write_queue.execute('INSERT INTO notes (topic_id, content) VALUES (?, ?)', (topic_id, content))
         return redirect(url_for('notes_for_topic', topic_id=topic_id))
 
-    c.execute('SELECT * FROM notes WHERE topic_id = ? ORDER BY id DESC', (topic_id,))
-    notes_list = c.fetchall()
+    response = render_listing(c, 'notes', NOTE_COLUMNS, t, 'notes.html', 'notes')
     conn.close()
-    return render_template('notes.html', notes=notes_list, topic=t)
+    return response
 
 
 @app.route('/<int:topic_id>/delete-note/<int:note_id>', methods=['POST'])
 def delete_note_for_topic(topic_id, note_id):
-    conn = get_db()
-    c = conn.cursor()
-    c.execute('DELETE FROM notes WHERE id = ? AND topic_id = ?', (note_id, topic_id))
-    conn.commit()
-    conn.close()
+    write_queue.execute('DELETE FROM notes WHERE id = ? AND topic_id = ?', (note_id, topic_id))
     return redirect(url_for('notes_for_topic', topic_id=topic_id))
 
 
 @app.route('/<int:topic_id>/flashcards', methods=['GET', 'POST'])
+@conditional_topic_get
 def flashcards_for_topic(topic_id):
     conn = get_db()
     c = conn.cursor()
-    c.execute('SELECT id, name FROM topics WHERE id = ?', (topic_id,))
-    t = c.fetchone()
+    t = topic_cache.get(conn, topic_id)
     if not t:
         conn.close()
         return 'Topic not found', 404
@@ -301,29 +494,13 @@ def flashcards_for_topic(topic_id):
     if request.method == 'POST':
         # manual or AI-generated handled via same field names
         if 'raw_text' in request.form and request.form.get('raw_text').strip():
-            if not client:
+            if not gateway.enabled():
                 conn.close()
                 return jsonify({"error": "AI features are disabled."}), 400
             try:
-                raw_text = request.form['raw_text']
-                prompt = f"Generate 5 concise flashcards based on the following study content. Format as 'Term: Definition' pairs, one per line:\n\n{raw_text}"
-                response = client.messages.create(
-                    model="claude-3-5-sonnet-20241022",
-                    max_tokens=400,
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                flashcards_text = response.content[0].text.strip()
-                lines = flashcards_text.split('\n')
-                for line in lines:
-                    if ':' in line:
-                        term, definition = line.split(':', 1)
-                        term = term.strip()
-                        definition = definition.strip()
-                        if term and definition:
-                            c.execute('INSERT INTO flashcards (topic_id, term, definition) VALUES (?, ?, ?)', (topic_id, term, definition))
-                conn.commit()
+                response = enqueue_ai_job('flashcards', topic_id, request.form['raw_text'])
                 conn.close()
-                return jsonify({"flashcards": flashcards_text})
+                return response
             except Exception as e:
                 conn.close()
                 return jsonify({"error": f"Error generating flashcards: {str(e)}"}), 500
@@ -331,48 +508,74 @@ def flashcards_for_topic(topic_id):
             term = request.form.get('term', '').strip()
             definition = request.form.get('definition', '').strip()
             if term and definition:
-                c.execute('INSERT INTO flashcards (topic_id, term, definition) VALUES (?, ?, ?)', (topic_id, term, definition))
-                conn.commit()
+                insert_flashcard(topic_id, term, definition)
             conn.close()
             return redirect(url_for('flashcards_for_topic', topic_id=topic_id))
 
-    c.execute('SELECT * FROM flashcards WHERE topic_id = ? ORDER BY id DESC', (topic_id,))
-    fc_list = c.fetchall()
+    response = render_listing(c, 'flashcards', FLASHCARD_COLUMNS, t, 'flashcards.html', 'flashcards')
     conn.close()
-    return render_template('flashcards.html', flashcards=fc_list, topic=t)
+    return response
+
+
+@app.route('/<int:topic_id>/flashcards/import', methods=['POST'])
+def import_flashcards_for_topic(topic_id):
+    """Bulk-load cards from a CSV (term,definition) or JSONL upload, streamed in batches"""
+    conn = get_db()
+    c = conn.cursor()
+    if topic_cache.get(conn, topic_id) is None:
+        return jsonify({"error": "Topic not found"}), 404
+
+    upload = request.files.get('file')
+    if upload is not None:
+        stream, name, mimetype = upload.stream, upload.filename or '', upload.mimetype
+    else:
+        stream, name, mimetype = io.BufferedReader(request.stream), '', request.mimetype
+    fmt = request.args.get('format') or request.form.get('format')
+    if not fmt:
+        if name.endswith('.csv') or mimetype == 'text/csv':
+            fmt = 'csv'
+        elif name.endswith(('.jsonl', '.ndjson')) or mimetype in ('application/x-ndjson', 'application/jsonl'):
+            fmt = 'jsonl'
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({"error": "Upload must be CSV or JSONL (pass format=csv or format=jsonl)"}), 400
+    batch_size = request.args.get('batch_size', IMPORT_BATCH_SIZE, type=int)
+    batch_size = min(max(batch_size, 1), MAX_IMPORT_BATCH_SIZE)
+
+    try:
+        stats = import_flashcards(conn, topic_id, stream, fmt, batch_size)
+    except InvalidUpload as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(stats)
 
 
 @app.route('/<int:topic_id>/quiz', methods=['GET', 'POST'])
 def quiz_for_topic(topic_id):
     conn = get_db()
     c = conn.cursor()
-    c.execute('SELECT id, name FROM topics WHERE id = ?', (topic_id,))
-    t = c.fetchone()
+    t = topic_cache.get(conn, topic_id)
     if not t:
         conn.close()
         return 'Topic not found', 404
 
     if request.method == 'POST':
-        c.execute('SELECT id, topic_id, term, definition FROM flashcards WHERE topic_id = ?', (topic_id,))
-        cards = c.fetchall()
-        score = 0
-        for card in cards:
-            card_id = str(card[0])
-            if card_id in request.form:
-                user_answer = request.form[card_id].strip().lower()
-                correct_answer = card[3].strip().lower()
-                if user_answer in correct_answer or correct_answer in user_answer:
-                    score += 1
+        score, cards = grade_submission(c, topic_id)
+        conn.commit()
         conn.close()
         return render_template('quiz.html', submitted=True, score=score, cards=cards, topic=t)
 
-    c.execute('SELECT id, topic_id, term, definition FROM flashcards WHERE topic_id = ? ORDER BY RANDOM() LIMIT 10', (topic_id,))
-    cards = c.fetchall()
-    conn.close()
+    cards = due_cards(c, topic_id)
     if not cards:
+        conn.close()
         return redirect(url_for('flashcards_for_topic', topic_id=topic_id))
-    return render_template('quiz.html', submitted=False, cards=cards, topic=t)
+    session_id = create_session(c, topic_id, cards)
+    conn.commit()
+    conn.close()
+    return render_template('quiz.html', submitted=False, cards=cards, topic=t, session_id=session_id)
+
+
+# WSGI servers import ``app``; wiring it here does no I/O (see create_app)
+create_app()
 
 if __name__ == '__main__':
-    init_database()
+    create_app(init_db=True)
     app.run(debug=True)
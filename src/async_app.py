@@ -0,0 +1,241 @@
+"""ASGI serving mode (``uvicorn asgi:app``).
+
+A streamed summary holds its request open for the whole model call, seconds
+at a time. Under gunicorn that is a thread or a worker process per stream;
+here ``POST /generate/stream`` runs as a coroutine on the event loop, using
+the async Anthropic client (``gateway.astream``) and ``async_db``, so one
+process can hold hundreds of streams open.
+
+Every other route is the unchanged Flask app, run by ``WSGIBridge`` on a pool
+of ``ASGI_WSGI_THREADS`` threads. Those handlers wait on the database for
+milliseconds, so a thread each is cheap, and they keep a single
+implementation shared with the sync mode (``gunicorn app:app``), which works
+as before.
+"""
+import asyncio
+import io
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+
+from werkzeug.formparser import parse_form_data
+
+from ai_cache import ai_cache, cache_key
+from async_db import async_db
+from llm_gateway import LLMUnavailable
+from metrics import REQUEST_LATENCY
+from summary_stream import astream_summary, summary_steps
+
+ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', '32'))
+
+# Same prefix the WSGI SubdirectoryMiddleware strips
+SUBDIRECTORY = '/study'
+
+
+async def agenerate_text(gateway, template, raw_text, max_tokens):
+    """Coroutine version of ``generate_text`` in app.py: the response cache, then ``gateway.acomplete``"""
+    def call():
+        return gateway.acomplete(template.format(raw_text=raw_text), max_tokens)
+    return await ai_cache.aget_or_create(cache_key(gateway.model, template, raw_text, max_tokens), call)
+
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope and its complete request body"""
+    script_name = scope.get('root_path', '')
+    path = scope['path']
+    if script_name and path.startswith(script_name):
+        path = path[len(script_name):]
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'SERVER_NAME': (scope.get('server') or ('localhost', 80))[0],
+        'SERVER_PORT': str((scope.get('server') or ('localhost', 80))[1]),
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else 'HTTP_' + name
+        value = value.decode('latin-1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    # The body is already buffered, chunked uploads included
+    environ['CONTENT_LENGTH'] = str(len(body))
+    environ.pop('HTTP_TRANSFER_ENCODING', None)
+    return environ
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+class WSGIBridge:
+    """Runs a WSGI app for ASGI requests: one pool thread per request, response body streamed back"""
+
+    def __init__(self, wsgi_app, threads=ASGI_WSGI_THREADS):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='wsgi')
+
+    async def __call__(self, scope, receive, send, body):
+        loop = asyncio.get_running_loop()
+        disconnected = threading.Event()
+        watcher = asyncio.ensure_future(wait_for_disconnect(receive))
+        watcher.add_done_callback(lambda _: disconnected.set())
+        try:
+            await loop.run_in_executor(self.executor, self._run, build_environ(scope, body), send, loop, disconnected)
+        finally:
+            watcher.cancel()
+
+    def _run(self, environ, send, loop, disconnected):
+        # The whole response is produced on this one thread: stream_with_context
+        # generators keep the request context in thread-local context variables.
+        def call(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        start = {}
+
+        def start_response(status, headers, exc_info=None):
+            start.update(type='http.response.start', status=int(status.split(' ', 1)[0]),
+                         headers=[(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers])
+            return lambda data: call({'type': 'http.response.body', 'body': data, 'more_body': True})
+
+        iterable = self.wsgi_app(environ, start_response)
+        try:
+            started = False
+            for chunk in iterable:
+                if not started:
+                    call(start)
+                    started = True
+                if chunk:
+                    call({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                if disconnected.is_set():
+                    # Closing the iterable below runs the app's disconnect handling
+                    return
+            if not started:
+                call(start)
+            call({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+
+class AsyncApp:
+    """ASGI application: native coroutine routes, everything else through the Flask app"""
+
+    def __init__(self, app_module, threads=ASGI_WSGI_THREADS):
+        # The Flask module (src/app.py): its gateway, prompts and helpers are read per request
+        self.app_module = app_module
+        self.bridge = WSGIBridge(app_module.app, threads)
+        self.routes = {('POST', '/generate/stream'): self.generate_stream}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+        body = await read_body(receive)
+        handler = self.routes.get((scope['method'], self._route_path(scope)))
+        if handler is None:
+            return await self.bridge(scope, receive, send, body)
+
+        started = time.perf_counter()
+        status = []
+        task = asyncio.ensure_future(handler(scope, body, send, status))
+        watcher = asyncio.ensure_future(wait_for_disconnect(receive))
+        done, _ = await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if task in done:
+            watcher.cancel()
+            task.result()
+        else:
+            # Client went away: cancelling closes the upstream model stream and nothing is saved
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        REQUEST_LATENCY.observe(time.perf_counter() - started, method=scope['method'],
+                                route=self._route_path(scope), status=status[0] if status else 499)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.app_module.create_app()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await async_db.close()
+                self.bridge.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _route_path(self, scope):
+        path = scope['path']
+        if os.getenv('FLASK_ENV') != 'development' and path.startswith(SUBDIRECTORY):
+            path = path[len(SUBDIRECTORY):] or '/'
+        return path
+
+    async def json_response(self, send, status, data, status_out):
+        status_out.append(status)
+        payload = json.dumps(data).encode('utf-8')
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(payload)).encode())]})
+        await send({'type': 'http.response.body', 'body': payload})
+
+    async def generate_stream(self, scope, body, send, status):
+        """Async counterpart of ``generate_summary_stream`` in app.py: the same ``summary_steps``, run as coroutines"""
+        m = self.app_module
+        gateway = m.gateway
+        if not gateway.enabled():
+            return await self.json_response(send, 400, {
+                "error": "AI features are disabled. Please set ANTHROPIC_API_KEY in your .env file."}, status)
+        raw_text = parse_form_data(build_environ(scope, body))[1].get('raw_text', '')
+        if not raw_text.strip():
+            return await self.json_response(send, 400, {"error": "raw_text is required"}, status)
+        try:
+            gateway.check()
+        except LLMUnavailable as e:
+            return await self.json_response(send, 503, {"error": str(e)}, status)
+
+        row = await async_db.fetchone('SELECT id FROM topics WHERE name = ?', ('General',))
+        topic_id = row[0] if row else 1
+
+        async def agenerate(template, text, max_tokens):
+            return await agenerate_text(gateway, template, text, max_tokens)
+
+        async def save(summary):
+            await async_db.execute('INSERT INTO notes (topic_id, content) VALUES (?, ?)', (topic_id, summary))
+
+        status.append(200)
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'), (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no')]})
+        steps = summary_steps(raw_text, gateway.model, m.SUMMARY_PROMPT, m.AI_MAX_TOKENS)
+        # aclosing: on cancellation the generator is closed here, not left for garbage collection
+        async with aclosing(astream_summary(steps, gateway, agenerate, m.summary_concurrency, save)) as events:
+            async for text in events:
+                await send({'type': 'http.response.body', 'body': text.encode('utf-8'), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
@@ -0,0 +1,96 @@
+"""Database access for coroutines (the ASGI entry point).
+
+On PostgreSQL this is an ``asyncpg`` pool of ``ASYNC_DB_POOL_MAX_SIZE``
+connections; statements written with ``?`` placeholders, as elsewhere in the
+app, are rewritten to ``$1, $2, ...``. SQLite has no network round trip to
+wait on, so reads run on the regular connection pool in a worker thread (the
+same approach aiosqlite takes) and writes go through the group commit in
+``write_queue``; the event loop never blocks on either.
+"""
+import asyncio
+import os
+import re
+import time
+
+from database import DATABASE_URL, USE_POSTGRES, get_db_connection
+from metrics import record_query
+from write_queue import write_queue
+
+ASYNC_DB_POOL_MAX_SIZE = int(os.getenv('ASYNC_DB_POOL_MAX_SIZE', '20'))
+
+if USE_POSTGRES:
+    try:
+        import asyncpg
+    except ImportError:
+        asyncpg = None
+else:
+    asyncpg = None
+
+_PLACEHOLDER = re.compile(r'\?')
+
+
+def to_numbered(sql):
+    """Rewrite ``?`` placeholders as asyncpg's ``$n``"""
+    counter = iter(range(1, sql.count('?') + 1))
+    return _PLACEHOLDER.sub(lambda m: f'${next(counter)}', sql)
+
+
+class AsyncDatabase:
+    def __init__(self, max_size=ASYNC_DB_POOL_MAX_SIZE):
+        self.max_size = max_size
+        self._pool = None
+        self._pool_lock = None
+
+    async def fetchone(self, sql, params=()):
+        if USE_POSTGRES:
+            return await self._pg('fetchrow', sql, params)
+        return await asyncio.to_thread(self._sqlite, sql, params, 'one')
+
+    async def fetchall(self, sql, params=()):
+        if USE_POSTGRES:
+            return await self._pg('fetch', sql, params)
+        return await asyncio.to_thread(self._sqlite, sql, params, 'all')
+
+    async def execute(self, sql, params=()):
+        """Run one write statement and commit it (on SQLite, in the next group commit)"""
+        if USE_POSTGRES:
+            await self._pg('execute', sql, params)
+        else:
+            await asyncio.to_thread(write_queue.execute, sql, params)
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def _pg(self, method, sql, params):
+        pool = await self._get_pool()
+        started = time.perf_counter()
+        try:
+            async with pool.acquire() as conn:
+                return await getattr(conn, method)(to_numbered(sql), *params)
+        finally:
+            record_query(sql, time.perf_counter() - started)
+
+    async def _get_pool(self):
+        if self._pool is None:
+            if asyncpg is None:
+                raise RuntimeError('asyncpg is required for the async entry point on PostgreSQL')
+            if self._pool_lock is None:
+                self._pool_lock = asyncio.Lock()
+            async with self._pool_lock:
+                if self._pool is None:
+                    self._pool = await asyncpg.create_pool(DATABASE_URL, min_size=1, max_size=self.max_size)
+        return self._pool
+
+    def _sqlite(self, sql, params, fetch):
+        conn = get_db_connection()
+        try:
+            c = conn.cursor()
+            c.execute(sql, params)
+            return c.fetchone() if fetch == 'one' else c.fetchall()
+        finally:
+            conn.close()
+
+
+async_db = AsyncDatabase()
@@ -0,0 +1,85 @@
+"""Conditional GET for topic-scoped pages.
+
+Triggers bump ``topics.content_version`` (and ``content_modified_at``) on
+every note or flashcard write, and ``edit_topic`` bumps it for renames. A
+page's ETag is that counter plus a digest of the request URL, so a GET whose
+``If-None-Match`` still matches is answered 304 after one primary-key lookup
+on ``topics``, without querying notes/flashcards or rendering a template.
+"""
+import hashlib
+import os
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import Response, g, make_response, request
+
+from database import get_db_connection
+from migrations import TOPIC_CONTENT_VERSION
+
+# Change on deploy so template changes aren't masked by old ETags or cached fragments
+ETAG_SALT = os.getenv('APP_VERSION', '')
+
+
+def topic_state(conn, topic_id):
+    """Return ``(content_version, content_modified_at)`` for a topic, or None if it doesn't exist"""
+    c = conn.cursor()
+    c.execute('SELECT content_version, content_modified_at FROM topics WHERE id = ?', (topic_id,))
+    return c.fetchone()
+
+
+def content_version(conn, topic_id):
+    """A topic's content version, reusing the lookup ``conditional_topic_get`` made for this request"""
+    state = g.get('_topic_state')
+    if state is None or state[0] != topic_id:
+        row = topic_state(conn, topic_id)
+        state = g._topic_state = (topic_id, row)
+    return state[1][0] if state[1] else None
+
+
+def all_topics_version(conn):
+    """Version of the topic list: topic creates/edits/deletes plus any topic's content changing"""
+    c = conn.cursor()
+    c.execute('SELECT (SELECT version FROM cache_versions WHERE name = ?),'
+              ' (SELECT version FROM cache_versions WHERE name = ?)', ('topics', TOPIC_CONTENT_VERSION))
+    return '{}.{}'.format(*c.fetchone())
+
+
+def topic_etag(topic_id, version):
+    """ETag for the current request's URL at a topic version"""
+    digest = hashlib.sha1(f'{ETAG_SALT}|{request.full_path}'.encode('utf-8')).hexdigest()[:16]
+    return f't{topic_id}-v{version}-{digest}'
+
+
+def _validators(response, etag, modified_at):
+    response.set_etag(etag, weak=True)
+    if modified_at:
+        response.last_modified = datetime.fromtimestamp(modified_at, timezone.utc)
+    # Browsers may keep the page but must revalidate before showing it
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def conditional_topic_get(view):
+    """Serve 304 Not Modified for a topic page when the client's ETag is current.
+
+    The wrapped view takes ``topic_id``. Other methods, missing topics and
+    non-200 responses pass through untouched.
+    """
+    @wraps(view)
+    def wrapper(topic_id, *args, **kwargs):
+        if request.method != 'GET':
+            return view(topic_id, *args, **kwargs)
+        state = topic_state(get_db_connection(), topic_id)
+        g._topic_state = (topic_id, state)
+        if state is None:
+            return view(topic_id, *args, **kwargs)
+        version, modified_at = state
+        etag = topic_etag(topic_id, version)
+        if request.if_none_match.contains_weak(etag):
+            return _validators(Response(status=304), etag, modified_at)
+        response = make_response(view(topic_id, *args, **kwargs))
+        if response.status_code == 200:
+            _validators(response, etag, modified_at)
+        return response
+    return wrapper
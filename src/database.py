@@ -1,8 +1,20 @@
 """Database connection and utilities for SQLite and PostgreSQL"""
 import os
 import sqlite3
+import threading
+import time
+from collections import deque
 from urllib.parse import urlparse
 
+from flask import g, has_app_context
+
+from metrics import DB_CONNECT, POOL_ACQUIRE, TimedCursor
+
+try:
+    import fcntl
+except ImportError:  # Windows: migrate() still takes its own per-step lock
+    fcntl = None
+
 # Check if we should use PostgreSQL (AWS RDS) or SQLite
 DATABASE_URL = os.getenv('DATABASE_URL')
 USE_POSTGRES = DATABASE_URL is not None and DATABASE_URL.startswith('postgres')
@@ -11,100 +23,379 @@ if USE_POSTGRES:
     import psycopg2
     import psycopg2.extras
 
+# SQLite file used in development (override with SQLITE_PATH)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SQLITE_PATH = os.getenv('SQLITE_PATH') or os.path.join(BASE_DIR, 'data', 'study_buddy.db')
+
+# Advisory lock id held while one process initializes the schema
+INIT_LOCK_KEY = 0x5354554459
+
+# PostgreSQL pool tuning
+POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))  # seconds to wait for a free connection
+POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', '1800'))  # recycle connections older than this
+POOL_HEALTH_CHECK_AFTER = float(os.getenv('DB_POOL_HEALTH_CHECK_AFTER', '30'))  # ping connections idle this long
+
+# SQLite pragmas applied to every new connection
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA foreign_keys=ON',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-16000',
+)
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes free within the pool timeout"""
+
+
+class PostgresPool:
+    """Bounded, thread-safe pool of PostgreSQL connections.
+
+    Idle connections are handed out LIFO so the warmest one is reused first.
+    Connections idle for longer than ``health_check_after`` are pinged with
+    ``SELECT 1`` before reuse, and connections older than ``max_lifetime`` are
+    closed and replaced so RDS failovers and server-side timeouts heal on
+    their own.
+    """
+
+    def __init__(self, connect, max_size=POOL_MAX_SIZE, timeout=POOL_TIMEOUT,
+                 max_lifetime=POOL_MAX_LIFETIME, health_check_after=POOL_HEALTH_CHECK_AFTER):
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conn, created_at, last_used)
+        self._created_at = {}  # id(conn) -> created_at for connections on loan
+        self._size = 0
+        self._counters = {'created': 0, 'reused': 0, 'recycled': 0, 'health_check_failures': 0,
+                          'waits': 0, 'timeouts': 0}
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            entry = None
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters['timeouts'] += 1
+                        raise PoolTimeout(f"No database connection available after {self.timeout}s")
+                    self._counters['waits'] += 1
+                    self._cond.wait(remaining)
+                if self._idle:
+                    entry = self._idle.pop()
+                else:
+                    self._size += 1
+
+            if entry is None:
+                # Connect outside the lock so a slow handshake doesn't block releases
+                started = time.perf_counter()
+                try:
+                    conn = self._connect()
+                    DB_CONNECT.observe(time.perf_counter() - started)
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._counters['created'] += 1
+                    self._created_at[id(conn)] = time.monotonic()
+                return conn
+
+            conn, created_at, last_used = entry
+            if self._is_usable(conn, created_at, last_used):
+                with self._cond:
+                    self._counters['reused'] += 1
+                    self._created_at[id(conn)] = created_at
+                return conn
+            self._discard(conn)
+
+    def acquire_dedicated(self):
+        # Every connection on loan is already its borrower's own
+        return self.acquire()
+
+    def release(self, conn):
+        with self._cond:
+            created_at = self._created_at.pop(id(conn), None)
+        if created_at is None:
+            return
+        if getattr(conn, 'closed', False) or self._expired(created_at):
+            self._discard(conn)
+            return
+        try:
+            # Never hand the next borrower a half-finished transaction
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+
+    def headroom(self):
+        """Connections that can be lent right now without waiting"""
+        with self._cond:
+            return self.max_size - self._size + len(self._idle)
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _, _ in idle:
+            _close_quietly(conn)
+
+    def stats(self):
+        with self._cond:
+            return dict(self._counters, size=self._size, idle=len(self._idle),
+                        in_use=self._size - len(self._idle), max_size=self.max_size)
+
+    def _expired(self, created_at):
+        return self.max_lifetime is not None and time.monotonic() - created_at > self.max_lifetime
+
+    def _is_usable(self, conn, created_at, last_used):
+        if getattr(conn, 'closed', False):
+            return False
+        if self._expired(created_at):
+            with self._cond:
+                self._counters['recycled'] += 1
+            return False
+        if time.monotonic() - last_used > self.health_check_after:
+            try:
+                cur = conn.cursor()
+                cur.execute('SELECT 1')
+                cur.fetchone()
+                cur.close()
+                conn.rollback()
+            except Exception:
+                with self._cond:
+                    self._counters['health_check_failures'] += 1
+                return False
+        return True
+
+    def _discard(self, conn):
+        _close_quietly(conn)
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+
+class SQLiteThreadPool:
+    """One long-lived SQLite connection per thread.
+
+    SQLite connections are cheap to keep but not safe to share across
+    threads, so each worker thread opens its own on first use (WAL mode, see
+    ``SQLITE_PRAGMAS``) and keeps it for the life of the thread.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counters = {'created': 0, 'reused': 0}
+        self._ready = False
+
+    def acquire(self, slot='conn'):
+        conn = getattr(self._local, slot, None)
+        if conn is not None:
+            with self._lock:
+                self._counters['reused'] += 1
+            return conn
+        if not self._ready:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._ready = True
+        started = time.perf_counter()
+        conn = sqlite3.connect(self.path)
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        DB_CONNECT.observe(time.perf_counter() - started)
+        setattr(self._local, slot, conn)
+        with self._lock:
+            self._counters['created'] += 1
+        return conn
+
+    def acquire_dedicated(self):
+        """The calling thread's second connection, whose commits never touch the first one's transaction"""
+        return self.acquire(slot='dedicated_conn')
+
+    def headroom(self):
+        """None: threads open their own connections, so there is no limit to wait on"""
+        return None
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+
+    def close_all(self):
+        """Close the calling thread's connections (other threads keep theirs)"""
+        for slot in ('conn', 'dedicated_conn'):
+            conn = getattr(self._local, slot, None)
+            if conn is not None:
+                setattr(self._local, slot, None)
+                _close_quietly(conn)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, path=self.path)
+
+
+class PooledConnection:
+    """DB-API connection proxy whose close() returns it to the pool.
+
+    Request-scoped connections ignore close() so handlers can keep calling
+    it; the connection goes back to the pool when the app context tears down.
+    """
+
+    def __init__(self, raw, pool, request_scoped=False):
+        self._raw = raw
+        self._pool = pool
+        self._request_scoped = request_scoped
+        self._released = False
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._raw.cursor(*args, **kwargs))
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def close(self):
+        if not self._request_scoped:
+            self.release()
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._pool.release(self._raw)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def _connect_postgres():
+    url = urlparse(DATABASE_URL)
+    params = {
+        'database': url.path[1:],
+        'user': url.username,
+        'password': url.password,
+        'host': url.hostname,
+        'port': url.port,
+    }
+    return lambda: psycopg2.connect(**params)
+
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if USE_POSTGRES:
+                    # Parse DATABASE_URL once, not on every connection
+                    _pool = PostgresPool(_connect_postgres())
+                else:
+                    _pool = SQLiteThreadPool(SQLITE_PATH)
+    return _pool
+
+
+def pool_headroom():
+    """Connections the pool can lend without waiting, or None if it never makes callers wait"""
+    return get_pool().headroom()
+
+
+def pool_stats():
+    """Snapshot of connection pool counters"""
+    stats = get_pool().stats()
+    stats['backend'] = 'postgres' if USE_POSTGRES else 'sqlite'
+    return stats
+
+
 def get_db_connection():
-    """Get database connection based on environment"""
-    if USE_POSTGRES:
-        # Parse DATABASE_URL for PostgreSQL connection
-        url = urlparse(DATABASE_URL)
-        conn = psycopg2.connect(
-            database=url.path[1:],
-            user=url.username,
-            password=url.password,
-            host=url.hostname,
-            port=url.port
-        )
+    """Get database connection based on environment.
+
+    Inside a Flask app context the same connection is returned for the whole
+    request and released by ``close_db`` on teardown; elsewhere the caller
+    owns the connection and must close() it.
+    """
+    if has_app_context():
+        conn = g.get('_db_conn')
+        if conn is None:
+            conn = g._db_conn = _acquire(request_scoped=True)
         return conn
-    else:
-        # Use SQLite for development
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        db_path = os.path.join(base_dir, 'data', 'study_buddy.db')
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
-        return sqlite3.connect(db_path)
+    return _acquire()
+
+
+def get_dedicated_connection():
+    """A connection that is never the request's, for work that commits on its own.
+
+    Commits on it leave the request's open transaction alone. The caller must
+    close() it; keep it only briefly, since inside a request it is a second
+    connection on loan.
+    """
+    return _acquire(dedicated=True)
+
+
+def _acquire(request_scoped=False, dedicated=False):
+    pool = get_pool()
+    started = time.perf_counter()
+    raw = pool.acquire_dedicated() if dedicated else pool.acquire()
+    POOL_ACQUIRE.observe(time.perf_counter() - started)
+    return PooledConnection(raw, pool, request_scoped=request_scoped)
+
+
+def close_db(exc=None):
+    """Release the request's connection back to the pool"""
+    conn = g.pop('_db_conn', None)
+    if conn is not None:
+        conn.release()
+
+
+def init_app(app):
+    """Register request-scoped connection handling on a Flask app"""
+    app.teardown_appcontext(close_db)
 
 def init_database():
-    """Initialize database tables"""
+    """Initialize database tables by applying any pending migrations"""
+    from migrations import migrate
+
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
         if USE_POSTGRES:
             print(f"Initializing PostgreSQL database at: {urlparse(DATABASE_URL).hostname}")
-            # PostgreSQL DDL
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS topics (
-                    id SERIAL PRIMARY KEY,
-                    name TEXT NOT NULL UNIQUE,
-                    description TEXT
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS notes (
-                    id SERIAL PRIMARY KEY,
-                    topic_id INTEGER NOT NULL,
-                    content TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY(topic_id) REFERENCES topics(id) ON DELETE CASCADE
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS flashcards (
-                    id SERIAL PRIMARY KEY,
-                    topic_id INTEGER NOT NULL,
-                    term TEXT NOT NULL,
-                    definition TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY(topic_id) REFERENCES topics(id) ON DELETE CASCADE
-                )
-            """)
         else:
             print(f"Initializing SQLite database")
-            # SQLite DDL
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS topics (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL UNIQUE,
-                    description TEXT
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS notes (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    topic_id INTEGER NOT NULL,
-                    content TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY(topic_id) REFERENCES topics(id) ON DELETE CASCADE
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS flashcards (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    topic_id INTEGER NOT NULL,
-                    term TEXT NOT NULL,
-                    definition TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY(topic_id) REFERENCES topics(id) ON DELETE CASCADE
-                )
-            """)
+        applied = migrate(conn)
+        if applied:
+            print(f"Applied migrations: {applied}")
         
-        conn.commit()
-        
-        # Create default topic if none exist
+        # Create default topic if none exist (ON CONFLICT: another process may be seeding too)
         cursor.execute('SELECT COUNT(*) FROM topics')
         count = cursor.fetchone()[0]
         if count == 0:
             cursor.execute(
-                'INSERT INTO topics (name, description) VALUES (%s, %s)' if USE_POSTGRES 
-                else 'INSERT INTO topics (name, description) VALUES (?, ?)',
+                'INSERT INTO topics (name, description) VALUES (%s, %s) ON CONFLICT (name) DO NOTHING' if USE_POSTGRES
+                else 'INSERT INTO topics (name, description) VALUES (?, ?) ON CONFLICT (name) DO NOTHING',
                 ('General', 'Default study topic')
             )
             conn.commit()
@@ -116,6 +407,34 @@ def init_database():
         print(f"Error initializing database: {e}")
         raise
 
+def init_database_locked():
+    """Run ``init_database`` while holding a cross-process lock.
+
+    For starting several workers at once with schema setup enabled: the first
+    one migrates, the others wait and then find nothing pending.
+    """
+    if USE_POSTGRES:
+        conn = get_pool().acquire()
+        c = conn.cursor()
+        c.execute('SELECT pg_advisory_lock(%s)', (INIT_LOCK_KEY,))
+        try:
+            init_database()
+        finally:
+            c.execute('SELECT pg_advisory_unlock(%s)', (INIT_LOCK_KEY,))
+            conn.commit()
+            get_pool().release(conn)
+        return
+    os.makedirs(os.path.dirname(SQLITE_PATH) or '.', exist_ok=True)
+    with open(SQLITE_PATH + '.init-lock', 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            init_database()
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
 def get_placeholder():
     """Return the correct placeholder for SQL queries (%s for Postgres, ? for SQLite)"""
     return '%s' if USE_POSTGRES else '?'
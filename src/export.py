@@ -0,0 +1,109 @@
+"""Streaming export of topics, notes and flashcards.
+
+Rows are read in batches (a named server-side cursor on PostgreSQL,
+``fetchmany`` on SQLite) and written out as they arrive, so memory stays flat
+whatever the size of the topic. Output is JSONL (one record per line, with a
+``type`` field) or CSV, optionally gzip-compressed on the fly.
+"""
+import csv
+import io
+import json
+import uuid
+import zlib
+
+from database import USE_POSTGRES, get_placeholder
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FORMATS = ('jsonl', 'csv')
+CSV_HEADER = ('type', 'topic_id', 'id', 'title', 'body', 'created_at')
+# Output is yielded in chunks of roughly this many bytes
+FLUSH_BYTES = 64 * 1024
+
+QUERIES = {
+    'topic': 'SELECT id, name, description FROM topics',
+    'note': 'SELECT id, topic_id, content, created_at FROM notes',
+    'flashcard': 'SELECT id, topic_id, term, definition, created_at FROM flashcards',
+}
+
+
+def _cursor(conn):
+    if USE_POSTGRES:
+        # Named cursors live on the server and are fetched itersize rows at a time
+        c = conn.cursor(name=f'export_{uuid.uuid4().hex}')
+        c.itersize = EXPORT_BATCH_SIZE
+        return c
+    return conn.cursor()
+
+
+def iter_rows(conn, sql, params=(), batch_size=EXPORT_BATCH_SIZE):
+    c = _cursor(conn)
+    try:
+        c.execute(sql, params)
+        while True:
+            rows = c.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        c.close()
+
+
+def iter_records(conn, topic_id=None):
+    """Yield (type, topic_id, id, title, body, created_at) for one topic, or every topic"""
+    p = get_placeholder()
+    where, order, params = '', ' ORDER BY topic_id, id', ()
+    if topic_id is not None:
+        where, order, params = f' WHERE topic_id = {p}', ' ORDER BY id', (topic_id,)
+
+    topic_where = f' WHERE id = {p}' if topic_id is not None else ''
+    for tid, name, description in iter_rows(conn, QUERIES['topic'] + topic_where + ' ORDER BY id', params):
+        yield 'topic', tid, tid, name, description, None
+    for nid, tid, content, created_at in iter_rows(conn, QUERIES['note'] + where + order, params):
+        yield 'note', tid, nid, None, content, created_at
+    for cid, tid, term, definition, created_at in iter_rows(conn, QUERIES['flashcard'] + where + order, params):
+        yield 'flashcard', tid, cid, term, definition, created_at
+
+
+def _jsonl_lines(records):
+    for kind, tid, rid, title, body, created_at in records:
+        record = {'type': kind, 'topic_id': tid, 'id': rid}
+        if kind == 'topic':
+            record.update(name=title, description=body)
+        elif kind == 'note':
+            record.update(content=body, created_at=str(created_at) if created_at else None)
+        else:
+            record.update(term=title, definition=body, created_at=str(created_at) if created_at else None)
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def _csv_lines(records):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(CSV_HEADER)
+    for record in records:
+        writer.writerow(record)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+def stream_export(conn, topic_id=None, fmt='jsonl', gzip=False):
+    """Yield the export as byte chunks"""
+    lines = (_csv_lines if fmt == 'csv' else _jsonl_lines)(iter_records(conn, topic_id))
+    compressor = zlib.compressobj(wbits=31) if gzip else None  # wbits=31 writes a gzip header
+    pending, size = [], 0
+    for line in lines:
+        data = line.encode('utf-8')
+        pending.append(data)
+        size += len(data)
+        if size >= FLUSH_BYTES:
+            chunk = b''.join(pending)
+            pending, size = [], 0
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+    chunk = b''.join(pending)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
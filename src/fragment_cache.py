@@ -0,0 +1,169 @@
+"""Cache for rendered template fragments.
+
+The list blocks of the notes, flashcards and topics pages are rendered from
+``templates/partials/`` and cached as HTML under a key that includes the
+content version (see conditional.py), so any write to a topic changes the
+key and stale fragments are simply never asked for again. A hit skips both
+the page query and the render.
+
+Each worker keeps a bounded LRU in memory. With ``FRAGMENT_CACHE_DIR`` set,
+fragments are also written to that directory so every worker on the host
+can reuse a fragment rendered by another; files are trimmed to
+``FRAGMENT_CACHE_DISK_MAX_ENTRIES`` by age. Keys are prefixed with
+``APP_VERSION`` (``conditional.ETAG_SALT``), so after a deploy the directory
+never serves HTML rendered by the previous templates.
+
+Every entry remembers how long it took to produce (page query plus render),
+and each hit adds that to ``saved_seconds`` in ``stats()``.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from markupsafe import Markup
+
+from conditional import ETAG_SALT
+
+FRAGMENT_CACHE_MAX_ENTRIES = int(os.getenv('FRAGMENT_CACHE_MAX_ENTRIES', '512'))
+FRAGMENT_CACHE_DIR = os.getenv('FRAGMENT_CACHE_DIR') or None
+FRAGMENT_CACHE_DISK_MAX_ENTRIES = int(os.getenv('FRAGMENT_CACHE_DISK_MAX_ENTRIES', '5000'))
+
+# Trim the disk directory every N stores rather than on every write
+EVICT_EVERY = 100
+
+
+class DiskFragments:
+    """Fragments as one file per key in a directory shared by all workers on a host"""
+
+    def __init__(self, directory, max_entries=FRAGMENT_CACHE_DISK_MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._stores = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, key):
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Guard against a hash collision returning someone else's fragment
+        if entry.get('key') != key:
+            return None
+        return entry['html'], entry['render_seconds']
+
+    def put(self, key, html, render_seconds):
+        # Write to a temp file and rename, so readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'key': key, 'html': html, 'render_seconds': render_seconds}, f)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            return
+        self._stores += 1
+        if self._stores % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        """Delete the oldest files beyond ``max_entries``"""
+        try:
+            entries = [e for e in os.scandir(self.directory) if e.name.endswith('.json')]
+        except OSError:
+            return 0
+        if len(entries) <= self.max_entries:
+            return 0
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        removed = 0
+        for entry in entries[:len(entries) - self.max_entries]:
+            try:
+                os.unlink(entry.path)
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                os.unlink(entry.path)
+
+
+class FragmentCache:
+    def __init__(self, max_entries=FRAGMENT_CACHE_MAX_ENTRIES, directory=FRAGMENT_CACHE_DIR, salt=ETAG_SALT):
+        self.max_entries = max_entries
+        self.salt = salt
+        self.disk = DiskFragments(directory) if directory else None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (html, render_seconds)
+        self._counters = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'render_seconds': 0.0, 'saved_seconds': 0.0}
+
+    def render(self, key, render):
+        """Return the cached fragment for ``key``, calling ``render()`` for the HTML on a miss"""
+        key = '|'.join([self.salt] + [str(part) for part in key])
+        entry = self._get(key)
+        if entry is not None:
+            return Markup(entry[0])
+
+        started = time.perf_counter()
+        html = str(render())
+        render_seconds = time.perf_counter() - started
+        self._store(key, html, render_seconds)
+        if self.disk:
+            self.disk.put(key, html, render_seconds)
+        with self._lock:
+            self._counters['misses'] += 1
+            self._counters['render_seconds'] += render_seconds
+        return Markup(html)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.disk:
+            self.disk.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters, entries=len(self._entries), disk=self.disk is not None)
+        lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        stats['render_seconds'] = round(stats['render_seconds'], 6)
+        stats['saved_seconds'] = round(stats['saved_seconds'], 6)
+        return stats
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+                self._counters['saved_seconds'] += entry[1]
+                return entry
+        if self.disk is None:
+            return None
+        entry = self.disk.get(key)
+        if entry is not None:
+            self._store(key, *entry)
+            with self._lock:
+                self._counters['disk_hits'] += 1
+                self._counters['saved_seconds'] += entry[1]
+        return entry
+
+    def _store(self, key, html, render_seconds):
+        with self._lock:
+            self._entries[key] = (html, render_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+fragment_cache = FragmentCache()
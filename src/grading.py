@@ -0,0 +1,80 @@
+"""Answer grading for quizzes.
+
+Definitions are normalized and tokenized once, when a card is inserted, and
+stored alongside it (``flashcards.definition_tokens``). Grading a submission
+then only tokenizes the user's answers and compares token sets in a single
+pass.
+
+An answer is correct when the Dice coefficient between its token set and the
+definition's, ``2|A & D| / (|A| + |D|)``, reaches the threshold
+(``GRADING_THRESHOLD``, default 0.5).
+"""
+import os
+import re
+import unicodedata
+
+GRADING_THRESHOLD = float(os.getenv('GRADING_THRESHOLD', '0.5'))
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from in is it of on or that the this to was were with which
+""".split())
+
+# Letters and digits in any script; underscores separate words like punctuation
+_WORD = re.compile(r'[^\W_]+')
+
+
+def normalize(text):
+    """Casefold, strip accents (combining marks) and punctuation, collapse whitespace"""
+    text = unicodedata.normalize('NFKD', (text or '').casefold())
+    text = ''.join(ch for ch in text if unicodedata.category(ch) != 'Mn')
+    return ' '.join(_WORD.findall(text))
+
+
+def _stem(token):
+    # Plural folding is enough to match "networks" with "network"
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Token set of ``text`` without stopwords (kept if the text is nothing but stopwords)"""
+    words = normalize(text).split()
+    tokens = {_stem(w) for w in words if w not in STOPWORDS}
+    return frozenset(tokens or words)
+
+
+def serialize_tokens(tokens):
+    return ' '.join(sorted(tokens))
+
+
+def definition_tokens(definition):
+    """Stored form of a definition's token set"""
+    return serialize_tokens(tokenize(definition))
+
+
+def parse_tokens(stored):
+    return frozenset(stored.split()) if stored else frozenset()
+
+
+def similarity(answer_tokens, expected_tokens):
+    if not answer_tokens or not expected_tokens:
+        return 0.0
+    return 2 * len(answer_tokens & expected_tokens) / (len(answer_tokens) + len(expected_tokens))
+
+
+def grade_batch(submissions, threshold=None):
+    """Grade ``(answer, expected_tokens, definition)`` triples in one pass.
+
+    ``expected_tokens`` is the stored token string; when it is missing (cards
+    inserted before tokens were stored) it is derived from ``definition``.
+    Returns a list of ``(correct, score)`` pairs in input order.
+    """
+    threshold = GRADING_THRESHOLD if threshold is None else threshold
+    results = []
+    append = results.append
+    for answer, stored, definition in submissions:
+        expected = parse_tokens(stored) if stored else tokenize(definition)
+        score = similarity(tokenize(answer), expected)
+        append((score >= threshold, score))
+    return results
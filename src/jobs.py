@@ -0,0 +1,223 @@
+"""Background jobs for AI generation.
+
+Handlers that call the model are slow (seconds per request), so routes
+submit a job and return 202 with its id instead of pinning a WSGI worker.
+A bounded pool of worker threads runs the jobs. Each job's status, progress,
+result and timings live in the ``ai_jobs`` table, so any worker process can
+answer a status poll.
+
+A job is claimed with a conditional UPDATE (``status = 'queued'``) before it
+runs, so a job re-queued by ``resume_pending`` after a restart is never run
+twice. ``start`` runs once per process, on its first request: it starts the
+workers and calls ``resume_pending``, which also fails jobs left ``running``
+for longer than ``AI_JOB_STALE_SECONDS`` by a process that died. The
+handler's own writes and the final status update commit in the same
+transaction.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+
+from database import get_db_connection
+
+AI_JOB_WORKERS = int(os.getenv('AI_JOB_WORKERS', '4'))
+AI_JOB_QUEUE_SIZE = int(os.getenv('AI_JOB_QUEUE_SIZE', '100'))
+# Run jobs inline at submit time (tests, single-process debugging)
+AI_JOBS_EAGER = os.getenv('AI_JOBS_EAGER') == '1'
+# A job still 'running' this long after it started belongs to a worker that died
+AI_JOB_STALE_SECONDS = float(os.getenv('AI_JOB_STALE_SECONDS', '900'))
+
+log = logging.getLogger('studybuddy.jobs')
+
+JOB_COLUMNS = 'id, kind, topic_id, status, progress, payload, result, error, created_at, started_at, finished_at'
+
+
+class QueueFull(Exception):
+    """Raised when the job queue is at capacity"""
+
+
+class JobQueue:
+    def __init__(self, workers=AI_JOB_WORKERS, max_queued=AI_JOB_QUEUE_SIZE, eager=AI_JOBS_EAGER,
+                 stale_after=AI_JOB_STALE_SECONDS):
+        self.workers = workers
+        self.eager = eager
+        self.stale_after = stale_after
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._handlers = {}
+        self._threads = []
+        self._app = None
+        self._started_pid = None
+        self._lock = threading.Lock()
+        self._running = 0
+        self._timings = deque(maxlen=1000)  # (queue_wait, run_time) of finished jobs
+        self._counters = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0}
+
+    def init_app(self, app):
+        self._app = app
+
+    def start(self):
+        """Start this process's workers and resume jobs left behind; runs once per process"""
+        if self.eager or self._started_pid == os.getpid():
+            return
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+        self.resume_pending()
+
+    def handler(self, kind):
+        """Register ``fn(job)`` as the handler for ``kind``; its return value is stored as the result"""
+        def decorator(fn):
+            self._handlers[kind] = fn
+            return fn
+        return decorator
+
+    def submit(self, kind, topic_id, payload):
+        """Persist a queued job and hand it to the worker pool. Returns the job id."""
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        conn = get_db_connection()
+        c = conn.cursor()
+        c.execute('INSERT INTO ai_jobs (id, kind, topic_id, status, progress, payload, created_at)'
+                  ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                  (job_id, kind, topic_id, 'queued', 'queued', json.dumps(payload), time.time()))
+        conn.commit()
+        conn.close()
+        with self._lock:
+            self._counters['submitted'] += 1
+
+        if self.eager:
+            self.run(job_id)
+            return job_id
+
+        self._ensure_workers()
+        try:
+            self._queue.put_nowait(job_id)
+        except queue.Full:
+            with self._lock:
+                self._counters['rejected'] += 1
+            self._finish(job_id, 'failed', error='Job queue is full, try again shortly')
+            raise QueueFull(f"{self._queue.maxsize} jobs already queued")
+        return job_id
+
+    def get(self, job_id):
+        conn = get_db_connection()
+        c = conn.cursor()
+        c.execute(f'SELECT {JOB_COLUMNS} FROM ai_jobs WHERE id = ?', (job_id,))
+        row = c.fetchone()
+        conn.close()
+        if row is None:
+            return None
+        job = dict(zip([col.strip() for col in JOB_COLUMNS.split(',')], row))
+        job['payload'] = json.loads(job['payload']) if job['payload'] else None
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def set_progress(self, job_id, progress):
+        conn = get_db_connection()
+        c = conn.cursor()
+        c.execute('UPDATE ai_jobs SET progress = ? WHERE id = ?', (progress, job_id))
+        conn.commit()
+        conn.close()
+
+    def run(self, job_id):
+        """Claim and run one job in the current thread"""
+        conn = get_db_connection()
+        c = conn.cursor()
+        started = time.time()
+        c.execute("UPDATE ai_jobs SET status = 'running', progress = 'running', started_at = ?"
+                  " WHERE id = ? AND status = 'queued'", (started, job_id))
+        claimed = c.rowcount == 1
+        conn.commit()
+        if not claimed:
+            conn.close()
+            return
+        job = self.get(job_id)
+        with self._lock:
+            self._running += 1
+        try:
+            result = self._handlers[job['kind']](job)
+        except Exception as e:
+            conn.rollback()
+            self._finish(job_id, 'failed', error=str(e))
+            with self._lock:
+                self._counters['failed'] += 1
+        else:
+            self._finish(job_id, 'done', result=result)
+            with self._lock:
+                self._counters['completed'] += 1
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._timings.append((started - job['created_at'], time.time() - started))
+            conn.close()
+
+    def resume_pending(self):
+        """Re-queue jobs left queued by a previous process and fail the ones it left running"""
+        now = time.time()
+        conn = get_db_connection()
+        c = conn.cursor()
+        c.execute("UPDATE ai_jobs SET status = 'failed', progress = 'failed', error = ?, finished_at = ?"
+                  " WHERE status = 'running' AND started_at < ?",
+                  ('Interrupted: the worker running this job stopped', now, now - self.stale_after))
+        if c.rowcount:
+            log.warning('Failed %d stale running jobs', c.rowcount)
+        c.execute("SELECT id FROM ai_jobs WHERE status = 'queued' ORDER BY created_at")
+        job_ids = [row[0] for row in c.fetchall()]
+        conn.commit()
+        conn.close()
+        self._ensure_workers()
+        for job_id in job_ids:
+            try:
+                self._queue.put_nowait(job_id)
+            except queue.Full:
+                break
+        return len(job_ids)
+
+    def stats(self):
+        with self._lock:
+            timings = list(self._timings)
+            stats = dict(self._counters, queue_depth=self._queue.qsize(), running=self._running,
+                         workers=len(self._threads), max_queued=self._queue.maxsize)
+        for name, values in (('queue_wait', [t[0] for t in timings]), ('run_time', [t[1] for t in timings])):
+            values.sort()
+            stats[f'{name}_p50'] = values[len(values) // 2] if values else None
+            stats[f'{name}_p95'] = values[int(len(values) * 0.95)] if values else None
+        return stats
+
+    def _finish(self, job_id, status, result=None, error=None):
+        conn = get_db_connection()
+        c = conn.cursor()
+        c.execute('UPDATE ai_jobs SET status = ?, progress = ?, result = ?, error = ?, finished_at = ? WHERE id = ?',
+                  (status, status, json.dumps(result) if result is not None else None, error, time.time(), job_id))
+        conn.commit()
+        conn.close()
+
+    def _ensure_workers(self):
+        if len(self._threads) >= self.workers:
+            return
+        with self._lock:
+            while len(self._threads) < self.workers:
+                t = threading.Thread(target=self._work, name=f'ai-job-{len(self._threads)}', daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                with self._app.app_context():
+                    self.run(job_id)
+            except Exception:
+                log.exception('Error running job %s', job_id)
+            finally:
+                self._queue.task_done()
+
+
+job_queue = JobQueue()
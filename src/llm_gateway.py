@@ -0,0 +1,603 @@
+"""Single entry point for calls to the language model.
+
+Every AI path (summaries, flashcards, map-reduce chunks, streamed summaries)
+goes through ``LLMGateway``, which keeps a slow or failing upstream from
+tying up every worker:
+
+- Concurrency: at most ``LLM_MAX_CONCURRENCY`` calls in flight per process
+  and, with ``LLM_GLOBAL_CONCURRENCY`` set, across all processes on the host
+  (one lock file per slot in ``LLM_SLOTS_DIR``). A call that can't get a slot
+  before its deadline fails with ``LLMUnavailable``.
+- Deadlines: each call has ``LLM_TIMEOUT`` seconds in total, shared by the
+  wait for a slot, every attempt and the backoff between them. Streams are
+  cut off when the deadline passes.
+- Retries: 429, 5xx and connection errors are retried up to
+  ``LLM_MAX_RETRIES`` times with full-jitter exponential backoff (honouring
+  ``retry-after``). Streams are only retried before the first token.
+- Circuit breaker: after ``LLM_BREAKER_THRESHOLD`` consecutive failed calls
+  the gateway fails fast with ``LLMUnavailable`` for ``LLM_BREAKER_COOLDOWN``
+  seconds, then lets one trial call through.
+
+The backend does the actual request. ``AnthropicBackend`` wraps the SDK
+client; ``FakeBackend`` (``LLM_BACKEND=fake``) answers locally for tests
+and development without an API key.
+
+``acomplete`` and ``astream`` are the coroutine versions used by the ASGI
+entry point (async_app.py). They share the breaker, counters and host slots
+with the sync methods but have their own per-process limit,
+``LLM_ASYNC_MAX_CONCURRENCY``: a waiting coroutine costs far less than a
+waiting thread, so the async limit can be much higher.
+"""
+import asyncio
+import inspect
+import os
+import random
+import tempfile
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+
+from metrics import LLM_RETRIES, llm_call
+
+try:
+    import fcntl
+except ImportError:  # Windows: no host-wide slots
+    fcntl = None
+
+AI_MODEL = os.getenv('AI_MODEL', 'claude-3-5-sonnet-20241022')
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'anthropic')
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+LLM_ASYNC_MAX_CONCURRENCY = int(os.getenv('LLM_ASYNC_MAX_CONCURRENCY', '256'))
+LLM_GLOBAL_CONCURRENCY = int(os.getenv('LLM_GLOBAL_CONCURRENCY', '0'))
+LLM_SLOTS_DIR = os.getenv('LLM_SLOTS_DIR') or os.path.join(tempfile.gettempdir(), 'studybuddy-llm-slots')
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '60'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '3'))
+LLM_RETRY_BASE = float(os.getenv('LLM_RETRY_BASE', '0.5'))
+LLM_RETRY_MAX = float(os.getenv('LLM_RETRY_MAX', '8'))
+LLM_BREAKER_THRESHOLD = int(os.getenv('LLM_BREAKER_THRESHOLD', '5'))
+LLM_BREAKER_COOLDOWN = float(os.getenv('LLM_BREAKER_COOLDOWN', '30'))
+
+# How often a caller waiting for a host-wide slot retries the lock files
+SLOT_POLL_INTERVAL = 0.02
+
+
+class LLMError(Exception):
+    """Base class for errors raised by the gateway itself"""
+
+
+class LLMUnavailable(LLMError):
+    """The gateway refused the call: circuit open or no free slot before the deadline"""
+
+
+class LLMTimeout(LLMError):
+    """The call's deadline passed"""
+
+
+class BackendError(Exception):
+    """An HTTP-style error from a backend; ``status_code`` decides whether it is retried"""
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Usage:
+    def __init__(self, input_tokens=0, output_tokens=0):
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+
+
+class AnthropicBackend:
+    """Messages API through the SDK clients returned by ``get_client()`` and ``get_async_client()``"""
+
+    def __init__(self, get_client, get_async_client=None):
+        self.get_client = get_client
+        self.get_async_client = get_async_client
+
+    def enabled(self):
+        return self.get_client() is not None
+
+    def create(self, model, prompt, max_tokens, timeout):
+        response = self.get_client().messages.create(
+            model=model,
+            max_tokens=max_tokens,
+            messages=[{"role": "user", "content": prompt}],
+            timeout=timeout,
+        )
+        return response.content[0].text.strip(), getattr(response, 'usage', None)
+
+    def stream(self, model, prompt, max_tokens, timeout):
+        """Context manager for an open stream with ``text_stream`` (and ``get_final_message()``)"""
+        return self.get_client().messages.stream(
+            model=model,
+            max_tokens=max_tokens,
+            messages=[{"role": "user", "content": prompt}],
+            timeout=timeout,
+        )
+
+    async def acreate(self, model, prompt, max_tokens, timeout):
+        response = await self.get_async_client().messages.create(
+            model=model,
+            max_tokens=max_tokens,
+            messages=[{"role": "user", "content": prompt}],
+            timeout=timeout,
+        )
+        return response.content[0].text.strip(), getattr(response, 'usage', None)
+
+    def astream(self, model, prompt, max_tokens, timeout):
+        """Async context manager for an open stream with an async ``text_stream``"""
+        return self.get_async_client().messages.stream(
+            model=model,
+            max_tokens=max_tokens,
+            messages=[{"role": "user", "content": prompt}],
+            timeout=timeout,
+        )
+
+    def retryable(self, exc):
+        import anthropic
+        return isinstance(exc, anthropic.APIConnectionError) or _retryable_status(exc)
+
+
+class _FakeStream:
+    def __init__(self, backend, text):
+        self.backend = backend
+        self.text = text
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.backend.closed += 1
+
+    @property
+    def text_stream(self):
+        words = self.text.split(' ')
+        for i, word in enumerate(words):
+            if self.backend.token_delay:
+                time.sleep(self.backend.token_delay)
+            yield word if i == 0 else ' ' + word
+
+    def get_final_message(self):
+        return type('Message', (), {'usage': Usage(0, len(self.text.split()))})()
+
+
+class _FakeAsyncStream(_FakeStream):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.backend.closed += 1
+
+    @property
+    async def text_stream(self):
+        words = self.text.split(' ')
+        for i, word in enumerate(words):
+            if self.backend.token_delay:
+                await asyncio.sleep(self.backend.token_delay)
+            yield word if i == 0 else ' ' + word
+
+
+class FakeBackend:
+    """Answers locally: ``reply(prompt)`` returns the text, ``failures`` are raised first, in order"""
+
+    def __init__(self, reply=None, latency=0.0, token_delay=0.0):
+        self.reply = reply or (lambda prompt: 'Term: Definition' if 'flashcards' in prompt.lower()
+                               else 'Summary of the material.')
+        self.latency = latency
+        self.token_delay = token_delay
+        self.failures = []
+        self.calls = []
+        self.closed = 0
+        self._lock = threading.Lock()
+
+    def enabled(self):
+        return True
+
+    def _next_failure(self, prompt):
+        with self._lock:
+            self.calls.append(prompt)
+            return self.failures.pop(0) if self.failures else None
+
+    def _answer(self, prompt, timeout):
+        failure = self._next_failure(prompt)
+        if self.latency:
+            if timeout is not None and self.latency > timeout:
+                time.sleep(timeout)
+                raise TimeoutError('fake backend timed out')
+            time.sleep(self.latency)
+        if failure is not None:
+            raise failure
+        return self.reply(prompt)
+
+    async def _aanswer(self, prompt, timeout):
+        failure = self._next_failure(prompt)
+        if self.latency:
+            if timeout is not None and self.latency > timeout:
+                await asyncio.sleep(timeout)
+                raise TimeoutError('fake backend timed out')
+            await asyncio.sleep(self.latency)
+        if failure is not None:
+            raise failure
+        return self.reply(prompt)
+
+    def create(self, model, prompt, max_tokens, timeout):
+        text = self._answer(prompt, timeout)
+        return text, Usage(len(prompt.split()), len(text.split()))
+
+    def stream(self, model, prompt, max_tokens, timeout):
+        return _FakeStream(self, self._answer(prompt, timeout))
+
+    async def acreate(self, model, prompt, max_tokens, timeout):
+        text = await self._aanswer(prompt, timeout)
+        return text, Usage(len(prompt.split()), len(text.split()))
+
+    def astream(self, model, prompt, max_tokens, timeout):
+        backend = self
+
+        class Opening:
+            # The request is made on entry, as with the SDK's stream manager
+            async def __aenter__(self):
+                self.stream = _FakeAsyncStream(backend, await backend._aanswer(prompt, timeout))
+                return self.stream
+
+            async def __aexit__(self, *exc):
+                return await self.stream.__aexit__(*exc)
+
+        return Opening()
+
+    def retryable(self, exc):
+        return isinstance(exc, (TimeoutError, ConnectionError)) or _retryable_status(exc)
+
+
+def _retryable_status(exc):
+    status = getattr(exc, 'status_code', None)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def _retry_after(exc):
+    """Seconds from a ``retry-after`` hint on the error, if any"""
+    value = getattr(exc, 'retry_after', None)
+    if value is None:
+        headers = getattr(getattr(exc, 'response', None), 'headers', None)
+        value = headers.get('retry-after') if headers is not None else None
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class HostSemaphore:
+    """Counting semaphore shared by every process on the host, as one lock file per slot"""
+
+    def __init__(self, slots, directory=LLM_SLOTS_DIR):
+        self.slots = slots
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def try_acquire(self):
+        """Return an open lock file holding a free slot, or None if all are taken"""
+        start = random.randrange(self.slots)
+        for i in range(self.slots):
+            f = open(os.path.join(self.directory, f'slot-{(start + i) % self.slots}.lock'), 'w')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return f
+            except OSError:
+                f.close()
+        return None
+
+    def acquire(self, deadline):
+        """Return an open lock file holding a slot, or None if none freed up before ``deadline``"""
+        while True:
+            f = self.try_acquire()
+            if f is not None or time.monotonic() + SLOT_POLL_INTERVAL > deadline:
+                return f
+            time.sleep(SLOT_POLL_INTERVAL)
+
+    async def aacquire(self, deadline):
+        while True:
+            f = self.try_acquire()
+            if f is not None or time.monotonic() + SLOT_POLL_INTERVAL > deadline:
+                return f
+            await asyncio.sleep(SLOT_POLL_INTERVAL)
+
+    def release(self, f):
+        fcntl.flock(f, fcntl.LOCK_UN)
+        f.close()
+
+
+class LLMGateway:
+    def __init__(self, backend, model=AI_MODEL, max_concurrency=LLM_MAX_CONCURRENCY,
+                 async_max_concurrency=LLM_ASYNC_MAX_CONCURRENCY, global_concurrency=LLM_GLOBAL_CONCURRENCY,
+                 timeout=LLM_TIMEOUT, max_retries=LLM_MAX_RETRIES, retry_base=LLM_RETRY_BASE,
+                 retry_max=LLM_RETRY_MAX, breaker_threshold=LLM_BREAKER_THRESHOLD,
+                 breaker_cooldown=LLM_BREAKER_COOLDOWN, slots_dir=LLM_SLOTS_DIR):
+        self.backend = backend
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.async_max_concurrency = async_max_concurrency
+        # asyncio semaphores belong to one event loop
+        self._async_slots = weakref.WeakKeyDictionary()
+        self._host_slots = (HostSemaphore(global_concurrency, slots_dir)
+                            if global_concurrency > 0 and fcntl is not None else None)
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._counters = {'calls': 0, 'in_flight': 0, 'retries': 0, 'failures': 0, 'timeouts': 0,
+                          'rejected': 0, 'short_circuited': 0}
+
+    def enabled(self):
+        """Whether AI features are configured (an API key, or the fake backend)"""
+        return self.backend.enabled()
+
+    def check(self):
+        """Raise ``LLMUnavailable`` if the circuit is open, so callers can refuse work up front"""
+        with self._lock:
+            self._check_circuit(now=time.monotonic(), admit=False)
+
+    def complete(self, prompt, max_tokens, timeout=None):
+        """Return the model's text reply to ``prompt``"""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        with llm_call('create') as llm, self._admitted(deadline):
+            attempt = 0
+            while True:
+                try:
+                    text, llm.usage = self.backend.create(self.model, prompt, max_tokens, self._remaining(deadline))
+                    break
+                except LLMError:
+                    raise
+                except Exception as e:
+                    attempt = self._backoff(e, attempt, deadline, 'create')
+            return text
+
+    @contextmanager
+    def stream(self, prompt, max_tokens, timeout=None):
+        """Open a streamed reply; yields an iterator of text chunks.
+
+        Leaving the block closes the upstream request, e.g. when the client
+        disconnects partway through.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        with llm_call('stream') as llm, self._admitted(deadline):
+            attempt = 0
+            while True:
+                try:
+                    upstream = self.backend.stream(self.model, prompt, max_tokens, self._remaining(deadline))
+                    opened = upstream.__enter__()
+                    break
+                except LLMError:
+                    raise
+                except Exception as e:
+                    attempt = self._backoff(e, attempt, deadline, 'stream')
+            try:
+                yield self._chunks(opened, deadline, llm)
+            except BaseException as e:
+                if not upstream.__exit__(type(e), e, e.__traceback__):
+                    raise
+            else:
+                upstream.__exit__(None, None, None)
+
+    async def acomplete(self, prompt, max_tokens, timeout=None):
+        """Coroutine version of ``complete``"""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        with llm_call('create') as llm:
+            async with self._aadmitted(deadline):
+                attempt = 0
+                while True:
+                    try:
+                        text, llm.usage = await self.backend.acreate(self.model, prompt, max_tokens,
+                                                                     self._remaining(deadline))
+                        return text
+                    except LLMError:
+                        raise
+                    except Exception as e:
+                        await asyncio.sleep(self._retry_delay(e, attempt, deadline, 'create'))
+                        attempt += 1
+
+    @asynccontextmanager
+    async def astream(self, prompt, max_tokens, timeout=None):
+        """Coroutine version of ``stream``; yields an async iterator of text chunks"""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        with llm_call('stream') as llm:
+            async with self._aadmitted(deadline):
+                attempt = 0
+                while True:
+                    try:
+                        upstream = self.backend.astream(self.model, prompt, max_tokens, self._remaining(deadline))
+                        opened = await upstream.__aenter__()
+                        break
+                    except LLMError:
+                        raise
+                    except Exception as e:
+                        await asyncio.sleep(self._retry_delay(e, attempt, deadline, 'stream'))
+                        attempt += 1
+                try:
+                    yield self._achunks(opened, deadline, llm)
+                except BaseException as e:
+                    if not await upstream.__aexit__(type(e), e, e.__traceback__):
+                        raise
+                else:
+                    await upstream.__aexit__(None, None, None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters, consecutive_failures=self._consecutive_failures,
+                         circuit_open=int(self._opened_at is not None), max_concurrency=self.max_concurrency,
+                         async_max_concurrency=self.async_max_concurrency)
+        return stats
+
+    def reset(self):
+        """Close the circuit and forget failures"""
+        with self._lock:
+            self._consecutive_failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def _chunks(self, upstream, deadline, llm):
+        for text in upstream.text_stream:
+            if time.monotonic() > deadline:
+                raise LLMTimeout(f'AI response did not finish within {self.timeout:.0f}s')
+            yield text
+        if hasattr(upstream, 'get_final_message'):
+            llm.usage = upstream.get_final_message().usage
+
+    async def _achunks(self, upstream, deadline, llm):
+        async for text in upstream.text_stream:
+            if time.monotonic() > deadline:
+                raise LLMTimeout(f'AI response did not finish within {self.timeout:.0f}s')
+            yield text
+        if hasattr(upstream, 'get_final_message'):
+            message = upstream.get_final_message()
+            llm.usage = (await message if inspect.isawaitable(message) else message).usage
+
+    def _remaining(self, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LLMTimeout(f'AI request timed out after {self.timeout:.0f}s')
+        return remaining
+
+    def _backoff(self, exc, attempt, deadline, operation):
+        """Sleep before the next attempt, or re-raise ``exc`` if it can't be retried; returns the new attempt"""
+        time.sleep(self._retry_delay(exc, attempt, deadline, operation))
+        return attempt + 1
+
+    def _retry_delay(self, exc, attempt, deadline, operation):
+        """Seconds to wait before retrying after ``exc``, or re-raise it if it can't be retried"""
+        if not self.backend.retryable(exc):
+            raise exc
+        if time.monotonic() >= deadline:
+            raise LLMTimeout(f'AI request timed out after {self.timeout:.0f}s') from exc
+        if attempt >= self.max_retries:
+            raise exc
+        delay = random.uniform(0, min(self.retry_max, self.retry_base * 2 ** attempt))
+        hint = _retry_after(exc)
+        if hint is not None:
+            delay = max(delay, hint)
+        if time.monotonic() + delay >= deadline:
+            # No time left for another attempt
+            raise exc
+        LLM_RETRIES.inc(operation=operation)
+        with self._lock:
+            self._counters['retries'] += 1
+        return delay
+
+    @contextmanager
+    def _admitted(self, deadline):
+        """Hold a process slot (and a host slot) for one call, recording the outcome with the breaker"""
+        with self._lock:
+            self._check_circuit(now=time.monotonic(), admit=True)
+        if not self._slots.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            self._reject()
+        host_slot = None
+        try:
+            if self._host_slots is not None:
+                host_slot = self._host_slots.acquire(deadline)
+                if host_slot is None:
+                    self._reject()
+            with self._outcome():
+                yield
+        finally:
+            if host_slot is not None:
+                self._host_slots.release(host_slot)
+            self._slots.release()
+
+    @asynccontextmanager
+    async def _aadmitted(self, deadline):
+        with self._lock:
+            self._check_circuit(now=time.monotonic(), admit=True)
+        slots = self._async_slots.get(asyncio.get_running_loop())
+        if slots is None:
+            slots = self._async_slots[asyncio.get_running_loop()] = asyncio.Semaphore(self.async_max_concurrency)
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout=max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            self._reject()
+        host_slot = None
+        try:
+            if self._host_slots is not None:
+                host_slot = await self._host_slots.aacquire(deadline)
+                if host_slot is None:
+                    self._reject()
+            with self._outcome():
+                yield
+        finally:
+            if host_slot is not None:
+                self._host_slots.release(host_slot)
+            slots.release()
+
+    @contextmanager
+    def _outcome(self):
+        """Count one admitted call and feed its outcome to the breaker"""
+        with self._lock:
+            self._counters['calls'] += 1
+            self._counters['in_flight'] += 1
+        try:
+            yield
+        except (GeneratorExit, asyncio.CancelledError):
+            # The caller went away (client disconnect); says nothing about upstream health
+            with self._lock:
+                self._probing = False
+            raise
+        except Exception as e:
+            self._record(e)
+            raise
+        else:
+            self._record(None)
+        finally:
+            with self._lock:
+                self._counters['in_flight'] -= 1
+
+    def _reject(self):
+        with self._lock:
+            self._counters['rejected'] += 1
+            self._probing = False
+        raise LLMUnavailable('Too many AI requests in progress. Please try again shortly.')
+
+    def _check_circuit(self, now, admit):
+        if self._opened_at is None:
+            return
+        wait = self._opened_at + self.breaker_cooldown - now
+        if wait <= 0 and not self._probing:
+            if admit:
+                # Half-open: this call is the trial
+                self._probing = True
+            return
+        if admit:
+            self._counters['short_circuited'] += 1
+        raise LLMUnavailable(f'AI service is unavailable after {self._consecutive_failures} consecutive failures; '
+                             f'try again in {max(wait, 1):.0f}s.')
+
+    def _record(self, exc):
+        """Feed a finished call's outcome to the circuit breaker"""
+        with self._lock:
+            self._probing = False
+            if isinstance(exc, LLMUnavailable):
+                return
+            if exc is not None and (isinstance(exc, LLMTimeout) or self.backend.retryable(exc)):
+                self._counters['failures'] += 1
+                if isinstance(exc, LLMTimeout):
+                    self._counters['timeouts'] += 1
+                self._consecutive_failures += 1
+                if self._consecutive_failures >= self.breaker_threshold:
+                    self._opened_at = time.monotonic()
+                return
+            # Success, or an error that shows the service is up (e.g. 400)
+            self._consecutive_failures = 0
+            self._opened_at = None
+
+
+def backend_from_env(get_client, get_async_client=None):
+    """The backend named by ``LLM_BACKEND``; the callables supply the Anthropic SDK clients"""
+    if LLM_BACKEND == 'fake':
+        return FakeBackend()
+    return AnthropicBackend(get_client, get_async_client)
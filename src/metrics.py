@@ -0,0 +1,293 @@
+"""Request, SQL and LLM instrumentation.
+
+Histograms and counters live in process memory and are served in the
+Prometheus text format at ``/metrics`` (each gunicorn worker reports its own;
+scrape them per worker or sum in the query).
+
+- Requests: latency per route template, method and status, measured to the
+  end of the view (a streamed body's time is not included).
+- SQL: every cursor handed out by ``get_db_connection`` is a ``TimedCursor``;
+  statement durations go into a histogram by operation, are summed per
+  request (``Server-Timing`` header, access log), and statements slower than
+  ``SLOW_QUERY_MS`` are logged. Pool acquire time and new-connection setup
+  time are separate histograms, so connection overhead isn't mistaken for
+  query time.
+- LLM: ``llm_call`` times each Anthropic request and counts tokens and
+  errors.
+
+Logs are JSON lines when ``python-json-logger`` is installed.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, has_app_context, has_request_context, request
+
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LLM_BUCKETS = (0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SQL_OPERATIONS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'COPY', 'BEGIN')
+
+logger = logging.getLogger('studybuddy')
+access_log = logging.getLogger('studybuddy.access')
+sql_log = logging.getLogger('studybuddy.sql')
+llm_log = logging.getLogger('studybuddy.llm')
+
+_registry = []
+_gauges = []  # (prefix, help, fn returning a dict of numbers)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(name, '') for name in self.label_names), 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.label_names, key)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}  # labels -> [bucket counts..., count, sum]
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.label_names)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += 1
+            entry[-1] += value
+
+    def count(self, **labels):
+        entry = self._values.get(tuple(labels.get(name, '') for name in self.label_names))
+        return entry[-2] if entry else 0
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, entry in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, entry):
+                    lines.append(f'{self.name}_bucket{_labels(self.label_names, key, [("le", bound)])} {count}')
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, key, [("le", "+Inf")])} {entry[-2]}')
+                lines.append(f'{self.name}_count{_labels(self.label_names, key)} {entry[-2]}')
+                lines.append(f'{self.name}_sum{_labels(self.label_names, key)} {entry[-1]:.6f}')
+        return lines
+
+
+REQUEST_LATENCY = Histogram('studybuddy_http_request_duration_seconds', 'Time to produce a response',
+                            ('method', 'route', 'status'))
+REQUEST_QUERIES = Histogram('studybuddy_http_request_queries', 'SQL statements run per request', ('route',),
+                            buckets=COUNT_BUCKETS)
+REQUEST_DB_TIME = Histogram('studybuddy_http_request_db_seconds', 'Time spent in SQL per request', ('route',))
+QUERY_LATENCY = Histogram('studybuddy_db_query_duration_seconds', 'SQL statement latency', ('operation',))
+SLOW_QUERIES = Counter('studybuddy_db_slow_queries_total', 'SQL statements slower than SLOW_QUERY_MS', ('operation',))
+POOL_ACQUIRE = Histogram('studybuddy_db_pool_acquire_seconds', 'Time to get a connection from the pool')
+DB_CONNECT = Histogram('studybuddy_db_connect_seconds', 'Time to open a new database connection')
+LLM_LATENCY = Histogram('studybuddy_llm_request_duration_seconds', 'Anthropic request latency', ('operation',),
+                        buckets=LLM_BUCKETS)
+LLM_TOKENS = Counter('studybuddy_llm_tokens_total', 'Tokens sent to and received from Anthropic', ('direction',))
+LLM_ERRORS = Counter('studybuddy_llm_errors_total', 'Failed Anthropic requests', ('operation', 'error'))
+LLM_RETRIES = Counter('studybuddy_llm_retries_total', 'Anthropic requests retried after a 429/5xx or connection error',
+                      ('operation',))
+
+
+def register_gauges(prefix, help, fn):
+    """Expose the numeric values of ``fn()`` (a stats dict) as ``<prefix>_<key>`` gauges"""
+    _gauges.append((prefix, help, fn))
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    for prefix, help, fn in _gauges:
+        try:
+            stats = fn()
+        except Exception:
+            continue
+        for key, value in sorted(stats.items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            lines += [f'# HELP {prefix}_{key} {help}', f'# TYPE {prefix}_{key} gauge', f'{prefix}_{key} {value}']
+    return '\n'.join(lines) + '\n'
+
+
+def _operation(sql):
+    word = sql.lstrip().split(None, 1)[0].upper() if sql and sql.strip() else ''
+    return word if word in SQL_OPERATIONS else 'OTHER'
+
+
+def record_query(sql, seconds):
+    """Account one SQL statement to the histograms, the current request and the slow log"""
+    operation = _operation(sql)
+    QUERY_LATENCY.observe(seconds, operation=operation)
+    if has_app_context():
+        stats = g.get('_sql_stats')
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += seconds
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        SLOW_QUERIES.inc(operation=operation)
+        sql_log.warning('slow query', extra={
+            'duration_ms': round(seconds * 1000, 2),
+            'sql': ' '.join(sql.split())[:500],
+            'route': _route() if has_request_context() else None,
+        })
+
+
+class TimedCursor:
+    """DB-API cursor proxy that times execute/executemany/copy_expert"""
+
+    def __init__(self, cursor):
+        object.__setattr__(self, '_cursor', cursor)
+
+    def _timed(self, method, sql, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(sql, *args, **kwargs)
+        finally:
+            record_query(sql if isinstance(sql, str) else str(sql), time.perf_counter() - started)
+
+    def execute(self, sql, *args, **kwargs):
+        return self._timed(self._cursor.execute, sql, *args, **kwargs)
+
+    def executemany(self, sql, *args, **kwargs):
+        return self._timed(self._cursor.executemany, sql, *args, **kwargs)
+
+    def copy_expert(self, sql, *args, **kwargs):
+        return self._timed(self._cursor.copy_expert, sql, *args, **kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        # e.g. itersize on a psycopg2 named cursor
+        setattr(self._cursor, name, value)
+
+
+class _LLMCall:
+    usage = None
+
+
+@contextmanager
+def llm_call(operation):
+    """Time one Anthropic request; set ``.usage`` on the yielded object to count tokens"""
+    call = _LLMCall()
+    started = time.perf_counter()
+    try:
+        yield call
+    except (GeneratorExit, asyncio.CancelledError):
+        LLM_ERRORS.inc(operation=operation, error='cancelled')
+        raise
+    except Exception as e:
+        LLM_ERRORS.inc(operation=operation, error=type(e).__name__)
+        llm_log.warning('llm request failed', extra={'operation': operation, 'error': str(e)})
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        LLM_LATENCY.observe(seconds, operation=operation)
+        if call.usage is not None:
+            LLM_TOKENS.inc(getattr(call.usage, 'input_tokens', 0) or 0, direction='input')
+            LLM_TOKENS.inc(getattr(call.usage, 'output_tokens', 0) or 0, direction='output')
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def _before_request():
+    g._request_started = time.perf_counter()
+    g._sql_stats = [0, 0.0]
+
+
+def _after_request(response):
+    started = g.pop('_request_started', None)
+    if started is None:
+        return response
+    seconds = time.perf_counter() - started
+    route = _route()
+    queries, db_seconds = g.get('_sql_stats') or (0, 0.0)
+    REQUEST_LATENCY.observe(seconds, method=request.method, route=route, status=response.status_code)
+    REQUEST_QUERIES.observe(queries, route=route)
+    REQUEST_DB_TIME.observe(db_seconds, route=route)
+    response.headers['Server-Timing'] = (f'db;dur={db_seconds * 1000:.2f};desc="{queries} queries", '
+                                         f'app;dur={seconds * 1000:.2f}')
+    access_log.info('request', extra={
+        'method': request.method,
+        'path': request.path,
+        'route': route,
+        'status': response.status_code,
+        'duration_ms': round(seconds * 1000, 2),
+        'db_queries': queries,
+        'db_ms': round(db_seconds * 1000, 2),
+    })
+    return response
+
+
+def metrics_view():
+    return Response(render(), mimetype='text/plain; version=0.0.4')
+
+
+def configure_logging(level=LOG_LEVEL):
+    """Log JSON lines to stderr, unless the server has already configured logging"""
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    handler = logging.StreamHandler()
+    try:
+        from pythonjsonlogger import jsonlogger
+        handler.setFormatter(jsonlogger.JsonFormatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+    except ImportError:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
+def init_app(app):
+    """Time every request and serve ``/metrics``"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,574 @@
+"""Versioned schema migrations for SQLite and PostgreSQL.
+
+Each migration has a version number, a short name and the statements to run
+on each backend. Applied versions are recorded in ``schema_version``; running
+``migrate`` applies whatever is pending, in order, one transaction per step.
+
+Usage:
+    python src/migrations.py migrate   # apply pending migrations
+    python src/migrations.py status    # show applied / pending versions
+    python src/migrations.py explain   # print query plans for the hot queries
+    python src/migrations.py reconcile # rebuild the per-topic note and flashcard counts
+"""
+import sys
+from collections import namedtuple
+
+from database import USE_POSTGRES, get_db_connection
+
+Migration = namedtuple('Migration', 'version name sqlite postgres')
+
+# Portable DDL shared by both backends
+QUIZ_SESSION_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS quiz_sessions (
+        id TEXT PRIMARY KEY,
+        topic_id INTEGER NOT NULL,
+        total INTEGER NOT NULL,
+        score INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        submitted_at TIMESTAMP,
+        FOREIGN KEY(topic_id) REFERENCES topics(id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS quiz_answers (
+        session_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        card_id INTEGER NOT NULL,
+        term TEXT NOT NULL,
+        expected TEXT NOT NULL,
+        answer TEXT,
+        correct INTEGER,
+        PRIMARY KEY (session_id, position),
+        FOREIGN KEY(session_id) REFERENCES quiz_sessions(id) ON DELETE CASCADE
+    )
+    """,
+    'CREATE INDEX IF NOT EXISTS idx_quiz_sessions_topic ON quiz_sessions (topic_id, created_at)',
+]
+
+
+# Normalized definition tokens, computed at insert time (see grading.py)
+GRADING_TOKENS_DDL = [
+    'ALTER TABLE flashcards ADD COLUMN definition_tokens TEXT',
+    'ALTER TABLE quiz_answers ADD COLUMN expected_tokens TEXT',
+]
+
+# Counters other workers poll to learn that a cached table changed (see topic_cache.py)
+CACHE_VERSIONS_DDL = [
+    'CREATE TABLE IF NOT EXISTS cache_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)',
+    "INSERT INTO cache_versions (name, version) VALUES ('topics', 0)",
+]
+
+# FTS5 tables index the base tables as external content; triggers keep them in sync
+SQLITE_FTS_DDL = [
+    "CREATE VIRTUAL TABLE notes_fts USING fts5(content, topic_id UNINDEXED, content='notes', content_rowid='id')",
+    """
+    CREATE TRIGGER notes_fts_insert AFTER INSERT ON notes BEGIN
+        INSERT INTO notes_fts (rowid, content, topic_id) VALUES (new.id, new.content, new.topic_id);
+    END
+    """,
+    """
+    CREATE TRIGGER notes_fts_delete AFTER DELETE ON notes BEGIN
+        INSERT INTO notes_fts (notes_fts, rowid, content, topic_id) VALUES ('delete', old.id, old.content, old.topic_id);
+    END
+    """,
+    """
+    CREATE TRIGGER notes_fts_update AFTER UPDATE ON notes BEGIN
+        INSERT INTO notes_fts (notes_fts, rowid, content, topic_id) VALUES ('delete', old.id, old.content, old.topic_id);
+        INSERT INTO notes_fts (rowid, content, topic_id) VALUES (new.id, new.content, new.topic_id);
+    END
+    """,
+    "INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')",
+    """
+    CREATE VIRTUAL TABLE flashcards_fts USING fts5(
+        term, definition, topic_id UNINDEXED, content='flashcards', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER flashcards_fts_insert AFTER INSERT ON flashcards BEGIN
+        INSERT INTO flashcards_fts (rowid, term, definition, topic_id)
+        VALUES (new.id, new.term, new.definition, new.topic_id);
+    END
+    """,
+    """
+    CREATE TRIGGER flashcards_fts_delete AFTER DELETE ON flashcards BEGIN
+        INSERT INTO flashcards_fts (flashcards_fts, rowid, term, definition, topic_id)
+        VALUES ('delete', old.id, old.term, old.definition, old.topic_id);
+    END
+    """,
+    """
+    CREATE TRIGGER flashcards_fts_update AFTER UPDATE OF term, definition, topic_id ON flashcards BEGIN
+        INSERT INTO flashcards_fts (flashcards_fts, rowid, term, definition, topic_id)
+        VALUES ('delete', old.id, old.term, old.definition, old.topic_id);
+        INSERT INTO flashcards_fts (rowid, term, definition, topic_id)
+        VALUES (new.id, new.term, new.definition, new.topic_id);
+    END
+    """,
+    "INSERT INTO flashcards_fts (flashcards_fts) VALUES ('rebuild')",
+]
+
+# Generated tsvector columns need no triggers; terms weigh more than definitions
+POSTGRES_FTS_DDL = [
+    """
+    ALTER TABLE notes ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('english', content)) STORED
+    """,
+    'CREATE INDEX IF NOT EXISTS idx_notes_search ON notes USING GIN (search_vector)',
+    """
+    ALTER TABLE flashcards ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', term), 'A') || setweight(to_tsvector('english', definition), 'B')
+        ) STORED
+    """,
+    'CREATE INDEX IF NOT EXISTS idx_flashcards_search ON flashcards USING GIN (search_vector)',
+]
+
+
+# SM-2 review state; new cards (due_at = 0) are due immediately
+def _review_state_ddl(real):
+    return [
+        f'ALTER TABLE flashcards ADD COLUMN ease {real} NOT NULL DEFAULT 2.5',
+        'ALTER TABLE flashcards ADD COLUMN interval_days INTEGER NOT NULL DEFAULT 0',
+        'ALTER TABLE flashcards ADD COLUMN repetitions INTEGER NOT NULL DEFAULT 0',
+        f'ALTER TABLE flashcards ADD COLUMN due_at {real} NOT NULL DEFAULT 0',
+        'CREATE INDEX IF NOT EXISTS idx_flashcards_due ON flashcards (topic_id, due_at)',
+    ]
+
+
+# Per-topic change counter for conditional GETs (see conditional.py). Every note or
+# flashcard write bumps its topic; schedule-only flashcard updates don't.
+_VERSIONED_CONTENT = {'notes': 'content, topic_id', 'flashcards': 'term, definition, topic_id'}
+_SQLITE_NOW = "(julianday('now') - 2440587.5) * 86400.0"
+
+
+def _topic_version_sqlite_ddl():
+    bump = f'UPDATE topics SET content_version = content_version + 1, content_modified_at = {_SQLITE_NOW}'
+    ddl = [
+        'ALTER TABLE topics ADD COLUMN content_version INTEGER NOT NULL DEFAULT 0',
+        'ALTER TABLE topics ADD COLUMN content_modified_at REAL NOT NULL DEFAULT 0',
+    ]
+    for table, columns in _VERSIONED_CONTENT.items():
+        ddl += [
+            f'CREATE TRIGGER {table}_version_insert AFTER INSERT ON {table} BEGIN {bump} WHERE id = new.topic_id; END',
+            f'CREATE TRIGGER {table}_version_delete AFTER DELETE ON {table} BEGIN {bump} WHERE id = old.topic_id; END',
+            f'CREATE TRIGGER {table}_version_update AFTER UPDATE OF {columns} ON {table} BEGIN'
+            f' {bump} WHERE id IN (old.topic_id, new.topic_id); END',
+        ]
+    return ddl
+
+
+def _topic_version_postgres_ddl():
+    bump = 'UPDATE topics SET content_version = content_version + 1, content_modified_at = extract(epoch from now())'
+    ddl = [
+        'ALTER TABLE topics ADD COLUMN content_version INTEGER NOT NULL DEFAULT 0',
+        'ALTER TABLE topics ADD COLUMN content_modified_at DOUBLE PRECISION NOT NULL DEFAULT 0',
+        # Statement-level for inserts and deletes, so a COPY of many rows bumps each topic once
+        f"""
+        CREATE OR REPLACE FUNCTION bump_topic_version_inserted() RETURNS trigger AS $$
+        BEGIN
+            {bump} WHERE id IN (SELECT DISTINCT topic_id FROM new_rows);
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql
+        """,
+        f"""
+        CREATE OR REPLACE FUNCTION bump_topic_version_deleted() RETURNS trigger AS $$
+        BEGIN
+            {bump} WHERE id IN (SELECT DISTINCT topic_id FROM old_rows);
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql
+        """,
+        f"""
+        CREATE OR REPLACE FUNCTION bump_topic_version_updated() RETURNS trigger AS $$
+        BEGIN
+            {bump} WHERE id IN (OLD.topic_id, NEW.topic_id);
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql
+        """,
+    ]
+    for table, columns in _VERSIONED_CONTENT.items():
+        ddl += [
+            f'CREATE TRIGGER {table}_version_insert AFTER INSERT ON {table} REFERENCING NEW TABLE AS new_rows'
+            ' FOR EACH STATEMENT EXECUTE FUNCTION bump_topic_version_inserted()',
+            f'CREATE TRIGGER {table}_version_delete AFTER DELETE ON {table} REFERENCING OLD TABLE AS old_rows'
+            ' FOR EACH STATEMENT EXECUTE FUNCTION bump_topic_version_deleted()',
+            f'CREATE TRIGGER {table}_version_update AFTER UPDATE OF {columns} ON {table}'
+            ' FOR EACH ROW EXECUTE FUNCTION bump_topic_version_updated()',
+        ]
+    return ddl
+
+
+# Per-topic note and flashcard counts, kept by the content-version triggers above
+# (folded into the same UPDATE of the topic row), so topic pages read them from
+# the row instead of counting. content_modified_at is the topic's last-modified
+# time. ``reconcile_counts`` rebuilds the counts.
+_NOTES_COUNT = '(SELECT COUNT(*) FROM notes n WHERE n.topic_id = topics.id)'
+_FLASHCARDS_COUNT = '(SELECT COUNT(*) FROM flashcards f WHERE f.topic_id = topics.id)'
+RECOUNT_SQL = f'UPDATE topics SET notes_count = {_NOTES_COUNT}, flashcards_count = {_FLASHCARDS_COUNT}'
+_TOPIC_COUNTS_DDL = [
+    'ALTER TABLE topics ADD COLUMN notes_count INTEGER NOT NULL DEFAULT 0',
+    'ALTER TABLE topics ADD COLUMN flashcards_count INTEGER NOT NULL DEFAULT 0',
+    RECOUNT_SQL,
+]
+
+
+# One counter for "some topic's content changed", bumped by the same triggers, so the
+# topic list's version is two primary-key reads instead of a SUM over every topic
+TOPIC_CONTENT_VERSION = 'topic_content'
+_BUMP_TOPIC_CONTENT = f"UPDATE cache_versions SET version = version + 1 WHERE name = '{TOPIC_CONTENT_VERSION}';"
+_TOPIC_CONTENT_SEED = (f"INSERT INTO cache_versions (name, version)"
+                       f" SELECT '{TOPIC_CONTENT_VERSION}', COALESCE(SUM(content_version), 0) FROM topics")
+
+
+def _topic_counts_sqlite_ddl():
+    return list(_TOPIC_COUNTS_DDL) + _topic_counts_sqlite_triggers()
+
+
+def _topic_counts_sqlite_triggers(also=''):
+    """The content triggers with counts; ``also`` is a statement (with its ``;``) each one runs too"""
+    bump = f'UPDATE topics SET content_version = content_version + 1, content_modified_at = {_SQLITE_NOW}'
+    ddl = []
+    for table, columns in _VERSIONED_CONTENT.items():
+        count = f'{table}_count'
+        ddl += [
+            f'DROP TRIGGER {table}_version_insert',
+            f'DROP TRIGGER {table}_version_delete',
+            f'DROP TRIGGER {table}_version_update',
+            f'CREATE TRIGGER {table}_version_insert AFTER INSERT ON {table} BEGIN'
+            f' {bump}, {count} = {count} + 1 WHERE id = new.topic_id; {also} END',
+            f'CREATE TRIGGER {table}_version_delete AFTER DELETE ON {table} BEGIN'
+            f' {bump}, {count} = {count} - 1 WHERE id = old.topic_id; {also} END',
+            # Moving a row to another topic moves its count; an edit in place nets to zero
+            f'CREATE TRIGGER {table}_version_update AFTER UPDATE OF {columns} ON {table} BEGIN'
+            f' {bump}, {count} = {count} + (id = new.topic_id) - (id = old.topic_id)'
+            f' WHERE id IN (old.topic_id, new.topic_id); {also} END',
+        ]
+    return ddl
+
+
+def _per_table(statement):
+    """plpgsql running ``statement`` with ``{count}`` set to the firing table's count column"""
+    notes, flashcards = (statement.format(count=f'{table}_count') for table in _VERSIONED_CONTENT)
+    return f"IF TG_TABLE_NAME = 'notes' THEN {notes}; ELSE {flashcards}; END IF;"
+
+
+def _topic_counts_postgres_ddl():
+    return list(_TOPIC_COUNTS_DDL) + _topic_counts_postgres_functions()
+
+
+def _topic_counts_postgres_functions(also=''):
+    # Replacing the trigger functions is enough: the triggers already call them
+    bump = ('UPDATE topics SET content_version = content_version + 1,'
+            ' content_modified_at = extract(epoch from now())')
+    changed = ('{bump}, {{count}} = {{count}} {sign} d.n'
+               ' FROM (SELECT topic_id, COUNT(*) AS n FROM {rows} GROUP BY topic_id) d WHERE topics.id = d.topic_id')
+    return [
+        f"""
+        CREATE OR REPLACE FUNCTION bump_topic_version_inserted() RETURNS trigger AS $$
+        BEGIN
+            {_per_table(changed.format(bump=bump, sign='+', rows='new_rows'))}
+            {also}
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql
+        """,
+        f"""
+        CREATE OR REPLACE FUNCTION bump_topic_version_deleted() RETURNS trigger AS $$
+        BEGIN
+            {_per_table(changed.format(bump=bump, sign='-', rows='old_rows'))}
+            {also}
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql
+        """,
+        f"""
+        CREATE OR REPLACE FUNCTION bump_topic_version_updated() RETURNS trigger AS $$
+        BEGIN
+            {_per_table(bump + ', {count} = {count} + (id = NEW.topic_id)::int - (id = OLD.topic_id)::int'
+                        ' WHERE id IN (OLD.topic_id, NEW.topic_id)')}
+            {also}
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql
+        """,
+    ]
+
+
+def _ai_jobs_ddl(real):
+    return [
+        f"""
+        CREATE TABLE IF NOT EXISTS ai_jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            topic_id INTEGER,
+            status TEXT NOT NULL,
+            progress TEXT,
+            payload TEXT,
+            result TEXT,
+            error TEXT,
+            created_at {real} NOT NULL,
+            started_at {real},
+            finished_at {real}
+        )
+        """,
+        'CREATE INDEX IF NOT EXISTS idx_ai_jobs_status ON ai_jobs (status, created_at)',
+    ]
+
+
+MIGRATIONS = [
+    Migration(1, 'base schema', sqlite=[
+        """
+        CREATE TABLE IF NOT EXISTS topics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            description TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS notes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            topic_id INTEGER NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(topic_id) REFERENCES topics(id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS flashcards (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            topic_id INTEGER NOT NULL,
+            term TEXT NOT NULL,
+            definition TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(topic_id) REFERENCES topics(id) ON DELETE CASCADE
+        )
+        """,
+    ], postgres=[
+        """
+        CREATE TABLE IF NOT EXISTS topics (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            description TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS notes (
+            id SERIAL PRIMARY KEY,
+            topic_id INTEGER NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(topic_id) REFERENCES topics(id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS flashcards (
+            id SERIAL PRIMARY KEY,
+            topic_id INTEGER NOT NULL,
+            term TEXT NOT NULL,
+            definition TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(topic_id) REFERENCES topics(id) ON DELETE CASCADE
+        )
+        """,
+    ]),
+    # (topic_id, id) serves every per-topic listing (WHERE topic_id = ? ORDER BY id DESC),
+    # the quiz draw and the per-topic COUNT(*) queries, and backs the ON DELETE CASCADE lookups.
+    Migration(2, 'topic indexes on notes and flashcards', sqlite=[
+        'CREATE INDEX IF NOT EXISTS idx_notes_topic_id ON notes (topic_id, id)',
+        'CREATE INDEX IF NOT EXISTS idx_flashcards_topic_id ON flashcards (topic_id, id)',
+    ], postgres=[
+        'CREATE INDEX IF NOT EXISTS idx_notes_topic_id ON notes (topic_id, id)',
+        'CREATE INDEX IF NOT EXISTS idx_flashcards_topic_id ON flashcards (topic_id, id)',
+    ]),
+    Migration(3, 'quiz sessions', sqlite=QUIZ_SESSION_DDL, postgres=QUIZ_SESSION_DDL),
+    Migration(4, 'stored answer tokens', sqlite=GRADING_TOKENS_DDL, postgres=GRADING_TOKENS_DDL),
+    Migration(5, 'AI response cache', sqlite=[
+        """
+        CREATE TABLE IF NOT EXISTS ai_response_cache (
+            key TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        'CREATE INDEX IF NOT EXISTS idx_ai_response_cache_last_used ON ai_response_cache (last_used)',
+    ], postgres=[
+        """
+        CREATE TABLE IF NOT EXISTS ai_response_cache (
+            key TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            created_at DOUBLE PRECISION NOT NULL,
+            last_used DOUBLE PRECISION NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        'CREATE INDEX IF NOT EXISTS idx_ai_response_cache_last_used ON ai_response_cache (last_used)',
+    ]),
+    Migration(6, 'background AI jobs', sqlite=_ai_jobs_ddl('REAL'), postgres=_ai_jobs_ddl('DOUBLE PRECISION')),
+    Migration(7, 'full-text search', sqlite=SQLITE_FTS_DDL, postgres=POSTGRES_FTS_DDL),
+    Migration(8, 'spaced-repetition schedule', sqlite=_review_state_ddl('REAL'),
+              postgres=_review_state_ddl('DOUBLE PRECISION')),
+    Migration(9, 'cache version counters', sqlite=CACHE_VERSIONS_DDL, postgres=CACHE_VERSIONS_DDL),
+    Migration(10, 'topic content versions', sqlite=_topic_version_sqlite_ddl(), postgres=_topic_version_postgres_ddl()),
+    Migration(11, 'topic content counts', sqlite=_topic_counts_sqlite_ddl(), postgres=_topic_counts_postgres_ddl()),
+    # Tokens stored before normalization kept non-Latin text dropped it; cleared tokens
+    # are re-derived from the definition at grading time (see grading.grade_batch)
+    Migration(12, 'retokenize non-ASCII definitions', sqlite=[
+        "UPDATE flashcards SET definition_tokens = NULL WHERE definition GLOB '*[^ -~]*'",
+        "UPDATE quiz_answers SET expected_tokens = NULL WHERE expected GLOB '*[^ -~]*'",
+    ], postgres=[
+        "UPDATE flashcards SET definition_tokens = NULL WHERE definition ~ '[^[:ascii:]]'",
+        "UPDATE quiz_answers SET expected_tokens = NULL WHERE expected ~ '[^[:ascii:]]'",
+    ]),
+    Migration(13, 'topic content version counter',
+              sqlite=[_TOPIC_CONTENT_SEED] + _topic_counts_sqlite_triggers(also=_BUMP_TOPIC_CONTENT),
+              postgres=[_TOPIC_CONTENT_SEED] + _topic_counts_postgres_functions(also=_BUMP_TOPIC_CONTENT)),
+]
+
+# Hot queries and sample parameters, used by ``explain``
+HOT_QUERIES = {
+    'topic list with counts': (
+        'SELECT t.id, t.name, t.description, t.notes_count, t.flashcards_count'
+        ' FROM topics t WHERE (t.name, t.id) > (?, ?) ORDER BY t.name ASC, t.id ASC LIMIT ?', ('General', 1, 25)),
+    'default topic lookup': ('SELECT id, name, description FROM topics WHERE name = ?', ('General',)),
+    'topic cache version': ('SELECT version FROM cache_versions WHERE name = ?', ('topics',)),
+    'topic list version': ('SELECT version FROM cache_versions WHERE name = ?', (TOPIC_CONTENT_VERSION,)),
+    'notes page': ('SELECT id, content, created_at FROM notes WHERE topic_id = ? AND id < ? ORDER BY id DESC LIMIT ?',
+                   (1, 1000, 51)),
+    'flashcards page': ('SELECT id, term, definition, created_at FROM flashcards'
+                        ' WHERE topic_id = ? AND id < ? ORDER BY id DESC LIMIT ?', (1, 1000, 51)),
+    'quiz card fetch': ('SELECT id, topic_id, term, definition FROM flashcards WHERE topic_id = ? AND id IN (?, ?, ?)',
+                        (1, 1, 2, 3)),
+    'quiz due cards': ('SELECT id, topic_id, term, definition, definition_tokens FROM flashcards'
+                       ' WHERE topic_id = ? AND due_at <= ? ORDER BY due_at LIMIT ?', (1, 1e12, 10)),
+    'notes count': ('SELECT COUNT(*) FROM notes WHERE topic_id = ?', (1,)),
+    'flashcards count': ('SELECT COUNT(*) FROM flashcards WHERE topic_id = ?', (1,)),
+}
+
+
+def _sql(statement):
+    """Translate ``?`` placeholders for the active backend"""
+    return statement.replace('?', '%s') if USE_POSTGRES else statement
+
+
+def _ensure_version_table(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def applied_versions(conn):
+    c = conn.cursor()
+    _ensure_version_table(c)
+    conn.commit()
+    c.execute('SELECT version FROM schema_version ORDER BY version')
+    return [row[0] for row in c.fetchall()]
+
+
+def _lock(c):
+    """Serialize concurrent migrators (several workers booting at once)"""
+    if USE_POSTGRES:
+        c.execute('SELECT pg_advisory_xact_lock(%s)', (0x5B0D1,))
+    else:
+        c.execute('BEGIN IMMEDIATE')
+
+
+def migrate(conn, target=None):
+    """Apply pending migrations up to ``target`` (default: latest). Returns applied versions."""
+    c = conn.cursor()
+    _ensure_version_table(c)
+    conn.commit()
+    applied = []
+    for migration in MIGRATIONS:
+        if target is not None and migration.version > target:
+            break
+        try:
+            _lock(c)
+            c.execute(_sql('SELECT 1 FROM schema_version WHERE version = ?'), (migration.version,))
+            if c.fetchone():
+                conn.rollback()
+                continue
+            for statement in (migration.postgres if USE_POSTGRES else migration.sqlite):
+                c.execute(statement)
+            c.execute(_sql('INSERT INTO schema_version (version, name) VALUES (?, ?)'),
+                      (migration.version, migration.name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(migration.version)
+    return applied
+
+
+def reconcile_counts(conn):
+    """Recount every topic's notes and flashcards, bumping the content version of those that had drifted.
+
+    Returns how many topics had drifted.
+    """
+    c = conn.cursor()
+    try:
+        if USE_POSTGRES:
+            # Hold writers off so nothing lands between counting and storing
+            c.execute('LOCK TABLE notes, flashcards IN SHARE MODE')
+        else:
+            c.execute('BEGIN IMMEDIATE')
+        # Repaired topics get a new content version, so pages showing the old counts get new ETags
+        c.execute(RECOUNT_SQL + ', content_version = content_version + 1'
+                  f' WHERE notes_count <> {_NOTES_COUNT} OR flashcards_count <> {_FLASHCARDS_COUNT}')
+        fixed = c.rowcount
+        if fixed:
+            # Cached topic grids show the counts
+            c.execute("UPDATE cache_versions SET version = version + 1 WHERE name = 'topics'")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return fixed
+
+
+def explain(conn, queries=None):
+    """Return ``{name: [plan lines]}`` for each hot query"""
+    c = conn.cursor()
+    plans = {}
+    for name, (statement, params) in (queries or HOT_QUERIES).items():
+        if USE_POSTGRES:
+            c.execute('EXPLAIN ' + _sql(statement), params)
+            plans[name] = [row[0] for row in c.fetchall()]
+        else:
+            c.execute('EXPLAIN QUERY PLAN ' + statement, params)
+            plans[name] = [row[-1] for row in c.fetchall()]
+    conn.rollback()
+    return plans
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else 'migrate'
+    conn = get_db_connection()
+    try:
+        if command == 'migrate':
+            applied = migrate(conn)
+            print(f"Applied migrations: {applied}" if applied else "Schema is up to date")
+        elif command == 'status':
+            done = set(applied_versions(conn))
+            for migration in MIGRATIONS:
+                state = 'applied' if migration.version in done else 'pending'
+                print(f"{migration.version:>4}  {state:<8} {migration.name}")
+        elif command == 'reconcile':
+            print(f"Recounted {reconcile_counts(conn)} topics")
+        elif command == 'explain':
+            for name, plan in explain(conn).items():
+                print(f"== {name}")
+                for line in plan:
+                    print(f"   {line}")
+        else:
+            print(__doc__)
+            return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
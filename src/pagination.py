@@ -0,0 +1,92 @@
+"""Keyset (cursor) pagination for per-topic listings.
+
+Pages are walked newest-first on ``id``: each page is an index range scan on
+``(topic_id, id)`` that starts just below the last id of the previous page,
+so page 1,000 costs the same as page 1. The topic list pages the same way on
+its own sort keys, with ``encode_name_cursor`` for the name orderings.
+"""
+import base64
+import binascii
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor token cannot be decoded"""
+
+
+def _encode(raw):
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _decode(token, prefix):
+    """The value part of a ``prefix:value`` token"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        found, value = raw.split(':', 1)
+        if found != prefix:
+            raise ValueError(found)
+        return value
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise InvalidCursor(f"Invalid cursor: {token!r}") from e
+
+
+def encode_cursor(last_id):
+    """Opaque, URL-safe token for the page after ``last_id``"""
+    return _encode(f'id:{last_id}')
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    value = _decode(token, 'id')
+    try:
+        return int(value)
+    except ValueError as e:
+        raise InvalidCursor(f"Invalid cursor: {token!r}") from e
+
+
+def encode_name_cursor(name, last_id):
+    """Token for the page after ``(name, last_id)`` in a listing ordered by name, then id"""
+    return _encode(f'name:{last_id}:{name}')
+
+
+def decode_name_cursor(token):
+    """``(name, id)`` from an ``encode_name_cursor`` token, or None"""
+    if not token:
+        return None
+    last_id, sep, name = _decode(token, 'name').partition(':')
+    try:
+        if not sep:
+            raise ValueError(token)
+        return name, int(last_id)
+    except ValueError as e:
+        raise InvalidCursor(f"Invalid cursor: {token!r}") from e
+
+
+def page_size(value):
+    """Clamp a requested page size to [1, MAX_PAGE_SIZE]"""
+    if value is None:
+        return DEFAULT_PAGE_SIZE
+    return min(max(value, 1), MAX_PAGE_SIZE)
+
+
+def fetch_page(cursor, table, columns, topic_id, after=None, limit=DEFAULT_PAGE_SIZE):
+    """Fetch one newest-first page of ``table`` rows for a topic.
+
+    ``columns`` must start with ``id``. Returns ``(rows, next_cursor)`` where
+    ``next_cursor`` is None on the last page.
+    """
+    sql = f'SELECT {columns} FROM {table} WHERE topic_id = ?'
+    params = [topic_id]
+    if after is not None:
+        sql += ' AND id < ?'
+        params.append(after)
+    # One extra row tells us whether another page exists
+    sql += ' ORDER BY id DESC LIMIT ?'
+    params.append(limit + 1)
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+    next_cursor = encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
@@ -0,0 +1,98 @@
+"""Server-side quiz sessions.
+
+A session is created when a quiz is drawn. It records which cards were asked
+and snapshots their definitions, so grading reads only those rows (one query
+on the session's primary key) and is unaffected by cards edited or deleted
+between GET and POST. Submitted answers and the score stay in the database
+for later analytics, and each graded card is rescheduled (see ``scheduler``).
+A submission without a live session is scored but reschedules nothing.
+"""
+import secrets
+
+from grading import definition_tokens, grade_batch
+from scheduler import QUIZ_SIZE, record_reviews
+
+
+def create_session(c, topic_id, cards):
+    """Record a drawn quiz; ``cards`` are (id, topic_id, term, definition, definition_tokens) rows.
+
+    Returns the session id.
+    """
+    session_id = secrets.token_urlsafe(16)
+    c.execute('INSERT INTO quiz_sessions (id, topic_id, total) VALUES (?, ?, ?)',
+              (session_id, topic_id, len(cards)))
+    c.executemany('INSERT INTO quiz_answers (session_id, position, card_id, term, expected, expected_tokens)'
+                  ' VALUES (?, ?, ?, ?, ?, ?)',
+                  [(session_id, pos, card[0], card[2], card[3], card[4] or definition_tokens(card[3]))
+                   for pos, card in enumerate(cards)])
+    return session_id
+
+
+def load_session(c, session_id):
+    """Return the session with its cards in draw order, or None if it doesn't exist"""
+    if not session_id:
+        return None
+    c.execute('SELECT id, topic_id, score, total, submitted_at FROM quiz_sessions WHERE id = ?', (session_id,))
+    row = c.fetchone()
+    if not row:
+        return None
+    c.execute('SELECT card_id, term, expected, answer, correct, expected_tokens FROM quiz_answers'
+              ' WHERE session_id = ? ORDER BY position', (session_id,))
+    return {
+        'id': row[0],
+        'topic_id': row[1],
+        'score': row[2],
+        'total': row[3],
+        'submitted': row[4] is not None,
+        'cards': c.fetchall(),
+    }
+
+
+def grade_session(c, session, form):
+    """Grade a submission against the session snapshot and persist the results.
+
+    Already-submitted sessions are not re-graded. The session is claimed first
+    and the answers and reviews are written only by the submit that claimed
+    it, in the caller's transaction. Returns the score.
+    """
+    if session['submitted']:
+        return session['score']
+    answers = [form.get(str(card[0]), '') for card in session['cards']]
+    graded = grade_batch([(answer, card[5], card[2]) for answer, card in zip(answers, session['cards'])])
+    score = sum(correct for correct, _ in graded)
+    c.execute('UPDATE quiz_sessions SET score = ?, submitted_at = CURRENT_TIMESTAMP WHERE id = ? AND submitted_at IS NULL',
+              (score, session['id']))
+    if c.rowcount != 1:
+        # A concurrent submit got there first; its answers and score stand
+        c.execute('SELECT score FROM quiz_sessions WHERE id = ?', (session['id'],))
+        return c.fetchone()[0]
+    results = [(answer, int(correct), session['id'], pos)
+               for pos, (answer, (correct, _)) in enumerate(zip(answers, graded))]
+    c.executemany('UPDATE quiz_answers SET answer = ?, correct = ? WHERE session_id = ? AND position = ?', results)
+    record_reviews(c, [(card[0], correct, similarity)
+                       for card, (correct, similarity) in zip(session['cards'], graded)])
+    return score
+
+
+def grade_cards(c, topic_id, form):
+    """Grade a submission that has no session by fetching only the submitted card ids.
+
+    Nothing is written: without a session the card ids are whatever the client
+    posted, so only ``grade_session`` reschedules cards. Returns ``(score, cards)``.
+    """
+    # Card id -> the form key it was submitted under ("007" is card 7); no more ids than a quiz has
+    keys = {}
+    for key in form:
+        if key.isascii() and key.isdecimal():
+            keys.setdefault(int(key), key)
+            if len(keys) == QUIZ_SIZE:
+                break
+    if not keys:
+        return 0, []
+    card_ids = list(keys)
+    placeholders = ','.join('?' * len(card_ids))
+    c.execute(f'SELECT id, topic_id, term, definition, definition_tokens FROM flashcards'
+              f' WHERE topic_id = ? AND id IN ({placeholders})', [topic_id] + card_ids)
+    cards = c.fetchall()
+    graded = grade_batch([(form[keys[card[0]]], card[4], card[3]) for card in cards])
+    return sum(correct for correct, _ in graded), cards
@@ -0,0 +1,72 @@
+"""SM-2 spaced-repetition scheduling for flashcards.
+
+Each card carries ``ease``, ``interval_days``, ``repetitions`` and ``due_at``
+(epoch seconds). The quiz draws the cards that are due now, oldest first,
+with a range scan on the ``(topic_id, due_at)`` index; when fewer than a
+quiz's worth are due it tops up with the cards coming due soonest. Grading a
+submission reschedules every card in it with one batched UPDATE.
+"""
+import time
+
+QUIZ_SIZE = 10
+CARD_COLUMNS = 'id, topic_id, term, definition, definition_tokens'
+DAY = 86400
+MIN_EASE = 1.3
+
+
+def quality(correct, score):
+    """Map a graded answer to an SM-2 quality from 1 (blank) to 5 (near-exact)"""
+    if correct:
+        return 5 if score >= 0.9 else 4 if score >= 0.7 else 3
+    return 2 if score >= 0.25 else 1
+
+
+def sm2(ease, interval_days, repetitions, q):
+    """Return the next ``(ease, interval_days, repetitions)`` after a review of quality ``q``"""
+    ease = max(MIN_EASE, ease + 0.1 - (5 - q) * (0.08 + (5 - q) * 0.02))
+    if q < 3:
+        return ease, 1, 0
+    repetitions += 1
+    if repetitions == 1:
+        interval_days = 1
+    elif repetitions == 2:
+        interval_days = 6
+    else:
+        interval_days = max(1, round(interval_days * ease))
+    return ease, interval_days, repetitions
+
+
+def due_cards(c, topic_id, n=QUIZ_SIZE, now=None, columns=CARD_COLUMNS):
+    """Up to ``n`` cards for a quiz: due ones first (most overdue first), then the next to come due"""
+    now = time.time() if now is None else now
+    c.execute(f'SELECT {columns} FROM flashcards WHERE topic_id = ? AND due_at <= ? ORDER BY due_at LIMIT ?',
+              (topic_id, now, n))
+    cards = c.fetchall()
+    if len(cards) < n:
+        c.execute(f'SELECT {columns} FROM flashcards WHERE topic_id = ? AND due_at > ? ORDER BY due_at LIMIT ?',
+                  (topic_id, now, n - len(cards)))
+        cards += c.fetchall()
+    return cards
+
+
+def record_reviews(c, reviews, now=None):
+    """Reschedule cards from ``(card_id, correct, score)`` results in one batched UPDATE.
+
+    Cards deleted since the quiz was drawn are skipped. Returns the number rescheduled.
+    """
+    if not reviews:
+        return 0
+    now = time.time() if now is None else now
+    placeholders = ','.join('?' * len(reviews))
+    c.execute(f'SELECT id, ease, interval_days, repetitions FROM flashcards WHERE id IN ({placeholders})',
+              [card_id for card_id, _, _ in reviews])
+    state = {row[0]: row[1:] for row in c.fetchall()}
+    updates = []
+    for card_id, correct, score in reviews:
+        if card_id not in state:
+            continue
+        ease, interval_days, repetitions = sm2(*state[card_id], quality(correct, score))
+        updates.append((ease, interval_days, repetitions, now + interval_days * DAY, card_id))
+    c.executemany('UPDATE flashcards SET ease = ?, interval_days = ?, repetitions = ?, due_at = ? WHERE id = ?',
+                  updates)
+    return len(updates)
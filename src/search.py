@@ -0,0 +1,98 @@
+"""Full-text search over notes and flashcards.
+
+SQLite uses FTS5 tables (``notes_fts``, ``flashcards_fts``) that index the
+base tables as external content and are kept in sync by triggers.
+PostgreSQL uses generated ``search_vector`` tsvector columns with GIN
+indexes. ``search`` hides the difference: it returns ranked hits with
+highlighted snippets, optionally filtered by topic and kind, one page at a
+time.
+"""
+import re
+
+from markupsafe import Markup, escape
+
+from database import USE_POSTGRES
+
+SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 100
+SEARCH_KINDS = ('note', 'flashcard')
+
+# Snippet markers that can't appear in user text; swapped for <mark> after escaping
+_START, _STOP = '\x02', '\x03'
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+_SQLITE_QUERIES = {
+    'note': """
+        SELECT 'note', rowid, topic_id, NULL,
+               snippet(notes_fts, 0, char(2), char(3), '…', 16), bm25(notes_fts)
+        FROM notes_fts WHERE notes_fts MATCH ?{topic}
+    """,
+    'flashcard': """
+        SELECT 'flashcard', rowid, topic_id, term,
+               snippet(flashcards_fts, -1, char(2), char(3), '…', 16), bm25(flashcards_fts, 2.0, 1.0)
+        FROM flashcards_fts WHERE flashcards_fts MATCH ?{topic}
+    """,
+}
+
+_POSTGRES_HEADLINE = "'StartSel=' || chr(2) || ', StopSel=' || chr(3) || ', MaxWords=24, MinWords=8'"
+_POSTGRES_QUERIES = {
+    'note': f"""
+        SELECT 'note', id, topic_id, NULL,
+               ts_headline('english', content, q, {_POSTGRES_HEADLINE}), -ts_rank_cd(search_vector, q)
+        FROM notes, websearch_to_tsquery('english', %s) q WHERE search_vector @@ q{{topic}}
+    """,
+    'flashcard': f"""
+        SELECT 'flashcard', id, topic_id, term,
+               ts_headline('english', term || ' — ' || definition, q, {_POSTGRES_HEADLINE}),
+               -ts_rank_cd(search_vector, q)
+        FROM flashcards, websearch_to_tsquery('english', %s) q WHERE search_vector @@ q{{topic}}
+    """,
+}
+
+
+def fts_query(text):
+    """Turn free text into a safe FTS5 query: every word must match, the last as a prefix"""
+    words = _WORD.findall(text)
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def highlight(snippet):
+    """Escape a snippet and turn the match markers into <mark> tags"""
+    return Markup(str(escape(snippet or '')).replace(_START, '<mark>').replace(_STOP, '</mark>'))
+
+
+def search(conn, text, topic_id=None, kinds=SEARCH_KINDS, limit=SEARCH_PAGE_SIZE, offset=0):
+    """Ranked hits for ``text``. Returns ``(hits, has_more)``; each hit is a dict."""
+    if USE_POSTGRES:
+        query, queries, p = text.strip(), _POSTGRES_QUERIES, '%s'
+    else:
+        query, queries, p = fts_query(text), _SQLITE_QUERIES, '?'
+    if not query:
+        return [], False
+
+    parts, params = [], []
+    for kind in kinds:
+        topic_filter = f' AND topic_id = {p}' if topic_id is not None else ''
+        parts.append(queries[kind].format(topic=topic_filter))
+        params.append(query)
+        if topic_id is not None:
+            params.append(topic_id)
+    sql = ' UNION ALL '.join(parts) + f' ORDER BY 6 LIMIT {p} OFFSET {p}'
+    params += [limit + 1, offset]
+
+    c = conn.cursor()
+    c.execute(sql, params)
+    rows = c.fetchall()
+    hits = [{
+        'type': kind,
+        'id': rid,
+        'topic_id': tid,
+        'term': term,
+        'snippet': highlight(snippet),
+        'rank': rank,
+    } for kind, rid, tid, term, snippet, rank in rows[:limit]]
+    return hits, len(rows) > limit
@@ -0,0 +1,132 @@
+"""Map-reduce summarization for long inputs.
+
+Text that fits in one prompt is summarized directly. Longer text is split on
+section and paragraph boundaries into chunks of at most ``SUMMARY_CHUNK_CHARS``
+characters; the chunks are summarized concurrently on a bounded thread pool
+(``SUMMARY_CONCURRENCY``) and a reduce pass merges the partial summaries.
+When the partials themselves are too long for one prompt they are reduced in
+groups first, so any input size ends in a single final pass.
+
+Each call goes through the caller's ``generate(template, text, max_tokens)``,
+which in the app is the cached ``generate_text``, so re-submitting a document
+that shares sections with an earlier one only pays for the new chunks.
+``amap_summaries`` and ``acollapse`` are the coroutine versions for the async
+serving mode; they take an ``agenerate`` coroutine function and bound the
+calls in flight with a semaphore instead of a thread pool.
+"""
+import asyncio
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+SUMMARY_CHUNK_CHARS = int(os.getenv('SUMMARY_CHUNK_CHARS', '12000'))
+SUMMARY_CONCURRENCY = int(os.getenv('SUMMARY_CONCURRENCY', '4'))
+
+CHUNK_MAX_TOKENS = 400
+REDUCE_MAX_TOKENS = 1024
+
+CHUNK_PROMPT = ("Summarize this section of a longer training document into concise study notes. "
+                "Keep key terms, definitions and facts:\n\n{raw_text}")
+REDUCE_PROMPT = ("Merge these partial study notes, taken from consecutive sections of one training document, "
+                 "into clear, organized, well-structured study notes. Remove repetition:\n\n{raw_text}")
+
+# Blank lines, or a line break before a markdown heading / numbered section title
+_SECTION_BREAK = re.compile(r'\n\s*\n|\n(?=#{1,6} |\d+(?:\.\d+)*[.)] )')
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+def _split_oversized(block, max_chars):
+    """Split one paragraph longer than max_chars on sentence boundaries, hard-cutting as a last resort"""
+    pieces, current = [], ''
+    for sentence in _SENTENCE_END.split(block):
+        while len(sentence) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f'{current} {sentence}' if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_chunks(text, max_chars=SUMMARY_CHUNK_CHARS):
+    """Pack paragraphs/sections into chunks of at most ``max_chars`` characters, in order"""
+    text = text.strip()
+    if len(text) <= max_chars:
+        return [text] if text else []
+    chunks, current = [], ''
+    for block in _SECTION_BREAK.split(text):
+        block = block.strip()
+        if not block:
+            continue
+        for piece in ([block] if len(block) <= max_chars else _split_oversized(block, max_chars)):
+            if current and len(current) + 2 + len(piece) > max_chars:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f'{current}\n\n{piece}' if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def map_summaries(chunks, generate, max_workers=SUMMARY_CONCURRENCY, template=CHUNK_PROMPT,
+                  max_tokens=CHUNK_MAX_TOKENS):
+    """Summarize chunks concurrently; results keep the input order"""
+    if len(chunks) == 1:
+        return [generate(template, chunks[0], max_tokens)]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks))), thread_name_prefix='summarize') as pool:
+        return list(pool.map(lambda chunk: generate(template, chunk, max_tokens), chunks))
+
+
+async def amap_summaries(chunks, agenerate, max_workers=SUMMARY_CONCURRENCY, template=CHUNK_PROMPT,
+                         max_tokens=CHUNK_MAX_TOKENS):
+    """Coroutine version of ``map_summaries``"""
+    limit = asyncio.Semaphore(max(1, max_workers))
+
+    async def one(chunk):
+        async with limit:
+            return await agenerate(template, chunk, max_tokens)
+    return list(await asyncio.gather(*(one(chunk) for chunk in chunks)))
+
+
+def reduce_input(partials):
+    """Text handed to the reduce prompt"""
+    return '\n\n'.join(f'Part {i}:\n{partial.strip()}' for i, partial in enumerate(partials, 1))
+
+
+def collapse(partials, generate, max_chars=SUMMARY_CHUNK_CHARS, max_workers=SUMMARY_CONCURRENCY):
+    """Reduce partials in groups until all of them fit in one reduce prompt"""
+    while len(partials) > 1 and len(reduce_input(partials)) > max_chars:
+        groups = split_chunks(reduce_input(partials), max_chars)
+        if len(groups) >= len(partials):
+            break  # every partial is already near max size; merging can't shrink the input further
+        partials = map_summaries(groups, generate, max_workers, template=REDUCE_PROMPT, max_tokens=CHUNK_MAX_TOKENS)
+    return partials
+
+
+async def acollapse(partials, agenerate, max_chars=SUMMARY_CHUNK_CHARS, max_workers=SUMMARY_CONCURRENCY):
+    """Coroutine version of ``collapse``"""
+    while len(partials) > 1 and len(reduce_input(partials)) > max_chars:
+        groups = split_chunks(reduce_input(partials), max_chars)
+        if len(groups) >= len(partials):
+            break
+        partials = await amap_summaries(groups, agenerate, max_workers, template=REDUCE_PROMPT,
+                                        max_tokens=CHUNK_MAX_TOKENS)
+    return partials
+
+
+def summarize(text, generate, single_template, single_max_tokens, max_chars=SUMMARY_CHUNK_CHARS,
+              max_workers=SUMMARY_CONCURRENCY):
+    """Summarize ``text`` in one call if it fits, otherwise map-reduce it"""
+    chunks = split_chunks(text, max_chars)
+    if len(chunks) <= 1:
+        return generate(single_template, text, single_max_tokens)
+    partials = collapse(map_summaries(chunks, generate, max_workers), generate, max_chars, max_workers)
+    return generate(REDUCE_PROMPT, reduce_input(partials), REDUCE_MAX_TOKENS)
@@ -0,0 +1,131 @@
+"""The event stream behind ``POST /generate/stream``, shared by both serving modes.
+
+``summary_steps`` holds the whole body of a streamed summary: the SSE framing,
+the map/reduce progress events for long input, the response cache and
+save-on-complete. It does no I/O itself. It yields ``(op, arg)`` steps and is
+sent each step's result; a failed step is thrown back into it, so errors
+become one ``error`` event in one place.
+
+``stream_summary`` carries the steps out with threads and blocking calls
+(``gunicorn app:app``); ``astream_summary`` does the same with coroutines
+(``uvicorn asgi:app``). Both are generators of SSE text. Closing one while
+the model is streaming closes the upstream stream, and nothing is saved.
+"""
+import asyncio
+import json
+
+from ai_cache import ai_cache, cache_key
+from summarizer import (REDUCE_MAX_TOKENS, REDUCE_PROMPT, acollapse, amap_summaries, collapse, map_summaries,
+                        reduce_input, split_chunks)
+
+# Steps: send text to the client / summarize chunks into partials / cache lookup /
+# stream the final prompt / cache store / save the note
+EMIT, MAP, CACHED, STREAM, STORE, SAVE = 'emit', 'map', 'cached', 'stream', 'store', 'save'
+
+
+def sse(data, event=None):
+    """Format one Server-Sent Events message"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+def summary_steps(raw_text, model, template, max_tokens):
+    """Yield the steps of one streamed summary (see the module docstring)"""
+    # A comment right away, so headers go out before the first token
+    yield EMIT, ": stream open\n\n"
+    try:
+        text = raw_text
+        chunks = split_chunks(raw_text)
+        if len(chunks) > 1:
+            # Long input: summarize sections concurrently, then stream the reduce pass
+            yield EMIT, sse({"stage": "map", "chunks": len(chunks)}, event="progress")
+            partials = yield MAP, chunks
+            yield EMIT, sse({"stage": "reduce", "chunks": len(chunks)}, event="progress")
+            template, text, max_tokens = REDUCE_PROMPT, reduce_input(partials), REDUCE_MAX_TOKENS
+        key = cache_key(model, template, text, max_tokens)
+
+        summary = yield CACHED, key
+        if summary is not None:
+            yield EMIT, sse({"delta": summary})
+        else:
+            summary = yield STREAM, (template.format(raw_text=text), max_tokens)
+            yield STORE, (key, summary)
+
+        yield SAVE, summary
+        yield EMIT, sse({"summary": summary}, event="done")
+    except Exception as e:
+        yield EMIT, sse({"error": f"Error generating summary: {str(e)}"}, event="error")
+
+
+def stream_summary(steps, gateway, generate, concurrency, save):
+    """Run ``summary_steps`` on this thread, yielding SSE text.
+
+    ``generate`` is the cached ``generate_text``, ``concurrency()`` the map
+    fan-out and ``save(summary)`` stores the note.
+    """
+    advance, value = steps.send, None
+    while True:
+        try:
+            op, arg = advance(value)
+        except StopIteration:
+            return
+        advance, value = steps.send, None
+        try:
+            if op == EMIT:
+                yield arg
+            elif op == MAP:
+                workers = concurrency()
+                value = collapse(map_summaries(arg, generate, workers), generate, max_workers=workers)
+            elif op == CACHED:
+                value = ai_cache.get(arg)
+            elif op == STREAM:
+                parts = []
+                # If the client disconnects, GeneratorExit is raised at the yield below; leaving
+                # the with-block closes the upstream stream
+                with gateway.stream(*arg) as deltas:
+                    for delta in deltas:
+                        parts.append(delta)
+                        yield sse({"delta": delta})
+                value = ''.join(parts).strip()
+            elif op == STORE:
+                ai_cache.put(*arg)
+            elif op == SAVE:
+                save(arg)
+        except Exception as e:
+            advance, value = steps.throw, e
+
+
+async def astream_summary(steps, gateway, agenerate, concurrency, asave):
+    """Coroutine counterpart of ``stream_summary``: an async generator of SSE text.
+
+    The map phase fans out as coroutines too; a thread per chunk call would
+    hold the default executor that the cache and database calls need.
+    """
+    advance, value = steps.send, None
+    while True:
+        try:
+            op, arg = advance(value)
+        except StopIteration:
+            return
+        advance, value = steps.send, None
+        try:
+            if op == EMIT:
+                yield arg
+            elif op == MAP:
+                workers = concurrency()
+                value = await acollapse(await amap_summaries(arg, agenerate, workers), agenerate, max_workers=workers)
+            elif op == CACHED:
+                value = await asyncio.to_thread(ai_cache.get, arg)
+            elif op == STREAM:
+                parts = []
+                async with gateway.astream(*arg) as deltas:
+                    async for delta in deltas:
+                        parts.append(delta)
+                        yield sse({"delta": delta})
+                value = ''.join(parts).strip()
+            elif op == STORE:
+                await asyncio.to_thread(ai_cache.put, *arg)
+            elif op == SAVE:
+                await asave(arg)
+        except Exception as e:
+            advance, value = steps.throw, e
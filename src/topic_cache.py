@@ -0,0 +1,133 @@
+"""In-process cache of topic metadata (id, name, description).
+
+Nearly every route resolves a topic (the legacy routes by the 'General'
+name, the topic routes by id) before doing any real work. Topics change
+rarely, so each worker keeps the rows it has seen and serves them from memory.
+
+Writers call ``invalidate(conn)`` after committing a topic change: it clears
+this worker's entries and bumps the ``topics`` row of ``cache_versions``.
+Other workers compare that counter at most every ``check_interval`` seconds
+and drop their entries when it has moved, so a change made elsewhere is seen
+within one interval.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+TOPIC_CACHE_MAX_ENTRIES = int(os.getenv('TOPIC_CACHE_MAX_ENTRIES', '1024'))
+TOPIC_CACHE_CHECK_INTERVAL = float(os.getenv('TOPIC_CACHE_CHECK_INTERVAL', '1.0'))
+
+DEFAULT_TOPIC = ('General', 'Default study topic')
+VERSION_KEY = 'topics'
+
+
+class TopicCache:
+    def __init__(self, max_entries=TOPIC_CACHE_MAX_ENTRIES, check_interval=TOPIC_CACHE_CHECK_INTERVAL):
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._by_id = OrderedDict()  # id -> (id, name, description)
+        self._by_name = {}
+        self._version = None
+        self._checked_at = 0.0
+        # Bumped on every clear, so a load that raced an invalidation isn't stored
+        self._generation = 0
+        self._counters = {'hits': 0, 'misses': 0, 'version_checks': 0, 'invalidations': 0}
+
+    def get(self, conn, topic_id):
+        """Return ``(id, name, description)`` for a topic id, or None if it doesn't exist"""
+        generation = self._validate(conn)
+        with self._lock:
+            row = self._by_id.get(topic_id)
+            if row is not None:
+                self._by_id.move_to_end(topic_id)
+                self._counters['hits'] += 1
+                return row
+            self._counters['misses'] += 1
+        return self._load(conn, 'SELECT id, name, description FROM topics WHERE id = ?', topic_id, generation)
+
+    def by_name(self, conn, name):
+        """Return ``(id, name, description)`` for a topic name, or None if it doesn't exist"""
+        generation = self._validate(conn)
+        with self._lock:
+            topic_id = self._by_name.get(name)
+            if topic_id is not None and topic_id in self._by_id:
+                self._by_id.move_to_end(topic_id)
+                self._counters['hits'] += 1
+                return self._by_id[topic_id]
+            self._counters['misses'] += 1
+        return self._load(conn, 'SELECT id, name, description FROM topics WHERE name = ?', name, generation)
+
+    def default_topic(self, conn):
+        """Return the 'General' topic row, creating the topic if it is missing"""
+        row = self.by_name(conn, DEFAULT_TOPIC[0])
+        if row is None:
+            c = conn.cursor()
+            c.execute('INSERT INTO topics (name, description) VALUES (?, ?)', DEFAULT_TOPIC)
+            conn.commit()
+            self.invalidate(conn)
+            row = self.by_name(conn, DEFAULT_TOPIC[0])
+        return row
+
+    def invalidate(self, conn=None):
+        """Drop this worker's entries; with ``conn``, also tell the other workers"""
+        if conn is not None:
+            c = conn.cursor()
+            c.execute('UPDATE cache_versions SET version = version + 1 WHERE name = ?', (VERSION_KEY,))
+            conn.commit()
+        with self._lock:
+            self._clear()
+            # Re-read the counter on the next lookup rather than trusting our old one
+            self._version = None
+            self._checked_at = 0.0
+            self._counters['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters, entries=len(self._by_id), version=self._version)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def _validate(self, conn):
+        """Clear the cache if another worker bumped the version; returns the current generation"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return self._generation
+        c = conn.cursor()
+        c.execute('SELECT version FROM cache_versions WHERE name = ?', (VERSION_KEY,))
+        row = c.fetchone()
+        version = row[0] if row else 0
+        with self._lock:
+            self._counters['version_checks'] += 1
+            if version != self._version:
+                self._clear()
+                self._version = version
+            self._checked_at = now
+            return self._generation
+
+    def _load(self, conn, sql, param, generation):
+        c = conn.cursor()
+        c.execute(sql, (param,))
+        row = c.fetchone()
+        if row is None:
+            return None
+        row = tuple(row)
+        with self._lock:
+            if generation == self._generation:
+                self._by_id[row[0]] = row
+                self._by_name[row[1]] = row[0]
+                while len(self._by_id) > self.max_entries:
+                    _, evicted = self._by_id.popitem(last=False)
+                    self._by_name.pop(evicted[1], None)
+        return row
+
+    def _clear(self):
+        self._by_id.clear()
+        self._by_name.clear()
+        self._generation += 1
+
+
+topic_cache = TopicCache()
@@ -1,6 +1,12 @@
-from flask import Blueprint, render_template, request, redirect, url_for
+from flask import Blueprint, Response, render_template, request, redirect, url_for, stream_with_context
 from database import get_db_connection, USE_POSTGRES
+from export import EXPORT_FORMATS, stream_export
+from topic_cache import topic_cache
+from conditional import all_topics_version, conditional_topic_get
+from fragment_cache import fragment_cache
+from pagination import decode_cursor, decode_name_cursor, encode_cursor, encode_name_cursor
 import sqlite3
+import time
 
 # Import appropriate exception based on database type
 if USE_POSTGRES:
@@ -14,26 +20,83 @@ else:
 
 bp = Blueprint('topics', __name__, url_prefix='/topics')
 
+TOPICS_PER_PAGE = 24
+MAX_TOPICS_PER_PAGE = 100
+
+# Whitelisted ORDER BY clauses for the topic list (id breaks ties so paging is stable)
+TOPIC_SORTS = {
+    'name': 't.name ASC, t.id ASC',
+    '-name': 't.name DESC, t.id DESC',
+    'newest': 't.id DESC',
+    'oldest': 't.id ASC',
+}
+
+# Keyset condition for the page after a cursor, per sort: a range scan from the
+# previous page's last key, where OFFSET would read and discard every earlier row
+TOPIC_SEEKS = {
+    'name': '(t.name, t.id) > (?, ?)',
+    '-name': '(t.name, t.id) < (?, ?)',
+    'newest': 't.id < ?',
+    'oldest': 't.id > ?',
+}
+NAME_SORTS = ('name', '-name')
+
+# Per-topic counts are columns on the topic row, kept by triggers on notes and
+# flashcards (see migrations.py; ``python src/migrations.py reconcile`` rebuilds them)
+TOPIC_WITH_COUNTS_SQL = """
+    SELECT t.id, t.name, t.description, t.notes_count, t.flashcards_count
+    FROM topics t
+"""
+
+
+def _topic_row(row):
+    return {'id': row[0], 'name': row[1], 'description': row[2], 'notes': row[3], 'flashcards': row[4]}
+
+
 @bp.route('/')
 def list_topics():
+    sort = request.args.get('sort', 'name')
+    if sort not in TOPIC_SORTS:
+        sort = 'name'
+    after = request.args.get('after') or None
+    per_page = min(max(request.args.get('per_page', TOPICS_PER_PAGE, type=int), 1), MAX_TOPICS_PER_PAGE)
+    if after is not None:
+        key = decode_name_cursor(after) if sort in NAME_SORTS else (decode_cursor(after),)
+        page = None
+    else:
+        # ?page=N is still honoured (OFFSET) for links made before the cursors
+        page = max(request.args.get('page', 1, type=int), 1)
+
     conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('SELECT id, name, description FROM topics ORDER BY name')
-    topics = c.fetchall()
-    conn.close()
-    # Build simple stats
-    topic_stats = []
-    for t in topics:
-        tid = t[0]
-        conn = get_db_connection()
+
+    def render():
         c = conn.cursor()
-        c.execute('SELECT COUNT(*) FROM notes WHERE topic_id = ?', (tid,))
-        notes_count = c.fetchone()[0]
-        c.execute('SELECT COUNT(*) FROM flashcards WHERE topic_id = ?', (tid,))
-        cards_count = c.fetchone()[0]
-        conn.close()
-        topic_stats.append({'id': tid, 'name': t[1], 'description': t[2], 'notes': notes_count, 'flashcards': cards_count})
-    return render_template('topics.html', topics=topic_stats)
+        sql, params = TOPIC_WITH_COUNTS_SQL, []
+        if after is not None:
+            sql += f' WHERE {TOPIC_SEEKS[sort]}'
+            params.extend(key)
+        # Fetch one extra row to learn whether a next page exists without a COUNT(*)
+        sql += f' ORDER BY {TOPIC_SORTS[sort]} LIMIT ?'
+        params.append(per_page + 1)
+        if page is not None and page > 1:
+            sql += ' OFFSET ?'
+            params.append((page - 1) * per_page)
+        c.execute(sql, params)
+        rows = c.fetchall()
+        topic_stats = [_topic_row(r) for r in rows[:per_page]]
+        next_cursor = None
+        if len(rows) > per_page:
+            last = rows[per_page - 1]
+            next_cursor = encode_name_cursor(last[1], last[0]) if sort in NAME_SORTS else encode_cursor(last[0])
+        pagination = {'per_page': per_page, 'sort': sort, 'first_page': after is None and page == 1,
+                      'next_cursor': next_cursor}
+        return render_template('partials/topics_grid.html', topics=topic_stats, pagination=pagination,
+                               sorts=TOPIC_SORTS)
+
+    # The grid is cached until any topic or its content changes
+    listing = fragment_cache.render(('topics', all_topics_version(conn), sort, after, page, per_page), render)
+    conn.close()
+    return render_template('topics.html', listing=listing)
 
 @bp.route('/create', methods=['GET', 'POST'])
 def create_topic():
@@ -48,6 +111,7 @@ def create_topic():
             c.execute('INSERT INTO topics (name, description) VALUES (?, ?)', (name, description))
             conn.commit()
             topic_id = c.lastrowid
+            topic_cache.invalidate(conn)
             conn.close()
             return redirect(url_for('topics.view_topic', topic_id=topic_id))
         except IntegrityError:
@@ -56,28 +120,23 @@ def create_topic():
     return render_template('create_topic.html')
 
 @bp.route('/<int:topic_id>')
+@conditional_topic_get
 def view_topic(topic_id):
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute('SELECT id, name, description FROM topics WHERE id = ?', (topic_id,))
+    c.execute(TOPIC_WITH_COUNTS_SQL + ' WHERE t.id = ?', (topic_id,))
     t = c.fetchone()
+    conn.close()
     if not t:
-        conn.close()
         return 'Topic not found', 404
-    c.execute('SELECT COUNT(*) FROM notes WHERE topic_id = ?', (topic_id,))
-    notes_count = c.fetchone()[0]
-    c.execute('SELECT COUNT(*) FROM flashcards WHERE topic_id = ?', (topic_id,))
-    cards_count = c.fetchone()[0]
-    conn.close()
     topic = {'id': t[0], 'name': t[1], 'description': t[2]}
-    return render_template('topic_view.html', topic=topic, notes=notes_count, flashcards=cards_count)
+    return render_template('topic_view.html', topic=topic, notes=t[3], flashcards=t[4])
 
 @bp.route('/<int:topic_id>/edit', methods=['GET', 'POST'])
 def edit_topic(topic_id):
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute('SELECT id, name, description FROM topics WHERE id = ?', (topic_id,))
-    t = c.fetchone()
+    t = topic_cache.get(conn, topic_id)
     if not t:
         conn.close()
         return 'Topic not found', 404
@@ -88,8 +147,11 @@ def edit_topic(topic_id):
             conn.close()
             return render_template('edit_topic.html', topic={'id': t[0], 'name': t[1], 'description': t[2]}, error='Name required')
         try:
-            c.execute('UPDATE topics SET name = ?, description = ? WHERE id = ?', (name, description, topic_id))
+            # Bumping content_version changes the ETag of every page showing the topic
+            c.execute('UPDATE topics SET name = ?, description = ?, content_version = content_version + 1,'
+                      ' content_modified_at = ? WHERE id = ?', (name, description, time.time(), topic_id))
             conn.commit()
+            topic_cache.invalidate(conn)
             conn.close()
             return redirect(url_for('topics.view_topic', topic_id=topic_id))
         except IntegrityError:
@@ -104,5 +166,30 @@ def delete_topic(topic_id):
     c = conn.cursor()
     c.execute('DELETE FROM topics WHERE id = ?', (topic_id,))
     conn.commit()
+    topic_cache.invalidate(conn)
     conn.close()
     return redirect(url_for('topics.list_topics'))
+
+
+def _export_response(topic_id, filename):
+    fmt = request.args.get('format', 'jsonl')
+    if fmt not in EXPORT_FORMATS:
+        return f'Unsupported export format: {fmt}', 400
+    gzip = request.args.get('gzip') in ('1', 'true', 'yes')
+    filename = f'{filename}.{fmt}' + ('.gz' if gzip else '')
+    mimetype = 'application/gzip' if gzip else ('text/csv' if fmt == 'csv' else 'application/x-ndjson')
+    # stream_with_context keeps the request's connection open until the last chunk is sent
+    body = stream_with_context(stream_export(get_db_connection(), topic_id, fmt, gzip))
+    return Response(body, mimetype=mimetype, headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+@bp.route('/export')
+def export_all_topics():
+    return _export_response(None, 'studybuddy-export')
+
+
+@bp.route('/<int:topic_id>/export')
+def export_topic(topic_id):
+    if topic_cache.get(get_db_connection(), topic_id) is None:
+        return 'Topic not found', 404
+    return _export_response(topic_id, f'topic-{topic_id}')
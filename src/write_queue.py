@@ -0,0 +1,365 @@
+"""Group commit for SQLite writes.
+
+With several gunicorn workers on one SQLite file, every request that adds a
+note or a card opens its own write transaction and commits it alone. Under
+load they queue on SQLite's single write lock by polling it, and a request
+whose wait outlasts ``busy_timeout`` fails with ``database is locked``.
+
+``write_queue.write(fn)`` hands the write to one writer thread per process
+instead. The writer takes every write waiting (up to ``WRITE_MAX_BATCH``,
+lingering ``WRITE_BATCH_WINDOW_MS`` for stragglers), takes a host-wide lock
+file so writers in other processes take turns, and runs the
+batch as one ``BEGIN IMMEDIATE`` transaction with one commit. Each write gets
+its own savepoint, so a failing write fails alone. Callers block until their
+write is committed, for at most ``WRITE_TIMEOUT`` seconds; a write that
+times out before the writer reaches it is dropped, never applied late, and a
+batch whose oldest write times out while the writer waits for the lock file
+fails as a whole, unapplied.
+
+The writer's connection doesn't checkpoint the WAL inside commits. After
+writing it runs a PASSIVE checkpoint at most every ``WAL_CHECKPOINT_INTERVAL``
+seconds, off every caller's path, and truncates the WAL file once it has
+grown past ``WAL_TRUNCATE_PAGES`` pages and been fully copied back.
+
+On PostgreSQL (row-level locking, no single write lock), with
+``SQLITE_GROUP_COMMIT=0``, or when the caller's connection is already in a
+write transaction, the write runs inline on the caller's connection.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from flask import g, has_app_context
+
+from database import SQLITE_PRAGMAS, USE_POSTGRES, get_db_connection, get_pool
+from metrics import TimedCursor
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers in one process are still serialized by the queue
+    fcntl = None
+
+SQLITE_GROUP_COMMIT = os.getenv('SQLITE_GROUP_COMMIT', '1') == '1'
+WRITE_BATCH_WINDOW_MS = float(os.getenv('WRITE_BATCH_WINDOW_MS', '1'))
+WRITE_MAX_BATCH = int(os.getenv('WRITE_MAX_BATCH', '500'))
+WRITE_TIMEOUT = float(os.getenv('WRITE_TIMEOUT', '5'))
+WRITE_QUEUE_MAX = int(os.getenv('WRITE_QUEUE_MAX', '10000'))
+WAL_CHECKPOINT_INTERVAL = float(os.getenv('WAL_CHECKPOINT_INTERVAL', '1'))
+WAL_TRUNCATE_PAGES = int(os.getenv('WAL_TRUNCATE_PAGES', '10000'))
+
+
+class WriteQueueFull(Exception):
+    """Raised when too many writes are already waiting for the writer"""
+
+
+class WriteTimeout(Exception):
+    """Raised when a write isn't committed within the write timeout (it was not applied)"""
+
+
+def in_write_transaction():
+    """Whether the request's SQLite connection has a write transaction open"""
+    conn = g.get('_db_conn') if has_app_context() else None
+    return conn is not None and conn.in_transaction
+
+
+class WriteQueue:
+    def __init__(self, enabled=SQLITE_GROUP_COMMIT and not USE_POSTGRES, batch_window=WRITE_BATCH_WINDOW_MS / 1000,
+                 max_batch=WRITE_MAX_BATCH, timeout=WRITE_TIMEOUT, max_queued=WRITE_QUEUE_MAX,
+                 checkpoint_interval=WAL_CHECKPOINT_INTERVAL, truncate_pages=WAL_TRUNCATE_PAGES):
+        self.enabled = enabled
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.max_queued = max_queued
+        self.checkpoint_interval = checkpoint_interval
+        self.truncate_pages = truncate_pages
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._conn = None
+        self._conn_path = None
+        self._lock_file = None
+        self._dirty = False
+        self._last_checkpoint = time.monotonic()
+        self._latencies = deque(maxlen=1000)  # seconds from write() to commit
+        self._counters = {'writes': 0, 'failed': 0, 'batches': 0, 'max_batch_size': 0, 'inline': 0,
+                          'timeouts': 0, 'rejected': 0, 'lock_wait_seconds': 0.0, 'checkpoints': 0,
+                          'truncations': 0, 'wal_pages': 0}
+
+    def write(self, fn):
+        """Run ``fn(cursor)`` in the next group commit and return its result once committed"""
+        if not self.enabled:
+            return self._inline(fn)
+        if in_write_transaction():
+            # Join the request's open transaction; the caller commits it
+            return self._inline(fn, commit=False)
+        self._ensure_writer()
+        future = Future()
+        try:
+            self._queue.put_nowait((fn, future, time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self._counters['rejected'] += 1
+            raise WriteQueueFull(f"{self.max_queued} writes already waiting")
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            if future.cancel():
+                with self._lock:
+                    self._counters['timeouts'] += 1
+                raise WriteTimeout(f"Write not committed after {self.timeout}s")
+            # Already in the batch being committed: the writer gives up on the lock by the
+            # oldest write's deadline, and SQLite's busy_timeout bounds the rest
+            return future.result()
+
+    def execute(self, sql, params=()):
+        """Run one statement in the next group commit. Returns the cursor's lastrowid."""
+        def run(c):
+            c.execute(sql, params)
+            return c.lastrowid
+        return self.write(run)
+
+    def close(self):
+        """Stop the writer thread after the writes already queued"""
+        thread = self._thread
+        if thread is not None and self._pid == os.getpid():
+            self._queue.put(None)
+            thread.join()
+            self._thread = None
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = dict(self._counters, enabled=self.enabled, queue_depth=self._queue.qsize(),
+                         max_queued=self.max_queued)
+        stats['mean_batch_size'] = round(stats['writes'] / stats['batches'], 2) if stats['batches'] else None
+        stats['write_p50'] = latencies[len(latencies) // 2] if latencies else None
+        stats['write_p95'] = latencies[int(len(latencies) * 0.95)] if latencies else None
+        return stats
+
+    def _inline(self, fn, commit=True):
+        conn = get_db_connection()
+        try:
+            result = fn(conn.cursor())
+            if commit:
+                conn.commit()
+            return result
+        finally:
+            conn.close()
+            with self._lock:
+                self._counters['inline'] += 1
+
+    def _ensure_writer(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                # A forked worker gets its own writer; the parent's queue and connection stay behind
+                self._pid = os.getpid()
+                self._queue = queue.Queue(maxsize=self.max_queued)
+                self._conn = self._lock_file = None
+                self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.checkpoint_interval if self._dirty else None)
+            except queue.Empty:
+                self._checkpoint()
+                continue
+            if item is None:
+                self._disconnect()
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            # Writes whose callers gave up are dropped here, before they can be applied
+            batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+            if batch:
+                self._commit(batch)
+            if time.monotonic() - self._last_checkpoint >= self.checkpoint_interval:
+                self._checkpoint()
+
+    def _commit(self, batch):
+        results = []
+        try:
+            conn = self._connection()
+            c = TimedCursor(conn.cursor())
+            started = time.monotonic()
+            # Wait for other processes' writers no longer than the oldest caller will
+            deadline = min(submitted for _, _, submitted in batch) + self.timeout
+            with self._write_lock(timeout=max(0.0, deadline - started)):
+                lock_wait = time.monotonic() - started
+                c.execute('BEGIN IMMEDIATE')
+                try:
+                    for fn, future, _ in batch:
+                        c.execute('SAVEPOINT write')
+                        try:
+                            results.append((future, fn(c), None))
+                        except Exception as e:
+                            c.execute('ROLLBACK TO write')
+                            results.append((future, None, e))
+                        c.execute('RELEASE write')
+                    c.execute('COMMIT')
+                except BaseException:
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK')
+                    raise
+        except Exception as e:
+            with self._lock:
+                self._counters['timeouts' if isinstance(e, WriteTimeout) else 'failed'] += len(batch)
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        committed = time.monotonic()
+        self._dirty = True
+        with self._lock:
+            self._counters['batches'] += 1
+            self._counters['max_batch_size'] = max(self._counters['max_batch_size'], len(batch))
+            self._counters['lock_wait_seconds'] += lock_wait
+            for (_, _, submitted), (_, _, error) in zip(batch, results):
+                self._counters['failed' if error else 'writes'] += 1
+                self._latencies.append(committed - submitted)
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _checkpoint(self):
+        self._dirty = False
+        self._last_checkpoint = time.monotonic()
+        if self._conn is None:
+            return
+        try:
+            _, pages, copied = self._conn.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+            truncated = False
+            if pages >= self.truncate_pages and copied == pages and self._queue.empty():
+                # TRUNCATE needs readers off the WAL; don't hold up writers waiting for them
+                with self._write_lock(timeout=0):
+                    self._conn.execute('PRAGMA busy_timeout=100')
+                    try:
+                        truncated = self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()[0] == 0
+                    finally:
+                        self._conn.execute('PRAGMA busy_timeout=5000')
+        except (sqlite3.Error, WriteTimeout):
+            return
+        with self._lock:
+            self._counters['checkpoints'] += 1
+            self._counters['truncations'] += truncated
+            self._counters['wal_pages'] = 0 if truncated else pages
+
+    def _connection(self):
+        # Follow the pool's file, which tests (and benchmarks) repoint
+        path = get_pool().path
+        if self._conn is None or self._conn_path != path:
+            self._disconnect()
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            conn = sqlite3.connect(path, isolation_level=None)
+            for pragma in SQLITE_PRAGMAS:
+                conn.execute(pragma)
+            conn.execute('PRAGMA wal_autocheckpoint=0')
+            self._conn, self._conn_path = conn, path
+            self._lock_file = open(path + '.write-lock', 'a')
+        return self._conn
+
+    def _disconnect(self):
+        for resource in (self._conn, self._lock_file):
+            if resource is not None:
+                try:
+                    resource.close()
+                except Exception:
+                    pass
+        self._conn = self._lock_file = None
+
+    def _write_lock(self, timeout):
+        return _FileLock(self._lock_file, timeout)
+
+
+class _FileLock:
+    """Exclusive flock on the writer's lock file, shared by every process on the host.
+
+    Raises ``WriteTimeout`` if another process holds it for longer than ``timeout`` seconds.
+    """
+
+    def __init__(self, f, timeout):
+        self.f = f
+        self.timeout = timeout
+        self.held = None
+
+    def __enter__(self):
+        if fcntl is None:
+            return
+        try:
+            fcntl.flock(self.f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self.held = self.f
+            return
+        except BlockingIOError:
+            pass
+        # Contended: queue in the kernel like a blocking flock would (polling lets the
+        # holder's next batch cut in), from a thread we can stop waiting for
+        waiter = _LockWaiter(self.f.name) if self.timeout > 0 else None
+        if waiter is None or not waiter.wait(self.timeout):
+            raise WriteTimeout(f"Write lock held elsewhere for {self.timeout:.2f}s")
+        self.held = waiter.f
+
+    def __exit__(self, *exc):
+        if self.held is self.f:
+            fcntl.flock(self.f, fcntl.LOCK_UN)
+        elif self.held is not None:
+            self.held.close()  # the waiter's own descriptor; closing it releases the lock
+
+
+class _LockWaiter:
+    """A blocking flock on a descriptor of its own, in a thread of its own.
+
+    If the caller stops waiting before the lock is granted, the lock is
+    released as soon as it is.
+    """
+
+    def __init__(self, path):
+        self.f = open(path, 'a')
+        self._granted = threading.Event()
+        self._guard = threading.Lock()
+        self._abandoned = False
+        threading.Thread(target=self._run, name='sqlite-write-lock', daemon=True).start()
+
+    def _run(self):
+        try:
+            fcntl.flock(self.f, fcntl.LOCK_EX)
+        except OSError:
+            self.f.close()
+            return
+        with self._guard:
+            if self._abandoned:
+                self.f.close()
+            else:
+                self._granted.set()
+
+    def wait(self, timeout):
+        if self._granted.wait(timeout):
+            return True
+        with self._guard:
+            if self._granted.is_set():
+                return True
+            self._abandoned = True
+        return False
+
+
+write_queue = WriteQueue()
@@ -50,9 +50,21 @@ def app():
     # Initialize test database
     init_test_db(db_path)
     
+    # Point the connection pool at the temp database
+    import database
+    original_pool = database._pool
+    database._pool = database.SQLiteThreadPool(db_path)
+    # Cached topic rows and fragments belong to the previous test's database
+    from topic_cache import topic_cache
+    from fragment_cache import fragment_cache
+    topic_cache.invalidate()
+    fragment_cache.clear()
+    
     yield flask_app
     
     # Cleanup
+    database._pool.close_all()
+    database._pool = original_pool
     root_app_module.DB = original_db
     if src_original_db is not None:
         src_app_module.DB = src_original_db
@@ -68,41 +80,31 @@ def client(app):
     return app.test_client()
 
 
+@pytest.fixture
+def cursor():
+    """In-memory database with topics 1 and 2 and six flashcards each"""
+    from migrations import migrate
+
+    conn = sqlite3.connect(':memory:')
+    migrate(conn)
+    c = conn.cursor()
+    c.execute("INSERT INTO topics (name) VALUES ('A')")
+    c.execute("INSERT INTO topics (name) VALUES ('B')")
+    for i in range(12):
+        c.execute('INSERT INTO flashcards (topic_id, term, definition) VALUES (?, ?, ?)', (1 + i % 2, f't{i}', f'd{i}'))
+    conn.commit()
+    yield c
+    conn.close()
+
+
 def init_test_db(db_path):
-    """Initialize the test database"""
+    """Initialize the test database with the application's migrations"""
+    from migrations import migrate
+
     conn = sqlite3.connect(db_path)
+    migrate(conn)
     c = conn.cursor()
     
-    # Create tables
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS topics (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL,
-            description TEXT
-        )
-    ''')
-    
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS notes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            topic_id INTEGER NOT NULL,
-            content TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (topic_id) REFERENCES topics(id) ON DELETE CASCADE
-        )
-    ''')
-    
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS flashcards (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            topic_id INTEGER NOT NULL,
-            term TEXT NOT NULL,
-            definition TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (topic_id) REFERENCES topics(id) ON DELETE CASCADE
-        )
-    ''')
-    
     # Create default "General" topic
     c.execute('INSERT INTO topics (name, description) VALUES (?, ?)', 
               ('General', 'Default study topic'))
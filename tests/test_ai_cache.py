@@ -0,0 +1,155 @@
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+
+from ai_cache import AIResponseCache, cache_key
+from migrations import migrate
+
+
+@pytest.fixture
+def connect(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.close()
+    return lambda: sqlite3.connect(path)
+
+
+class TestAIResponseCache:
+    """Test the persistent AI response cache"""
+
+    def test_key_covers_all_inputs(self):
+        base = cache_key('m', 'tpl {raw_text}', 'text', 400)
+        assert base == cache_key('m', 'tpl {raw_text}', 'text', 400)
+        assert base != cache_key('m', 'tpl {raw_text}', 'text', 401)
+        assert base != cache_key('other', 'tpl {raw_text}', 'text', 400)
+
+    def test_second_lookup_is_a_hit(self, connect):
+        cache = AIResponseCache(connect=connect)
+        calls = []
+        compute = lambda: calls.append(1) or 'summary'  # noqa: E731
+        assert cache.get_or_create('k', compute) == 'summary'
+        assert cache.get_or_create('k', compute) == 'summary'
+        assert len(calls) == 1
+        assert cache.stats()['hits'] == 1
+
+    def test_expired_entries_miss(self, connect):
+        cache = AIResponseCache(ttl=-1, connect=connect)
+        cache.put('k', 'old')
+        assert cache.get('k') is None
+
+    def test_errors_are_not_cached(self, connect):
+        cache = AIResponseCache(connect=connect)
+        with pytest.raises(RuntimeError):
+            cache.get_or_create('k', lambda: (_ for _ in ()).throw(RuntimeError('upstream')))
+        assert cache.get_or_create('k', lambda: 'ok') == 'ok'
+
+    def test_concurrent_identical_requests_share_one_call(self, connect):
+        cache = AIResponseCache(connect=connect)
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return 'shared'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_create('k', compute))) for _ in range(4)]
+        for t in threads:
+            t.start()
+        while cache.stats()['coalesced'] < 3:
+            pass
+        release.set()
+        for t in threads:
+            t.join()
+        assert results == ['shared'] * 4
+        assert len(calls) == 1
+
+    def test_coroutines_join_a_threads_call_in_flight(self, connect):
+        cache = AIResponseCache(connect=connect)
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append('sync')
+            release.wait(5)
+            return 'shared'
+
+        async def acompute():
+            calls.append('async')
+            return 'own'
+
+        leader = threading.Thread(target=cache.get_or_create, args=('k', compute))
+        leader.start()
+        while cache.stats()['inflight'] < 1:
+            pass
+
+        async def run():
+            waiters = [asyncio.ensure_future(cache.aget_or_create('k', acompute)) for _ in range(3)]
+            while cache.stats()['coalesced'] < 3:
+                await asyncio.sleep(0.001)
+            release.set()
+            return await asyncio.gather(*waiters)
+
+        assert asyncio.run(run()) == ['shared'] * 3
+        leader.join()
+        assert calls == ['sync']
+
+    def test_cancelled_coroutine_leader_fails_its_waiters(self, connect):
+        cache = AIResponseCache(connect=connect)
+
+        async def acompute():
+            await asyncio.sleep(5)
+            return 'late'
+
+        async def run():
+            leader = asyncio.ensure_future(cache.aget_or_create('k', acompute))
+            while cache.stats()['inflight'] < 1:
+                await asyncio.sleep(0.001)
+            follower = asyncio.ensure_future(cache.aget_or_create('k', acompute))
+            while cache.stats()['coalesced'] < 1:
+                await asyncio.sleep(0.001)
+            leader.cancel()
+            with pytest.raises(RuntimeError):
+                await follower
+            assert leader.cancelled()
+
+        asyncio.run(run())
+        assert cache.get_or_create('k', lambda: 'ok') == 'ok'
+
+    def test_evicts_least_recently_used(self, connect, monkeypatch):
+        monkeypatch.setattr('ai_cache.EVICT_EVERY', 1)
+        cache = AIResponseCache(max_entries=2, connect=connect)
+        for key in ('a', 'b', 'c'):
+            cache.put(key, key)
+        conn = connect()
+        count = conn.execute('SELECT COUNT(*) FROM ai_response_cache').fetchone()[0]
+        conn.close()
+        assert count == 2
+        assert cache.get('a') is None
+
+
+class TestGenerateUsesCache:
+    """Test that /generate answers repeated submissions from the cache"""
+
+    def test_repeat_submission_skips_api(self, client, monkeypatch):
+        import src.app as app_module
+
+        calls = []
+
+        class FakeMessages:
+            def create(self, **kwargs):
+                calls.append(kwargs)
+                return type('R', (), {'content': [type('C', (), {'text': 'A summary'})()]})()
+
+        monkeypatch.setattr(app_module, 'client', type('Client', (), {'messages': FakeMessages()})())
+        monkeypatch.setattr(app_module.job_queue, 'eager', True)
+        app_module.ai_cache.clear()
+        for _ in range(2):
+            response = client.post('/generate', data={'raw_text': 'Same material'})
+            job = client.get(response.get_json()['status_url']).get_json()
+            assert job['result'] == {'summary': 'A summary'}
+        assert len(calls) == 1
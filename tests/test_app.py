@@ -1,3 +1,5 @@
+import re
+
 import pytest
 
 
@@ -27,6 +29,27 @@ class TestNotesFeature:
         assert response.status_code == 200
 
 
+    def test_notes_keyset_pagination(self, client):
+        """Test walking notes newest-first with cursor tokens"""
+        for i in range(5):
+            client.post('/notes', data={'content': f'Paged note {i}'})
+        seen = []
+        cursor = None
+        while True:
+            url = '/notes?format=json&limit=2' + (f'&cursor={cursor}' if cursor else '')
+            data = client.get(url).get_json()
+            seen.extend(note['content'] for note in data['notes'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        assert seen == [f'Paged note {i}' for i in reversed(range(5))]
+
+    def test_invalid_cursor_rejected(self, client):
+        """Test that a malformed cursor returns 400"""
+        response = client.get('/notes?cursor=not-a-cursor')
+        assert response.status_code == 400
+
+
 class TestFlashcardsFeature:
     """Test flashcards management"""
     
@@ -53,6 +76,75 @@ class TestQuizFeature:
         # May redirect if no flashcards
         assert response.status_code in [200, 302]
 
+    def test_quiz_session_grades_drawn_cards(self, client):
+        """Test that a quiz is graded against the session created at draw time"""
+        client.post('/flashcards', data={'term': 'VCN', 'definition': 'Virtual Cloud Network'})
+        page = client.get('/quiz').data.decode()
+        session_id = re.search(r'name="session_id" value="([^"]+)"', page).group(1)
+        card_id = re.search(r'name="(\d+)"', page).group(1)
+        answers = {'session_id': session_id, card_id: 'virtual cloud network'}
+        response = client.post('/quiz', data=answers)
+        assert b'You scored 1 out of 1' in response.data
+        # Resubmitting does not re-grade
+        answers[card_id] = 'wrong'
+        response = client.post('/quiz', data=answers)
+        assert b'You scored 1 out of 1' in response.data
+
+    def test_losing_concurrent_submit_writes_nothing(self, cursor):
+        """Test that a submit whose session was claimed meanwhile keeps the winner's answers"""
+        from quiz_sessions import create_session, grade_session, load_session
+
+        cursor.execute('SELECT id, topic_id, term, definition, definition_tokens FROM flashcards WHERE topic_id = 1')
+        cards = cursor.fetchall()
+        session_id = create_session(cursor, 1, cards)
+        first, second = load_session(cursor, session_id), load_session(cursor, session_id)
+        right = {str(card[0]): card[3] for card in cards}
+        assert grade_session(cursor, first, right) == len(cards)
+        cursor.execute('SELECT due_at FROM flashcards ORDER BY id')
+        schedule = cursor.fetchall()
+        assert grade_session(cursor, second, {}) == len(cards)
+        cursor.execute('SELECT answer, correct FROM quiz_answers WHERE session_id = ? ORDER BY position', (session_id,))
+        assert cursor.fetchall() == [(card[3], 1) for card in cards]
+        cursor.execute('SELECT due_at FROM flashcards ORDER BY id')
+        assert cursor.fetchall() == schedule
+
+    def test_quiz_without_session_grades_submitted_cards(self, client):
+        """Test grading falls back to the submitted card ids"""
+        client.post('/flashcards', data={'term': 'OCI', 'definition': 'Oracle Cloud Infrastructure'})
+        card_id = re.search(r'name="(\d+)"', client.get('/quiz').data.decode()).group(1)
+        response = client.post('/quiz', data={card_id: 'nope'})
+        assert b'You scored 0 out of 1' in response.data
+
+    def test_quiz_without_session_leaves_schedule_alone(self, client):
+        """Test that re-posting answers without a session can't reschedule cards"""
+        from database import get_db_connection
+
+        client.post('/flashcards', data={'term': 'VCN', 'definition': 'Virtual Cloud Network'})
+        card_id = re.search(r'name="(\d+)"', client.get('/quiz').data.decode()).group(1)
+
+        def schedule():
+            conn = get_db_connection()
+            row = conn.execute('SELECT ease, interval_days, repetitions, due_at FROM flashcards WHERE id = ?',
+                               (card_id,)).fetchone()
+            conn.close()
+            return row
+
+        before = schedule()
+        for _ in range(3):
+            response = client.post('/quiz', data={card_id: 'virtual cloud network'})
+            assert b'You scored 1 out of 1' in response.data
+        assert schedule() == before
+
+    def test_quiz_without_session_ignores_odd_card_keys(self, client):
+        """Test that padded ids grade, and non-ASCII digits and surplus ids are ignored"""
+        client.post('/flashcards', data={'term': 'VCN', 'definition': 'Virtual Cloud Network'})
+        card_id = re.search(r'name="(\d+)"', client.get('/quiz').data.decode()).group(1)
+        answers = {'00' + card_id: 'virtual cloud network', '\u0663': 'x', '\u00b2': 'x'}
+        answers.update({str(n): 'x' for n in range(100000, 100500)})
+        response = client.post('/quiz', data=answers)
+        assert response.status_code == 200
+        assert b'You scored 1 out of 1' in response.data
+
 
 class TestErrorHandling:
     """Test error handling and edge cases"""
@@ -80,3 +172,43 @@ class TestTopicManagement:
         """Test that topic creation form loads"""
         response = client.get('/topics/create')
         assert response.status_code == 200
+
+    def test_list_topics_paging_and_sorting(self, client):
+        """Test that the topic list accepts paging and sort arguments"""
+        response = client.get('/topics/?page=1&per_page=1&sort=newest')
+        assert response.status_code == 200
+        response = client.get('/topics/?sort=bogus&page=0')
+        assert response.status_code == 200
+
+    @pytest.mark.parametrize('sort', ['name', '-name', 'newest', 'oldest'])
+    def test_list_topics_cursor_walks_every_topic_once(self, client, sort):
+        """Test that following the Next cursors visits each topic once, in sort order"""
+        for name in ('Delta', 'Alpha', 'Echo', 'Charlie', 'Bravo'):
+            client.post('/topics/create', data={'name': name, 'description': ''})
+        names, url = [], f'/topics/?sort={sort}&per_page=2'
+        while url:
+            html = client.get(url).get_data(as_text=True)
+            names += re.findall(r'<h5 class="card-title">(.*?)</h5>', html)
+            found = re.search(r'href="([^"]*after=[^"]*)"', html)
+            url = found.group(1).replace('&amp;', '&') if found else None
+        by_name = sorted(['General', 'Alpha', 'Bravo', 'Charlie', 'Delta', 'Echo'])
+        created = ['General', 'Delta', 'Alpha', 'Echo', 'Charlie', 'Bravo']
+        expected = {'name': by_name, '-name': by_name[::-1], 'newest': created[::-1], 'oldest': created}
+        assert names == expected[sort]
+
+    def test_list_topics_rejects_a_bad_cursor(self, client):
+        """Test that a cursor from another sort order is refused"""
+        client.post('/topics/create', data={'name': 'Second', 'description': ''})
+        html = client.get('/topics/?sort=newest&per_page=1').get_data(as_text=True)
+        after = re.search(r'after=([^&"]*)', html).group(1)
+        assert client.get(f'/topics/?sort=name&after={after}').status_code == 400
+        assert client.get('/topics/?after=garbage').status_code == 400
+
+    def test_view_topic_shows_counts(self, client):
+        """Test that the topic page renders with note and card counts"""
+        response = client.post('/topics/create', data={'name': 'Counts Topic', 'description': ''})
+        topic_url = response.headers['Location']
+        client.post(topic_url.replace('/topics', '') + '/notes', data={'content': 'A note'})
+        response = client.get(topic_url)
+        assert b'Counts Topic' in response.data
+        assert b'1 notes' in response.data
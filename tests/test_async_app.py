@@ -0,0 +1,215 @@
+import asyncio
+import sqlite3
+import time
+from urllib.parse import urlencode
+
+import pytest
+
+from llm_gateway import BackendError, FakeBackend, LLMGateway, LLMTimeout
+
+
+def make_gateway(backend=None, **kwargs):
+    options = dict(retry_base=0.001, retry_max=0.01, breaker_threshold=3, breaker_cooldown=60, timeout=5)
+    options.update(kwargs)
+    return LLMGateway(backend or FakeBackend(), **options)
+
+
+def call(asgi, method, path, form=None, disconnect_after=None):
+    """Drive one ASGI request; returns (status, headers, body). Disconnects after N body messages if given."""
+    body = urlencode(form).encode() if form else b''
+    headers = [(b'content-type', b'application/x-www-form-urlencoded')] if form else []
+
+    async def run():
+        sent = []
+        pending = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        gone = asyncio.Event()
+
+        async def receive():
+            if pending:
+                return pending.pop(0)
+            await gone.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+            bodies = [m for m in sent if m['type'] == 'http.response.body']
+            if disconnect_after is not None and len(bodies) >= disconnect_after:
+                gone.set()
+
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'headers': headers,
+                 'http_version': '1.1', 'scheme': 'http', 'server': ('testserver', 80), 'client': ('127.0.0.1', 1)}
+        await asgi(scope, receive, send)
+        return sent
+
+    sent = asyncio.run(run())
+    start = next(m for m in sent if m['type'] == 'http.response.start')
+    payload = b''.join(m.get('body', b'') for m in sent if m['type'] == 'http.response.body')
+    return start['status'], dict(start['headers']), payload.decode()
+
+
+@pytest.fixture
+def asgi_app(app, monkeypatch):
+    import src.app as app_module
+    from async_app import AsyncApp
+
+    monkeypatch.setattr(app_module, 'gateway', make_gateway(FakeBackend(reply=lambda p: 'Subnets split a VCN')))
+    app_module.ai_cache.clear()
+    asgi = AsyncApp(app_module, threads=4)
+    yield asgi
+    asgi.bridge.executor.shutdown()
+
+
+def note_contents():
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        return [row[0] for row in conn.execute('SELECT content FROM notes')]
+    finally:
+        conn.close()
+
+
+class TestNativeStream:
+    def test_streams_deltas_and_saves_note(self, asgi_app):
+        status, headers, body = call(asgi_app, 'POST', '/generate/stream', {'raw_text': 'Networking basics'})
+        assert status == 200
+        assert headers[b'content-type'].startswith(b'text/event-stream')
+        assert body.startswith(': stream open')
+        assert 'event: done' in body
+        assert note_contents() == ['Subnets split a VCN']
+
+    def test_long_text_maps_chunks_as_coroutines(self, asgi_app, monkeypatch):
+        import src.app as app_module
+
+        backend = FakeBackend(reply=lambda p: 'Merged notes' if p.startswith('Merge') else 'Section notes')
+
+        def blocking_call(*args):
+            raise AssertionError('map phase used the sync client')
+
+        monkeypatch.setattr(backend, 'create', blocking_call)
+        monkeypatch.setattr(app_module, 'gateway', make_gateway(backend))
+        raw_text = '\n\n'.join(f'Section {i}. ' + 'Subnets split a VCN. ' * 350 for i in range(3))
+        status, _, body = call(asgi_app, 'POST', '/generate/stream', {'raw_text': raw_text})
+        assert status == 200
+        assert '"stage": "map", "chunks": 3' in body and 'event: done' in body
+        assert len(backend.calls) == 4
+        assert note_contents() == ['Merged notes']
+        # Chunk and merge results go through the response cache, as in sync mode
+        call(asgi_app, 'POST', '/generate/stream', {'raw_text': raw_text})
+        assert len(backend.calls) == 4
+
+    def test_failed_save_ends_with_the_same_error_event(self, asgi_app, monkeypatch):
+        import async_app
+
+        async def locked(*args):
+            raise sqlite3.OperationalError('database is locked')
+
+        monkeypatch.setattr(async_app.async_db, 'execute', locked)
+        _, _, body = call(asgi_app, 'POST', '/generate/stream', {'raw_text': 'Networking basics'})
+        assert body.endswith('event: error\ndata: {"error": "Error generating summary: database is locked"}\n\n')
+        assert 'event: done' not in body
+
+    def test_concurrent_identical_prompts_share_one_call(self, asgi_app, monkeypatch):
+        import src.app as app_module
+        from async_app import agenerate_text
+
+        backend = FakeBackend(reply=lambda p: 'Section notes', latency=0.2)
+        gateway = make_gateway(backend)
+        monkeypatch.setattr(app_module, 'gateway', gateway)
+
+        async def run():
+            return await asyncio.gather(*[agenerate_text(gateway, 'Summarize: {raw_text}', 'VCNs', 100)
+                                          for _ in range(5)])
+
+        assert asyncio.run(run()) == ['Section notes'] * 5
+        assert len(backend.calls) == 1
+
+    def test_subdirectory_prefix_is_routed(self, asgi_app):
+        status, _, body = call(asgi_app, 'POST', '/study/generate/stream', {'raw_text': 'Networking basics'})
+        assert status == 200
+        assert 'event: done' in body
+
+    def test_missing_text_is_rejected(self, asgi_app):
+        status, _, body = call(asgi_app, 'POST', '/generate/stream', {'raw_text': '  '})
+        assert status == 400
+        assert 'raw_text is required' in body
+
+    def test_open_circuit_returns_503(self, asgi_app, monkeypatch):
+        import src.app as app_module
+
+        backend = FakeBackend()
+        backend.failures = [BackendError('down', 500)]
+        gateway = make_gateway(backend, max_retries=0, breaker_threshold=1)
+        monkeypatch.setattr(app_module, 'gateway', gateway)
+        with pytest.raises(BackendError):
+            gateway.complete('prompt', 10)
+        status, _, body = call(asgi_app, 'POST', '/generate/stream', {'raw_text': 'Networking basics'})
+        assert status == 503
+        assert 'unavailable' in body
+
+    def test_disconnect_closes_upstream_and_saves_nothing(self, asgi_app, monkeypatch):
+        import src.app as app_module
+
+        backend = FakeBackend(reply=lambda p: ' '.join(['word'] * 50), token_delay=0.01)
+        monkeypatch.setattr(app_module, 'gateway', make_gateway(backend))
+        call(asgi_app, 'POST', '/generate/stream', {'raw_text': 'Networking basics'}, disconnect_after=3)
+        assert backend.closed == 1
+        assert note_contents() == []
+
+
+class TestBridge:
+    def test_flask_routes_are_served(self, asgi_app):
+        status, headers, body = call(asgi_app, 'POST', '/notes', {'content': 'Bridged note'})
+        assert status in (200, 302)
+        status, headers, body = call(asgi_app, 'GET', '/notes')
+        assert status == 200
+        assert 'Bridged note' in body
+        assert b'server-timing' in headers
+
+    def test_lifespan_startup_and_shutdown(self, asgi_app):
+        async def run():
+            messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+            sent = []
+
+            async def receive():
+                return messages.pop(0)
+
+            async def send(message):
+                sent.append(message['type'])
+
+            await asgi_app({'type': 'lifespan'}, receive, send)
+            return sent
+
+        assert asyncio.run(run()) == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+
+
+class TestAsyncGateway:
+    def test_acomplete_retries_then_succeeds(self):
+        backend = FakeBackend(reply=lambda prompt: 'ok')
+        backend.failures = [BackendError('overloaded', 529)]
+        gateway = make_gateway(backend)
+        assert asyncio.run(gateway.acomplete('prompt', 10)) == 'ok'
+        assert len(backend.calls) == 2
+        assert gateway.stats()['retries'] == 1
+
+    def test_astream_cut_off_at_deadline(self):
+        backend = FakeBackend(reply=lambda prompt: ' '.join(['word'] * 50), token_delay=0.01)
+        gateway = make_gateway(backend, timeout=0.1)
+
+        async def run():
+            async with gateway.astream('prompt', 10) as deltas:
+                return [d async for d in deltas]
+
+        with pytest.raises(LLMTimeout):
+            asyncio.run(run())
+        assert backend.closed == 1
+
+    def test_async_streams_are_not_capped_by_thread_limit(self):
+        gateway = make_gateway(FakeBackend(latency=0.05), max_concurrency=1, async_max_concurrency=50)
+
+        async def run():
+            return await asyncio.gather(*(gateway.acomplete('prompt', 10) for _ in range(20)))
+
+        started = time.monotonic()
+        assert len(asyncio.run(run())) == 20
+        assert time.monotonic() - started < 0.5
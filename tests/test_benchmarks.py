@@ -0,0 +1,84 @@
+"""Tests for the benchmark harness: fake Anthropic server, seeding and the load runner"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+from fake_anthropic import FakeAnthropic  # noqa: E402
+import load_test  # noqa: E402
+import seed as seed_module  # noqa: E402
+
+
+@pytest.fixture
+def fake():
+    with FakeAnthropic(latency=0, token_delay=0, tokens=30, seed=1) as server:
+        yield server
+
+
+def test_fake_anthropic_speaks_the_sdk_protocol(fake):
+    from anthropic import Anthropic
+    client = Anthropic(api_key='fake', base_url=fake.base_url, max_retries=0)
+
+    message = client.messages.create(model='m', max_tokens=10, messages=[{'role': 'user', 'content': 'Summarize this'}])
+    assert message.content[0].text
+    assert message.usage.output_tokens == 30
+
+    with client.messages.stream(model='m', max_tokens=10,
+                                messages=[{'role': 'user', 'content': 'Create flashcards from this'}]) as stream:
+        text = ''.join(stream.text_stream)
+    assert len(text.splitlines()) == 5
+    assert all(':' in line for line in text.splitlines())
+    assert fake.requests == 2
+
+
+def test_fake_anthropic_error_rate():
+    from anthropic import Anthropic, APIStatusError
+    with FakeAnthropic(latency=0, error_rate=1.0) as server:
+        client = Anthropic(api_key='fake', base_url=server.base_url, max_retries=0)
+        with pytest.raises(APIStatusError) as e:
+            client.messages.create(model='m', max_tokens=10, messages=[{'role': 'user', 'content': 'x'}])
+    assert e.value.status_code == 529
+
+
+def test_seed_spreads_rows_over_topics(app):
+    from database import get_db_connection
+    conn = get_db_connection()
+    result = seed_module.seed(conn, rows=1000, topics=4, notes_fraction=0.4, batch=100, log=lambda *a: None)
+    c = conn.cursor()
+    c.execute('SELECT topic_id, COUNT(*) FROM flashcards GROUP BY topic_id')
+    counts = dict(c.fetchall())
+    conn.close()
+    assert len(result['topic_ids']) == 4
+    assert (result['notes'], result['flashcards']) == (400, 600)
+    assert sorted(counts) == sorted(result['topic_ids'])
+    assert set(counts.values()) == {150}
+
+
+def test_load_run_reports_latency_and_queries(app):
+    from database import get_db_connection
+    conn = get_db_connection()
+    seed_module.seed(conn, rows=200, topics=2, log=lambda *a: None)
+    conn.close()
+
+    mix = load_test.parse_mix('topics=1,notes=1,flashcards=1,quiz=1')
+    samples, seconds = load_test.run(lambda: load_test.InProcessClient(app), mix, concurrency=2, requests=20)
+    report = load_test.summarize(samples, seconds)
+
+    assert report['overall']['errors'] == 0
+    assert report['overall']['count'] >= 20
+    for op in ('topics', 'notes', 'flashcards', 'quiz_draw'):
+        stats = report['operations'][op]
+        assert stats['p50_ms'] <= stats['p95_ms'] <= stats['p99_ms']
+        assert stats['queries_per_request'] >= 1
+
+
+def test_percentile_and_mix_parsing():
+    values = sorted(range(1, 101))
+    assert load_test.percentile(values, 50) == 50
+    assert load_test.percentile(values, 99) == 99
+    assert load_test.percentile([], 50) is None
+    assert load_test.parse_mix('browse') == load_test.MIXES['browse']
+    with pytest.raises(Exception):
+        load_test.parse_mix('nope=1')
@@ -0,0 +1,69 @@
+import io
+import json
+import sqlite3
+
+from bulk import insert_flashcards
+from migrations import migrate
+
+
+class TestInsertFlashcards:
+    """Test batched flashcard inserts"""
+
+    def test_inserts_non_empty_pairs_with_tokens(self):
+        conn = sqlite3.connect(':memory:')
+        migrate(conn)
+        conn.execute("INSERT INTO topics (name) VALUES ('T')")
+        count = insert_flashcards(conn.cursor(), 1, [('VCN', 'Virtual Cloud Network'), ('', 'skipped'), ('x', ' ')])
+        assert count == 1
+        row = conn.execute('SELECT term, definition_tokens FROM flashcards').fetchone()
+        assert row == ('VCN', 'cloud network virtual')
+        conn.close()
+
+
+class TestImportEndpoint:
+    """Test streaming CSV/JSONL imports"""
+
+    def test_csv_upload_in_batches(self, client):
+        body = 'term,definition\n' + ''.join(f'Term {i},"Definition, number {i}"\n' for i in range(25))
+        response = client.post('/1/flashcards/import?batch_size=10',
+                               data={'file': (io.BytesIO(body.encode()), 'deck.csv')},
+                               content_type='multipart/form-data')
+        stats = response.get_json()
+        assert response.status_code == 200
+        assert stats['imported'] == 25
+        assert stats['batches'] == 3
+        assert 'rows_per_sec' in stats
+        cards = client.get('/1/flashcards?format=json&limit=1').get_json()['flashcards']
+        assert cards[0]['definition'] == 'Definition, number 24'
+
+    def test_jsonl_raw_body(self, client):
+        body = '\n'.join(json.dumps({'term': f'T{i}', 'definition': f'D{i}'}) for i in range(5))
+        response = client.post('/1/flashcards/import', data=body, content_type='application/x-ndjson')
+        assert response.get_json()['imported'] == 5
+
+    def test_bad_rows_rejected(self, client):
+        response = client.post('/1/flashcards/import?format=jsonl', data='{"term": "only"}\n',
+                               content_type='application/octet-stream')
+        assert response.status_code == 400
+
+    def test_undecodable_and_malformed_uploads_rejected(self, client):
+        for body, fmt in ((b'VCN,\xff\xfe\n', 'csv'), (b'{"term": "\xff", "definition": "x"}\n', 'jsonl'),
+                          (b'VCN,"' + b'x' * 200000 + b'"\n', 'csv')):
+            response = client.post(f'/1/flashcards/import?format={fmt}', data=body,
+                                   content_type='application/octet-stream')
+            assert response.status_code == 400, body[:20]
+
+    def test_non_string_values_rejected(self, client):
+        for record in ({'term': 7, 'definition': 'seven'}, {'term': 'VCN', 'definition': ['a', 'b']}):
+            response = client.post('/1/flashcards/import?format=jsonl', data=json.dumps(record) + '\n',
+                                   content_type='application/octet-stream')
+            assert response.status_code == 400
+            assert 'must be strings' in response.get_json()['error']
+
+    def test_unknown_format_rejected(self, client):
+        response = client.post('/1/flashcards/import', data='x', content_type='text/plain')
+        assert response.status_code == 400
+
+    def test_unknown_topic(self, client):
+        response = client.post('/9999/flashcards/import?format=csv', data='a,b\n', content_type='text/csv')
+        assert response.status_code == 404
@@ -0,0 +1,49 @@
+import database
+
+
+class TestConditionalGet:
+    """Test ETag / 304 handling on topic pages"""
+
+    def test_unchanged_page_is_304(self, client):
+        client.post('/1/notes', data={'content': 'First note'})
+        first = client.get('/1/notes')
+        etag = first.headers['ETag']
+        assert first.headers['Last-Modified']
+        assert 'no-cache' in first.headers['Cache-Control']
+        second = client.get('/1/notes', headers={'If-None-Match': etag})
+        assert second.status_code == 304
+        assert second.data == b''
+        assert second.headers['ETag'] == etag
+
+    def test_note_write_changes_etag(self, client):
+        etag = client.get('/1/notes').headers['ETag']
+        client.post('/1/notes', data={'content': 'New note'})
+        response = client.get('/1/notes', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert b'New note' in response.data
+
+    def test_flashcard_delete_changes_topic_etag(self, client):
+        client.post('/1/flashcards', data={'term': 'OCI', 'definition': 'Oracle Cloud Infrastructure'})
+        etag = client.get('/topics/1').headers['ETag']
+        assert client.get('/topics/1', headers={'If-None-Match': etag}).status_code == 304
+        conn = database.get_pool().acquire()
+        conn.execute('DELETE FROM flashcards')
+        conn.commit()
+        database.get_pool().release(conn)
+        assert client.get('/topics/1', headers={'If-None-Match': etag}).status_code == 200
+
+    def test_etag_depends_on_url_and_topic_edit(self, client):
+        html = client.get('/1/flashcards').headers['ETag']
+        as_json = client.get('/1/flashcards?format=json').headers['ETag']
+        assert html != as_json
+        client.post('/topics/1/edit', data={'name': 'Renamed', 'description': ''})
+        assert client.get('/1/flashcards', headers={'If-None-Match': html}).status_code == 200
+
+    def test_other_topics_unaffected(self, client):
+        client.post('/topics/create', data={'name': 'Second', 'description': ''})
+        etag = client.get('/2/notes').headers['ETag']
+        client.post('/1/notes', data={'content': 'General note'})
+        assert client.get('/2/notes', headers={'If-None-Match': etag}).status_code == 304
+
+    def test_missing_topic_still_404(self, client):
+        assert client.get('/999/notes').status_code == 404
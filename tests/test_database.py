@@ -0,0 +1,158 @@
+import threading
+
+import pytest
+
+from database import PoolTimeout, PostgresPool, SQLiteThreadPool, get_db_connection, get_dedicated_connection
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        if self.conn.broken:
+            raise RuntimeError('server closed the connection')
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.broken = False
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class TestPostgresPool:
+    """Test the bounded PostgreSQL pool with a fake driver"""
+
+    def test_reuses_released_connection(self):
+        pool = PostgresPool(FakeConnection, max_size=2)
+        conn = pool.acquire()
+        pool.release(conn)
+        assert pool.acquire() is conn
+        assert pool.stats()['created'] == 1
+        assert pool.stats()['reused'] == 1
+
+    def test_release_rolls_back(self):
+        pool = PostgresPool(FakeConnection, max_size=1)
+        conn = pool.acquire()
+        pool.release(conn)
+        assert conn.rollbacks == 1
+
+    def test_headroom_counts_idle_and_unopened(self):
+        pool = PostgresPool(FakeConnection, max_size=3)
+        first, second = pool.acquire(), pool.acquire()
+        assert pool.headroom() == 1
+        pool.release(first)
+        assert pool.headroom() == 2
+        pool.release(second)
+
+    def test_times_out_when_exhausted(self):
+        pool = PostgresPool(FakeConnection, max_size=1, timeout=0.05)
+        pool.acquire()
+        with pytest.raises(PoolTimeout):
+            pool.acquire()
+        assert pool.stats()['timeouts'] == 1
+
+    def test_waiter_gets_released_connection(self):
+        pool = PostgresPool(FakeConnection, max_size=1, timeout=2)
+        conn = pool.acquire()
+        got = []
+        waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+        waiter.start()
+        pool.release(conn)
+        waiter.join()
+        assert got == [conn]
+
+    def test_recycles_old_connections(self):
+        pool = PostgresPool(FakeConnection, max_size=1, max_lifetime=0)
+        conn = pool.acquire()
+        pool.release(conn)
+        assert conn.closed
+        assert pool.acquire() is not conn
+
+    def test_health_check_replaces_dead_connection(self):
+        pool = PostgresPool(FakeConnection, max_size=1, health_check_after=0)
+        conn = pool.acquire()
+        pool.release(conn)
+        conn.broken = True
+        assert pool.acquire() is not conn
+        assert pool.stats()['health_check_failures'] == 1
+
+
+class TestSQLiteThreadPool:
+    """Test per-thread SQLite connections"""
+
+    def test_same_thread_shares_connection(self, tmp_path):
+        pool = SQLiteThreadPool(str(tmp_path / 'db.sqlite'))
+        assert pool.acquire() is pool.acquire()
+        pool.close_all()
+
+    def test_wal_mode_enabled(self, tmp_path):
+        pool = SQLiteThreadPool(str(tmp_path / 'db.sqlite'))
+        mode = pool.acquire().execute('PRAGMA journal_mode').fetchone()[0]
+        assert mode == 'wal'
+        pool.close_all()
+
+    def test_dedicated_connection_is_separate(self, tmp_path):
+        pool = SQLiteThreadPool(str(tmp_path / 'db.sqlite'))
+        shared = pool.acquire()
+        assert pool.acquire_dedicated() is not shared
+        assert pool.acquire_dedicated() is pool.acquire_dedicated()
+        pool.close_all()
+
+    def test_threads_get_their_own_connection(self, tmp_path):
+        pool = SQLiteThreadPool(str(tmp_path / 'db.sqlite'))
+        main = pool.acquire()
+        other = []
+        t = threading.Thread(target=lambda: other.append(pool.acquire()))
+        t.start()
+        t.join()
+        assert other[0] is not main
+        pool.close_all()
+
+
+class TestRequestScope:
+    """Test that a request reuses one connection"""
+
+    def test_one_connection_per_request(self, app):
+        with app.test_request_context('/'):
+            first = get_db_connection()
+            first.close()
+            assert get_db_connection() is first
+
+    def test_cache_store_commits_apart_from_the_request(self, app):
+        from ai_cache import ai_cache
+
+        with app.test_request_context('/'):
+            conn = get_db_connection()
+            conn.cursor().execute('SELECT id FROM topics').fetchall()
+            ai_cache.put('key', 'cached text')
+            assert not conn.in_transaction
+            assert get_dedicated_connection().execute('SELECT response FROM ai_response_cache').fetchone() == \
+                ('cached text',)
+
+    def test_cache_store_never_commits_request_writes(self, app):
+        from ai_cache import ai_cache
+
+        with app.test_request_context('/'):
+            conn = get_db_connection()
+            conn.cursor().execute("INSERT INTO notes (topic_id, content) VALUES (1, 'pending')")
+            ai_cache.put('key', 'cached text')
+            assert conn.in_transaction
+            conn.rollback()
+            assert conn.execute('SELECT COUNT(*) FROM notes').fetchone()[0] == 0
@@ -0,0 +1,39 @@
+import csv
+import gzip
+import io
+import json
+
+
+class TestExport:
+    """Test streaming topic exports"""
+
+    def test_topic_jsonl(self, client):
+        client.post('/1/notes', data={'content': 'Exported note'})
+        client.post('/1/flashcards', data={'term': 'VCN', 'definition': 'Virtual Cloud Network'})
+        response = client.get('/topics/1/export')
+        assert response.mimetype == 'application/x-ndjson'
+        assert 'attachment' in response.headers['Content-Disposition']
+        records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert records[0] == {'type': 'topic', 'topic_id': 1, 'id': 1, 'name': 'General',
+                              'description': 'Default study topic'}
+        assert any(r['type'] == 'note' and r['content'] == 'Exported note' for r in records)
+        assert any(r['type'] == 'flashcard' and r['term'] == 'VCN' for r in records)
+
+    def test_csv_with_gzip(self, client):
+        client.post('/1/flashcards', data={'term': 'OCI', 'definition': 'Oracle, Cloud'})
+        response = client.get('/topics/1/export?format=csv&gzip=1')
+        assert response.mimetype == 'application/gzip'
+        rows = list(csv.reader(io.StringIO(gzip.decompress(response.data).decode())))
+        assert rows[0] == ['type', 'topic_id', 'id', 'title', 'body', 'created_at']
+        assert ['flashcard', '1'] == rows[-1][:2] and rows[-1][4] == 'Oracle, Cloud'
+
+    def test_all_topics(self, client):
+        client.post('/topics/create', data={'name': 'Second', 'description': ''})
+        response = client.get('/topics/export')
+        topics = [json.loads(line)['name'] for line in response.get_data(as_text=True).splitlines()
+                  if json.loads(line)['type'] == 'topic']
+        assert topics == ['General', 'Second']
+
+    def test_errors(self, client):
+        assert client.get('/topics/9999/export').status_code == 404
+        assert client.get('/topics/1/export?format=xml').status_code == 400
@@ -0,0 +1,74 @@
+from fragment_cache import FragmentCache, fragment_cache
+
+
+class TestFragmentCache:
+    """Test the rendered-fragment cache"""
+
+    def test_renders_once_per_key(self):
+        cache = FragmentCache()
+        calls = []
+
+        def render():
+            calls.append(1)
+            return '<li>x</li>'
+
+        assert cache.render(('notes', 1, 3), render) == '<li>x</li>'
+        assert cache.render(('notes', 1, 3), render) == '<li>x</li>'
+        cache.render(('notes', 1, 4), render)
+        assert len(calls) == 2
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses']) == (1, 2)
+        assert stats['saved_seconds'] > 0
+
+    def test_lru_bound(self):
+        cache = FragmentCache(max_entries=2)
+        for version in range(5):
+            cache.render(('notes', 1, version), lambda: 'html')
+        assert cache.stats()['entries'] == 2
+
+    def test_disk_backend_shared_between_workers(self, tmp_path):
+        first, second = FragmentCache(directory=str(tmp_path)), FragmentCache(directory=str(tmp_path))
+        first.render(('topics', '0.0', 'name', 1, 24), lambda: '<div>grid</div>')
+        html = second.render(('topics', '0.0', 'name', 1, 24), lambda: 'rendered again')
+        assert html == '<div>grid</div>'
+        assert second.stats()['disk_hits'] == 1
+
+    def test_disk_entries_from_another_deploy_not_served(self, tmp_path):
+        old, new = FragmentCache(directory=str(tmp_path), salt='v1'), FragmentCache(directory=str(tmp_path), salt='v2')
+        old.render(('notes', 1, 3), lambda: '<li>old template</li>')
+        assert new.render(('notes', 1, 3), lambda: '<li>new template</li>') == '<li>new template</li>'
+        assert new.stats()['disk_hits'] == 0
+
+    def test_disk_eviction(self, tmp_path):
+        cache = FragmentCache(directory=str(tmp_path))
+        cache.disk.max_entries = 3
+        for version in range(6):
+            cache.render(('notes', 1, version), lambda: 'html')
+        assert cache.disk.evict() == 3
+        assert len(list(tmp_path.glob('*.json'))) == 3
+
+
+class TestCachedPages:
+    """Test that list pages reuse fragments until their topic changes"""
+
+    def test_notes_page_hits_until_write(self, client):
+        client.post('/1/notes', data={'content': 'Cached note'})
+        client.get('/1/notes')
+        before = fragment_cache.stats()
+        assert b'Cached note' in client.get('/1/notes').data
+        assert fragment_cache.stats()['hits'] == before['hits'] + 1
+        client.post('/1/notes', data={'content': 'Fresh note'})
+        assert b'Fresh note' in client.get('/1/notes').data
+
+    def test_topic_list_sees_new_content(self, client):
+        assert b'0 notes' in client.get('/topics/').data
+        client.post('/1/notes', data={'content': 'Counted'})
+        assert b'1 notes' in client.get('/topics/').data
+        client.post('/topics/create', data={'name': 'Another', 'description': ''})
+        assert b'Another' in client.get('/topics/').data
+
+    def test_stats_report_render_time_saved(self, client):
+        client.get('/flashcards')
+        client.get('/flashcards')
+        stats = client.get('/cache/stats').get_json()['fragments']
+        assert stats['hits'] >= 1 and stats['saved_seconds'] > 0
@@ -0,0 +1,46 @@
+from grading import definition_tokens, grade_batch, normalize, similarity, tokenize
+
+
+class TestGrading:
+    """Test answer normalization and token-set grading"""
+
+    def test_normalize_strips_case_accents_and_punctuation(self):
+        assert normalize('  Réseau, Virtual-Cloud!  ') == 'reseau virtual cloud'
+
+    def test_normalize_keeps_non_latin_text(self):
+        assert normalize('Привет, МИР!') == 'привет мир'
+        assert normalize('東京') == '東京'
+
+    def test_grade_batch_non_latin_definition(self):
+        stored = definition_tokens('Виртуальная облачная сеть')
+        [(correct, score)] = grade_batch([('виртуальная облачная сеть', stored, None)])
+        assert correct and score == 1.0
+        assert grade_batch([('東京', definition_tokens('東京'), None)])[0][0] is True
+
+    def test_tokenize_drops_stopwords_and_plurals(self):
+        assert tokenize('The networks of a region') == frozenset({'network', 'region'})
+
+    def test_tokenize_keeps_all_stopword_text(self):
+        assert tokenize('to be') == frozenset({'to', 'be'})
+
+    def test_similarity_bounds(self):
+        assert similarity(frozenset({'a'}), frozenset({'a'})) == 1.0
+        assert similarity(frozenset(), frozenset({'a'})) == 0.0
+
+    def test_grade_batch_uses_stored_tokens_and_threshold(self):
+        stored = definition_tokens('Virtual Cloud Network')
+        results = grade_batch([
+            ('a virtual cloud network', stored, None),
+            ('cloud network', stored, None),
+            ('database', stored, None),
+            ('', stored, None),
+        ])
+        assert [correct for correct, _ in results] == [True, True, False, False]
+
+    def test_grade_batch_falls_back_to_definition(self):
+        [(correct, score)] = grade_batch([('object storage', None, 'Object Storage')])
+        assert correct and score == 1.0
+
+    def test_custom_threshold(self):
+        stored = definition_tokens('Virtual Cloud Network')
+        assert grade_batch([('cloud network', stored, None)], threshold=0.9)[0][0] is False
@@ -0,0 +1,129 @@
+import time
+
+import pytest
+
+from jobs import JobQueue, QueueFull
+
+
+def fake_client(text):
+    class FakeMessages:
+        def create(self, **kwargs):
+            return type('R', (), {'content': [type('C', (), {'text': text})()]})()
+
+    return type('Client', (), {'messages': FakeMessages()})()
+
+
+@pytest.fixture
+def app_module(monkeypatch):
+    import src.app as app_module
+
+    monkeypatch.setattr(app_module, 'client', fake_client('VCN: Virtual Cloud Network\nOCI: Oracle Cloud'))
+    app_module.ai_cache.clear()
+    return app_module
+
+
+def wait_for(client, status_url, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(status_url).get_json()
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f'job did not finish: {job}')
+
+
+class TestAIJobs:
+    """Test AI generation through the background job queue"""
+
+    def test_generate_returns_202_and_job_completes(self, client, app_module):
+        response = client.post('/flashcards', data={'raw_text': 'Some material'})
+        assert response.status_code == 202
+        job = wait_for(client, response.get_json()['status_url'])
+        assert job['status'] == 'done'
+        assert job['result']['count'] == 2
+        cards = client.get('/flashcards?format=json').get_json()['flashcards']
+        assert {card['term'] for card in cards} >= {'VCN', 'OCI'}
+
+    def test_failed_job_records_error(self, client, app_module, monkeypatch):
+        def boom(*args, **kwargs):
+            raise RuntimeError('upstream down')
+
+        monkeypatch.setattr(app_module, 'generate_text', boom)
+        response = client.post('/generate', data={'raw_text': 'Some material'})
+        job = wait_for(client, response.get_json()['status_url'])
+        assert job['status'] == 'failed'
+        assert 'upstream down' in job['error']
+
+    def test_unknown_job_is_404(self, client):
+        assert client.get('/jobs/does-not-exist').status_code == 404
+
+    def test_first_request_resumes_queued_jobs(self, client, app_module, monkeypatch):
+        from database import get_db_connection
+
+        monkeypatch.setattr(app_module.job_queue, '_started_pid', None)
+        conn = get_db_connection()
+        conn.execute("INSERT INTO ai_jobs (id, kind, topic_id, status, progress, payload, created_at)"
+                     " VALUES ('left-behind', 'flashcards', 1, 'queued', 'queued', ?, ?)",
+                     ('{"raw_text": "Some material"}', time.time()))
+        conn.commit()
+        conn.close()
+        job = wait_for(client, '/jobs/left-behind')
+        assert job['status'] == 'done' and job['result']['count'] == 2
+
+    def test_stats_report_queue_depth(self, client):
+        stats = client.get('/jobs/stats').get_json()
+        assert 'queue_depth' in stats and 'run_time_p95' in stats
+
+
+class TestJobQueue:
+    """Test queue bounds"""
+
+    def test_rejects_when_full(self, app):
+        queue = JobQueue(workers=0, max_queued=1)
+        queue.init_app(app)
+        queue.handler('noop')(lambda job: None)
+        with app.app_context():
+            queue.submit('noop', None, {})
+            with pytest.raises(QueueFull):
+                queue.submit('noop', None, {})
+        assert queue.stats()['rejected'] == 1
+
+    def test_resume_pending_fails_stale_running_jobs(self, app):
+        from database import get_db_connection
+
+        queue = JobQueue(workers=1, stale_after=60)
+        queue.init_app(app)
+        queue.handler('noop')(lambda job: {'ok': True})
+        now = time.time()
+        conn = get_db_connection()
+        for job_id, status, started_at in (('queued', 'queued', None), ('stale', 'running', now - 120),
+                                           ('busy', 'running', now - 5)):
+            conn.execute('INSERT INTO ai_jobs (id, kind, status, progress, payload, created_at, started_at)'
+                         ' VALUES (?, ?, ?, ?, ?, ?, ?)', (job_id, 'noop', status, status, '{}', now - 200, started_at))
+        conn.commit()
+        conn.close()
+        with app.app_context():
+            assert queue.resume_pending() == 1
+            deadline = time.monotonic() + 5
+            while queue.get('queued')['status'] != 'done' and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert queue.get('queued')['result'] == {'ok': True}
+            assert queue.get('stale')['status'] == 'failed'
+            assert 'Interrupted' in queue.get('stale')['error']
+            assert queue.get('busy')['status'] == 'running'
+
+    def test_failed_job_rolls_back_its_writes(self, app):
+        from database import get_db_connection
+
+        queue = JobQueue(workers=0, eager=True)
+        queue.init_app(app)
+
+        @queue.handler('half-done')
+        def half_done(job):
+            get_db_connection().cursor().execute("INSERT INTO notes (topic_id, content) VALUES (1, 'partial')")
+            raise RuntimeError('model went away')
+
+        with app.app_context():
+            job = queue.get(queue.submit('half-done', 1, {}))
+            assert job['status'] == 'failed'
+            assert get_db_connection().execute('SELECT COUNT(*) FROM notes').fetchone()[0] == 0
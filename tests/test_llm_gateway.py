@@ -0,0 +1,178 @@
+import threading
+import time
+
+import pytest
+
+from llm_gateway import BackendError, FakeBackend, LLMGateway, LLMTimeout, LLMUnavailable
+
+
+def make_gateway(backend=None, **kwargs):
+    options = dict(retry_base=0.001, retry_max=0.01, breaker_threshold=3, breaker_cooldown=60, timeout=5)
+    options.update(kwargs)
+    return LLMGateway(backend or FakeBackend(), **options)
+
+
+class TestRetries:
+    def test_retries_429_and_5xx_then_succeeds(self):
+        backend = FakeBackend(reply=lambda prompt: 'ok')
+        backend.failures = [BackendError('rate limited', 429), BackendError('overloaded', 529)]
+        gateway = make_gateway(backend)
+        assert gateway.complete('prompt', 10) == 'ok'
+        assert len(backend.calls) == 3
+        assert gateway.stats()['retries'] == 2
+
+    def test_client_errors_are_not_retried(self):
+        backend = FakeBackend()
+        backend.failures = [BackendError('bad request', 400)]
+        gateway = make_gateway(backend)
+        with pytest.raises(BackendError):
+            gateway.complete('prompt', 10)
+        assert len(backend.calls) == 1
+        assert gateway.stats()['consecutive_failures'] == 0
+
+    def test_gives_up_after_max_retries(self):
+        backend = FakeBackend()
+        backend.failures = [BackendError('down', 503)] * 5
+        gateway = make_gateway(backend, max_retries=2)
+        with pytest.raises(BackendError):
+            gateway.complete('prompt', 10)
+        assert len(backend.calls) == 3
+
+    def test_retry_after_longer_than_deadline_fails_now(self):
+        backend = FakeBackend()
+        backend.failures = [BackendError('slow down', 429, retry_after=30)]
+        gateway = make_gateway(backend, timeout=1)
+        started = time.monotonic()
+        with pytest.raises(BackendError):
+            gateway.complete('prompt', 10)
+        assert time.monotonic() - started < 0.5
+
+
+class TestDeadlines:
+    def test_slow_backend_times_out(self):
+        gateway = make_gateway(FakeBackend(latency=1.0), timeout=0.1, max_retries=5)
+        started = time.monotonic()
+        with pytest.raises(LLMTimeout):
+            gateway.complete('prompt', 10)
+        assert time.monotonic() - started < 0.5
+
+    def test_stream_cut_off_at_deadline(self):
+        backend = FakeBackend(reply=lambda prompt: ' '.join(['word'] * 50), token_delay=0.01)
+        gateway = make_gateway(backend, timeout=0.1)
+        with pytest.raises(LLMTimeout):
+            with gateway.stream('prompt', 10) as deltas:
+                list(deltas)
+        assert backend.closed == 1
+
+
+class TestCircuitBreaker:
+    def test_opens_after_consecutive_failures_and_fails_fast(self):
+        backend = FakeBackend()
+        backend.failures = [BackendError('down', 500)] * 3
+        gateway = make_gateway(backend, max_retries=0)
+        for _ in range(3):
+            with pytest.raises(BackendError):
+                gateway.complete('prompt', 10)
+        with pytest.raises(LLMUnavailable, match='3 consecutive failures'):
+            gateway.complete('prompt', 10)
+        with pytest.raises(LLMUnavailable):
+            gateway.check()
+        assert len(backend.calls) == 3
+        assert gateway.stats()['circuit_open'] == 1
+        assert gateway.stats()['short_circuited'] == 1
+
+    def test_half_open_trial_closes_circuit(self):
+        backend = FakeBackend(reply=lambda prompt: 'ok')
+        backend.failures = [BackendError('down', 500)] * 3
+        gateway = make_gateway(backend, max_retries=0, breaker_cooldown=0.05)
+        for _ in range(3):
+            with pytest.raises(BackendError):
+                gateway.complete('prompt', 10)
+        time.sleep(0.06)
+        assert gateway.complete('prompt', 10) == 'ok'
+        assert gateway.stats()['circuit_open'] == 0
+
+    def test_failed_trial_reopens(self):
+        backend = FakeBackend()
+        backend.failures = [BackendError('down', 500)] * 4
+        gateway = make_gateway(backend, max_retries=0, breaker_cooldown=0.05)
+        for _ in range(3):
+            with pytest.raises(BackendError):
+                gateway.complete('prompt', 10)
+        time.sleep(0.06)
+        with pytest.raises(BackendError):
+            gateway.complete('prompt', 10)
+        with pytest.raises(LLMUnavailable):
+            gateway.complete('prompt', 10)
+
+
+class TestConcurrency:
+    def test_process_limit_caps_in_flight_calls(self):
+        in_flight, peak = [0], [0]
+        lock = threading.Lock()
+
+        def reply(prompt):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.02)
+            with lock:
+                in_flight[0] -= 1
+            return 'ok'
+
+        gateway = make_gateway(FakeBackend(reply=reply), max_concurrency=2)
+        threads = [threading.Thread(target=gateway.complete, args=('prompt', 10)) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert peak[0] == 2
+
+    def test_no_slot_before_deadline_is_rejected(self):
+        gateway = make_gateway(FakeBackend(latency=0.3), max_concurrency=1, timeout=0.1)
+        holder = threading.Thread(target=lambda: gateway.complete('prompt', 10, timeout=1))
+        holder.start()
+        time.sleep(0.05)
+        with pytest.raises(LLMUnavailable, match='Too many'):
+            gateway.complete('prompt', 10)
+        holder.join()
+        assert gateway.stats()['rejected'] == 1
+
+    def test_host_slots_shared_across_gateways(self, tmp_path):
+        first = make_gateway(FakeBackend(latency=0.3), global_concurrency=1, slots_dir=str(tmp_path), timeout=1)
+        second = make_gateway(FakeBackend(), global_concurrency=1, slots_dir=str(tmp_path), timeout=0.1)
+        holder = threading.Thread(target=first.complete, args=('prompt', 10))
+        holder.start()
+        time.sleep(0.05)
+        with pytest.raises(LLMUnavailable):
+            second.complete('prompt', 10)
+        holder.join()
+        assert second.complete('prompt', 10)
+
+
+class TestAppRoutes:
+    def test_open_circuit_refuses_generation_with_503(self, client, monkeypatch):
+        import src.app as app_module
+
+        backend = FakeBackend()
+        backend.failures = [BackendError('down', 500)] * 5
+        gateway = make_gateway(backend, max_retries=0, breaker_threshold=1)
+        monkeypatch.setattr(app_module, 'gateway', gateway)
+        with pytest.raises(BackendError):
+            gateway.complete('prompt', 10)
+
+        response = client.post('/generate', data={'raw_text': 'Some material'})
+        assert response.status_code == 503
+        assert 'unavailable' in response.get_json()['error']
+        assert client.post('/generate/stream', data={'raw_text': 'Some material'}).status_code == 503
+
+    def test_fake_backend_serves_flashcard_jobs(self, client, monkeypatch):
+        import src.app as app_module
+
+        monkeypatch.setattr(app_module, 'gateway', make_gateway(FakeBackend(reply=lambda p: 'VCN: Virtual Cloud Network')))
+        monkeypatch.setattr(app_module.job_queue, 'eager', True)
+        app_module.ai_cache.clear()
+        response = client.post('/flashcards', data={'raw_text': 'Networking basics'})
+        job = client.get(response.get_json()['status_url']).get_json()
+        assert job['status'] == 'done'
+        assert job['result']['count'] == 1
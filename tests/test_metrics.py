@@ -0,0 +1,65 @@
+import logging
+import re
+import sqlite3
+
+import pytest
+
+import metrics
+from metrics import LLM_ERRORS, LLM_TOKENS, Histogram, TimedCursor, llm_call
+
+
+class TestRequestMetrics:
+    """Test per-request latency and SQL accounting"""
+
+    def test_metrics_endpoint(self, client):
+        client.get('/1/notes')
+        body = client.get('/metrics').get_data(as_text=True)
+        assert re.search(r'studybuddy_http_request_duration_seconds_count\{method="GET",'
+                         r'route="/<int:topic_id>/notes",status="200"\} [1-9]', body)
+        assert 'studybuddy_db_query_duration_seconds_bucket{operation="SELECT",le="0.005"}' in body
+        assert 'studybuddy_db_pool_created' in body
+
+    def test_server_timing_counts_queries(self, client):
+        response = client.get('/1/flashcards?format=json')
+        db = re.search(r'db;dur=([\d.]+);desc="(\d+) queries"', response.headers['Server-Timing'])
+        assert int(db.group(2)) >= 2
+
+    def test_slow_query_logged(self, client, monkeypatch, caplog):
+        monkeypatch.setattr(metrics, 'SLOW_QUERY_MS', 0)
+        with caplog.at_level(logging.WARNING, logger='studybuddy.sql'):
+            client.get('/1/notes')
+        slow = [r for r in caplog.records if r.getMessage() == 'slow query']
+        assert slow and slow[0].route == '/<int:topic_id>/notes' and 'FROM' in slow[0].sql
+
+
+class TestInstrumentation:
+    """Test the metric primitives and wrappers"""
+
+    def test_histogram_render(self):
+        h = Histogram('test_latency_seconds', 'test', ('op',), buckets=(0.1, 1.0))
+        h.observe(0.05, op='a')
+        h.observe(0.5, op='a')
+        lines = h.render()
+        assert 'test_latency_seconds_bucket{op="a",le="0.1"} 1' in lines
+        assert 'test_latency_seconds_bucket{op="a",le="1.0"} 2' in lines
+        assert 'test_latency_seconds_count{op="a"} 2' in lines
+
+    def test_timed_cursor_passes_through(self):
+        conn = sqlite3.connect(':memory:')
+        c = TimedCursor(conn.cursor())
+        c.execute('CREATE TABLE t (x)')
+        c.executemany('INSERT INTO t VALUES (?)', [(1,), (2,)])
+        c.arraysize = 7
+        assert c._cursor.arraysize == 7
+        c.execute('SELECT x FROM t ORDER BY x')
+        assert [row[0] for row in c] == [1, 2]
+
+    def test_llm_call_counts_tokens_and_errors(self):
+        before_in = LLM_TOKENS.value(direction='input')
+        with llm_call('create') as llm:
+            llm.usage = type('Usage', (), {'input_tokens': 12, 'output_tokens': 5})()
+        assert LLM_TOKENS.value(direction='input') == before_in + 12
+        with pytest.raises(RuntimeError):
+            with llm_call('create'):
+                raise RuntimeError('overloaded')
+        assert LLM_ERRORS.value(operation='create', error='RuntimeError') >= 1
@@ -0,0 +1,97 @@
+import sqlite3
+
+from migrations import MIGRATIONS, applied_versions, explain, migrate, reconcile_counts
+
+
+class TestMigrations:
+    """Test the schema migration runner"""
+
+    def test_migrate_applies_all_versions_once(self, tmp_path):
+        conn = sqlite3.connect(str(tmp_path / 'db.sqlite'))
+        assert migrate(conn) == [m.version for m in MIGRATIONS]
+        assert migrate(conn) == []
+        assert applied_versions(conn) == [m.version for m in MIGRATIONS]
+        conn.close()
+
+    def test_migrate_up_to_target(self, tmp_path):
+        conn = sqlite3.connect(str(tmp_path / 'db.sqlite'))
+        assert migrate(conn, target=1) == [1]
+        assert migrate(conn) == [m.version for m in MIGRATIONS[1:]]
+        conn.close()
+
+    def test_hot_queries_use_indexes(self, tmp_path):
+        conn = sqlite3.connect(str(tmp_path / 'db.sqlite'))
+        migrate(conn)
+        plans = explain(conn)
+        assert any('idx_notes_topic_id' in line for line in plans['notes page'])
+        assert any('idx_flashcards_topic_id' in line for line in plans['flashcards page'])
+        assert not any(line.startswith('SCAN') for line in plans['flashcards count'])
+        conn.close()
+
+
+def topic_counts(conn):
+    return conn.execute('SELECT id, notes_count, flashcards_count FROM topics ORDER BY id').fetchall()
+
+
+class TestTopicCounts:
+    """Test the trigger-maintained per-topic counts"""
+
+    def setup_topics(self, tmp_path, target=None):
+        conn = sqlite3.connect(str(tmp_path / 'db.sqlite'))
+        migrate(conn, target=target)
+        conn.executemany('INSERT INTO topics (name) VALUES (?)', [('First',), ('Second',)])
+        conn.commit()
+        return conn
+
+    def test_triggers_follow_inserts_deletes_and_moves(self, tmp_path):
+        conn = self.setup_topics(tmp_path)
+        conn.executemany('INSERT INTO notes (topic_id, content) VALUES (?, ?)', [(1, 'a'), (1, 'b'), (2, 'c')])
+        conn.executemany('INSERT INTO flashcards (topic_id, term, definition) VALUES (?, ?, ?)',
+                         [(2, 'VCN', 'Virtual Cloud Network')])
+        conn.execute("DELETE FROM notes WHERE content = 'a'")
+        conn.execute("UPDATE notes SET topic_id = 2 WHERE content = 'b'")
+        conn.execute("UPDATE flashcards SET definition = 'Virtual network' WHERE topic_id = 2")
+        conn.commit()
+        assert topic_counts(conn) == [(1, 0, 0), (2, 2, 1)]
+        conn.close()
+
+    def test_triggers_bump_topic_content_counter(self, tmp_path):
+        conn = self.setup_topics(tmp_path)
+
+        def counter():
+            return conn.execute("SELECT version FROM cache_versions WHERE name = 'topic_content'").fetchone()[0]
+
+        versions = [counter()]
+        for statement in ("INSERT INTO notes (topic_id, content) VALUES (1, 'a')",
+                          "INSERT INTO flashcards (topic_id, term, definition) VALUES (2, 'VCN', 'Virtual')",
+                          "UPDATE notes SET content = 'b'",
+                          "DELETE FROM flashcards"):
+            conn.execute(statement)
+            versions.append(counter())
+        assert versions == sorted(set(versions))
+        conn.execute("INSERT INTO flashcards (topic_id, term, definition) VALUES (2, 'VCN', 'Virtual')")
+        before = counter()
+        conn.execute('UPDATE flashcards SET due_at = 5')  # rescheduling isn't a content change
+        assert counter() == before
+        conn.close()
+
+    def test_migration_backfills_existing_rows(self, tmp_path):
+        conn = self.setup_topics(tmp_path, target=10)
+        conn.executemany('INSERT INTO notes (topic_id, content) VALUES (?, ?)', [(1, 'a'), (2, 'b'), (2, 'c')])
+        conn.commit()
+        migrate(conn)
+        assert topic_counts(conn) == [(1, 1, 0), (2, 2, 0)]
+        conn.close()
+
+    def test_reconcile_repairs_drift(self, tmp_path):
+        conn = self.setup_topics(tmp_path)
+        conn.execute("INSERT INTO notes (topic_id, content) VALUES (1, 'a')")
+        conn.execute('UPDATE topics SET notes_count = 7, flashcards_count = 3 WHERE id = 1')
+        conn.commit()
+        versions = dict(conn.execute('SELECT id, content_version FROM topics'))
+        assert reconcile_counts(conn) == 1
+        assert topic_counts(conn) == [(1, 1, 0), (2, 0, 0)]
+        # Only the repaired topic gets a new version (and so new ETags)
+        assert dict(conn.execute('SELECT id, content_version FROM topics')) == {1: versions[1] + 1, 2: versions[2]}
+        assert reconcile_counts(conn) == 0
+        conn.close()
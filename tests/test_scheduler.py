@@ -0,0 +1,58 @@
+from migrations import explain
+from scheduler import DAY, due_cards, quality, record_reviews, sm2
+
+
+class TestSM2:
+    """Test the SM-2 update rule"""
+
+    def test_intervals_grow(self):
+        state = (2.5, 0, 0)
+        intervals = []
+        for _ in range(4):
+            state = sm2(*state, 5)
+            intervals.append(state[1])
+        assert intervals[:2] == [1, 6]
+        assert intervals[2] > 6 and intervals[3] > intervals[2]
+
+    def test_lapse_resets_and_lowers_ease(self):
+        ease, interval_days, repetitions = sm2(2.5, 15, 3, 1)
+        assert (interval_days, repetitions) == (1, 0)
+        assert 1.3 <= ease < 2.5
+
+    def test_quality_scale(self):
+        assert quality(True, 1.0) == 5
+        assert quality(True, 0.5) == 3
+        assert quality(False, 0.0) == 1
+
+
+class TestDueCards:
+    """Test drawing and rescheduling cards"""
+
+    def test_new_cards_are_due(self, cursor):
+        cards = due_cards(cursor, 1, n=4, now=1000)
+        assert len(cards) == 4 and {card[1] for card in cards} == {1}
+
+    def test_reviewed_cards_come_back_later(self, cursor):
+        first = due_cards(cursor, 1, n=3, now=1000)
+        record_reviews(cursor, [(card[0], True, 1.0) for card in first], now=1000)
+        cursor.execute('SELECT interval_days, repetitions, due_at FROM flashcards WHERE id = ?', (first[0][0],))
+        assert cursor.fetchone() == (1, 1, 1000 + DAY)
+        second = due_cards(cursor, 1, n=3, now=1001)
+        assert not {c[0] for c in first} & {c[0] for c in second}
+
+    def test_tops_up_with_soonest_due(self, cursor):
+        cards = due_cards(cursor, 2, n=6, now=1000)
+        record_reviews(cursor, [(card[0], True, 1.0) for card in cards[:5]], now=1000)
+        record_reviews(cursor, [(cards[0][0], True, 1.0)], now=2000)
+        drawn = [card[0] for card in due_cards(cursor, 2, n=6, now=3000)]
+        assert drawn[0] == cards[5][0]
+        assert drawn[-1] == cards[0][0]
+
+    def test_deleted_cards_skipped(self, cursor):
+        card_id = due_cards(cursor, 1, n=1, now=1000)[0][0]
+        cursor.execute('DELETE FROM flashcards WHERE id = ?', (card_id,))
+        assert record_reviews(cursor, [(card_id, True, 1.0)]) == 0
+
+    def test_due_query_uses_index(self, cursor):
+        plan = ' '.join(explain(cursor.connection)['quiz due cards'])
+        assert 'idx_flashcards_due' in plan
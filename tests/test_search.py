@@ -0,0 +1,64 @@
+from search import fts_query, highlight
+
+
+class TestSearch:
+    """Test full-text search over notes and flashcards"""
+
+    def search(self, client, **params):
+        return client.get('/search', query_string=dict(params, format='json')).get_json()
+
+    def test_finds_notes_and_flashcards(self, client):
+        client.post('/1/notes', data={'content': 'Subnets divide a virtual cloud network'})
+        client.post('/1/flashcards', data={'term': 'VCN', 'definition': 'Virtual cloud network'})
+        client.post('/1/notes', data={'content': 'Unrelated note about IAM policies'})
+        results = self.search(client, q='cloud network')['results']
+        assert {r['type'] for r in results} == {'note', 'flashcard'}
+        assert all('<mark>' in r['snippet'] for r in results)
+
+    def test_prefix_and_kind_filter(self, client):
+        client.post('/1/notes', data={'content': 'Compartments organize resources'})
+        client.post('/1/flashcards', data={'term': 'Compartment', 'definition': 'Logical container'})
+        results = self.search(client, q='compart', kind='flashcard')['results']
+        assert [(r['type'], r['term']) for r in results] == [('flashcard', 'Compartment')]
+
+    def test_topic_filter(self, client):
+        client.post('/topics/create', data={'name': 'Networking', 'description': ''})
+        client.post('/1/notes', data={'content': 'Load balancer in General'})
+        client.post('/2/notes', data={'content': 'Load balancer in Networking'})
+        results = self.search(client, q='balancer', topic_id=2)['results']
+        assert [r['topic_id'] for r in results] == [2]
+
+    def test_index_follows_deletes(self, client):
+        client.post('/1/notes', data={'content': 'Ephemeral gateway note'})
+        note_id = self.search(client, q='ephemeral')['results'][0]['id']
+        client.post(f'/1/delete-note/{note_id}')
+        assert self.search(client, q='ephemeral')['results'] == []
+
+    def test_pagination(self, client):
+        for i in range(5):
+            client.post('/1/notes', data={'content': f'Bucket note {i}'})
+        first = self.search(client, q='bucket', per_page=3)
+        second = self.search(client, q='bucket', per_page=3, page=2)
+        assert first['has_next'] and not second['has_next']
+        ids = [r['id'] for r in first['results'] + second['results']]
+        assert len(set(ids)) == 5
+
+    def test_special_characters_and_html(self, client):
+        client.post('/1/notes', data={'content': '<script>alert(1)</script> "quoted" OR NEAR'})
+        assert self.search(client, q='"quoted" OR (NEAR*')['results']
+        assert self.search(client, q='*:"')['results'] == []
+        response = client.get('/search?q=script')
+        assert b'<script>alert' not in response.data
+        assert b'&lt;<mark>script</mark>&gt;' in response.data
+
+
+class TestQueryHelpers:
+    """Test FTS query building and snippet highlighting"""
+
+    def test_fts_query(self):
+        assert fts_query('cloud net') == '"cloud" "net"*'
+        assert fts_query('AND OR -') == '"AND" "OR"*'
+        assert fts_query('  ') is None
+
+    def test_highlight_escapes(self):
+        assert str(highlight('<b>\x02x\x03</b>')) == '&lt;b&gt;<mark>x</mark>&lt;/b&gt;'
@@ -0,0 +1,38 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def env_for(tmp_path, **extra):
+    env = dict(os.environ, SQLITE_PATH=str(tmp_path / 'data' / 'app.db'), FLASK_ENV='development', **extra)
+    env.pop('DATABASE_URL', None)
+    return env
+
+
+class TestStartup:
+    """Test that importing the app has no side effects"""
+
+    def test_import_touches_no_database_or_sdk(self, tmp_path):
+        code = "import sys; sys.path.insert(0, 'src'); import app; print('anthropic' in sys.modules)"
+        out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env_for(tmp_path),
+                             capture_output=True, text=True, check=True)
+        assert out.stdout.strip().splitlines()[-1] == 'False'
+        assert not (tmp_path / 'data').exists()
+
+    def test_concurrent_init_db(self, tmp_path):
+        cmd = [sys.executable, '-m', 'flask', '--app', 'app', 'init-db']
+        procs = [subprocess.Popen(cmd, cwd=ROOT, env=env_for(tmp_path), stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE) for _ in range(3)]
+        assert [p.wait(timeout=60) for p in procs] == [0, 0, 0]
+        conn = sqlite3.connect(str(tmp_path / 'data' / 'app.db'))
+        assert conn.execute('SELECT name FROM topics').fetchall() == [('General',)]
+        conn.close()
+
+    def test_lazy_client(self, monkeypatch):
+        import src.app as app_module
+        monkeypatch.setattr(app_module, 'client', None)
+        monkeypatch.delenv('ANTHROPIC_API_KEY', raising=False)
+        assert app_module.get_client() is None
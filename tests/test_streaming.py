@@ -0,0 +1,83 @@
+import json
+import sqlite3
+
+import pytest
+
+
+class FakeStream:
+    def __init__(self, chunks, log):
+        self.chunks = chunks
+        self.log = log
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.log.append('closed')
+
+    @property
+    def text_stream(self):
+        for chunk in self.chunks:
+            self.log.append(chunk)
+            yield chunk
+
+
+@pytest.fixture
+def stream_log(monkeypatch):
+    import src.app as app_module
+
+    log = []
+
+    class FakeMessages:
+        def stream(self, **kwargs):
+            return FakeStream(['Cloud ', 'notes ', 'here.'], log)
+
+    monkeypatch.setattr(app_module, 'client', type('Client', (), {'messages': FakeMessages()})())
+    app_module.ai_cache.clear()
+    return log
+
+
+def parse_events(body):
+    events = []
+    for message in body.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in message.split('\n') if not line.startswith(':'))
+        if 'data' in lines:
+            events.append((lines.get('event'), json.loads(lines['data'])))
+    return events
+
+
+class TestSummaryStreaming:
+    """Test the Server-Sent Events summary endpoint"""
+
+    def test_streams_deltas_then_saves_note(self, client, stream_log):
+        response = client.post('/generate/stream', data={'raw_text': 'Long material'})
+        assert response.mimetype == 'text/event-stream'
+        events = parse_events(response.get_data(as_text=True))
+        assert [data['delta'] for event, data in events if event is None] == ['Cloud ', 'notes ', 'here.']
+        assert events[-1] == ('done', {'summary': 'Cloud notes here.'})
+        notes = client.get('/notes?format=json').get_json()['notes']
+        assert notes[0]['content'] == 'Cloud notes here.'
+
+    def test_disconnect_closes_upstream_without_saving(self, client, stream_log):
+        response = client.post('/generate/stream', data={'raw_text': 'Abandoned material'}, buffered=False)
+        chunks = iter(response.response)
+        next(chunks)  # stream open
+        next(chunks)  # first delta
+        response.close()
+        assert stream_log == ['Cloud ', 'closed']
+        notes = client.get('/notes?format=json').get_json()['notes']
+        assert all(note['content'] != 'Cloud' for note in notes)
+
+    def test_failed_save_ends_with_an_error_event(self, client, stream_log, monkeypatch):
+        import src.app as app_module
+
+        def locked(*args):
+            raise sqlite3.OperationalError('database is locked')
+
+        monkeypatch.setattr(app_module.write_queue, 'execute', locked)
+        events = parse_events(client.post('/generate/stream', data={'raw_text': 'Long material'}).get_data(as_text=True))
+        assert events[-1] == ('error', {'error': 'Error generating summary: database is locked'})
+        assert 'done' not in [event for event, _ in events]
+
+    def test_requires_text(self, client, stream_log):
+        assert client.post('/generate/stream', data={'raw_text': ' '}).status_code == 400
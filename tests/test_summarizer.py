@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+
+from summarizer import CHUNK_PROMPT, REDUCE_PROMPT, amap_summaries, collapse, split_chunks, summarize
+
+
+def paragraphs(n, size=100):
+    return '\n\n'.join(f'Paragraph {i}. ' + 'x' * size for i in range(n))
+
+
+class TestSplitChunks:
+    """Test chunking on paragraph boundaries"""
+
+    def test_short_text_is_one_chunk(self):
+        assert split_chunks('Short text', max_chars=100) == ['Short text']
+
+    def test_chunks_respect_limit_and_order(self):
+        text = paragraphs(20)
+        chunks = split_chunks(text, max_chars=500)
+        assert len(chunks) > 1
+        assert all(len(chunk) <= 500 for chunk in chunks)
+        assert '\n\n'.join(chunks) == text
+
+    def test_oversized_paragraph_split_on_sentences(self):
+        text = ' '.join(f'Sentence number {i} is here.' for i in range(100))
+        chunks = split_chunks(text, max_chars=200)
+        assert all(len(chunk) <= 200 for chunk in chunks)
+        assert chunks[0].endswith('.')
+
+
+class TestSummarize:
+    """Test the parallel map-reduce pipeline"""
+
+    def test_small_input_uses_single_prompt(self):
+        calls = []
+        result = summarize('tiny', lambda t, x, m: calls.append(t) or 'done', 'single {raw_text}', 400)
+        assert result == 'done'
+        assert calls == ['single {raw_text}']
+
+    def test_map_runs_concurrently_then_reduces(self):
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def generate(template, text, max_tokens):
+            if template == CHUNK_PROMPT:
+                with lock:
+                    active[0] += 1
+                    peak[0] = max(peak[0], active[0])
+                time.sleep(0.05)
+                with lock:
+                    active[0] -= 1
+                return text.split('.')[0]
+            return 'merged: ' + text
+
+        start = time.perf_counter()
+        result = summarize(paragraphs(8), generate, 'single {raw_text}', 400, max_chars=150, max_workers=4)
+        elapsed = time.perf_counter() - start
+        assert peak[0] == 4
+        assert elapsed < 8 * 0.05
+        assert result.startswith('merged: Part 1:')
+        assert 'Paragraph 0' in result and 'Paragraph 7' in result
+
+    def test_collapse_reduces_until_it_fits(self):
+        calls = []
+
+        def generate(template, text, max_tokens):
+            calls.append(template)
+            return 'short'
+
+        partials = collapse(['y' * 80] * 10, generate, max_chars=300)
+        assert len('\n\n'.join(partials)) <= 300
+        assert set(calls) == {REDUCE_PROMPT}
+
+    def test_async_map_bounds_calls_in_flight_and_keeps_order(self):
+        active, peak = [0], [0]
+
+        async def agenerate(template, text, max_tokens):
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            await asyncio.sleep(0.01 * (10 - int(text)))
+            active[0] -= 1
+            return f'summary {text}'
+
+        results = asyncio.run(amap_summaries([str(i) for i in range(10)], agenerate, max_workers=3))
+        assert results == [f'summary {i}' for i in range(10)]
+        assert peak[0] == 3
+
+    def test_fan_out_bounded_by_pool_headroom(self, monkeypatch):
+        import src.app as app_module
+
+        monkeypatch.setattr(app_module, 'pool_headroom', lambda: None)
+        assert app_module.summary_concurrency() == app_module.SUMMARY_CONCURRENCY
+        monkeypatch.setattr(app_module, 'pool_headroom', lambda: 2)
+        assert app_module.summary_concurrency() == min(2, app_module.SUMMARY_CONCURRENCY)
+        monkeypatch.setattr(app_module, 'pool_headroom', lambda: 0)
+        assert app_module.summary_concurrency() == 1
@@ -0,0 +1,86 @@
+import sqlite3
+
+import pytest
+
+from migrations import migrate
+from topic_cache import TopicCache
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    migrate(conn)
+    conn.execute("INSERT INTO topics (name, description) VALUES ('General', 'Default study topic')")
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+class TestTopicCache:
+    """Test the in-process topic metadata cache"""
+
+    def test_hits_after_first_lookup(self, conn):
+        cache = TopicCache(check_interval=60)
+        assert cache.by_name(conn, 'General') == (1, 'General', 'Default study topic')
+        assert cache.get(conn, 1) == (1, 'General', 'Default study topic')
+        assert cache.by_name(conn, 'General')[0] == 1
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses']) == (2, 1)
+        assert stats['hit_ratio'] == pytest.approx(2 / 3)
+
+    def test_missing_topic(self, conn):
+        cache = TopicCache()
+        assert cache.get(conn, 99) is None
+        assert cache.stats()['entries'] == 0
+
+    def test_other_workers_see_invalidation(self, conn):
+        writer, reader = TopicCache(check_interval=60), TopicCache(check_interval=0)
+        assert reader.get(conn, 1)[1] == 'General'
+        conn.execute("UPDATE topics SET name = 'Renamed' WHERE id = 1")
+        conn.commit()
+        assert reader.get(conn, 1)[1] == 'General'  # no one has invalidated yet
+        writer.invalidate(conn)
+        assert reader.get(conn, 1)[1] == 'Renamed'
+
+    def test_version_checked_once_per_interval(self, conn):
+        cache = TopicCache(check_interval=60)
+        for _ in range(5):
+            cache.get(conn, 1)
+        assert cache.stats()['version_checks'] == 1
+
+    def test_default_topic_created_when_missing(self, conn):
+        conn.execute('DELETE FROM topics')
+        conn.commit()
+        cache = TopicCache()
+        row = cache.default_topic(conn)
+        assert row[1:] == ('General', 'Default study topic')
+
+    def test_bounded(self, conn):
+        conn.executemany('INSERT INTO topics (name) VALUES (?)', [(f't{i}',) for i in range(10)])
+        cache = TopicCache(max_entries=4, check_interval=60)
+        for topic_id in range(1, 12):
+            cache.get(conn, topic_id)
+        assert cache.stats()['entries'] == 4
+
+
+class TestTopicRoutes:
+    """Test that topic edits invalidate the cache used by the routes"""
+
+    def test_rename_visible_immediately(self, client):
+        client.post('/topics/create', data={'name': 'Networking', 'description': ''})
+        assert b'Networking' in client.get('/2/notes').data
+        client.post('/topics/2/edit', data={'name': 'Compute', 'description': ''})
+        assert b'Compute' in client.get('/2/notes').data
+
+    def test_deleted_topic_is_gone(self, client):
+        client.post('/topics/create', data={'name': 'Temp', 'description': ''})
+        assert client.get('/2/flashcards').status_code == 200
+        client.post('/topics/2/delete')
+        assert client.get('/2/flashcards').status_code == 404
+
+    def test_stats_endpoint(self, client):
+        client.get('/notes')
+        client.get('/notes')
+        stats = client.get('/cache/stats').get_json()
+        assert stats['topics']['hits'] >= 1
+        assert 'hit_ratio' in stats['ai_responses']
@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+
+import pytest
+
+from write_queue import WriteQueue, WriteQueueFull, WriteTimeout, fcntl
+
+
+@pytest.fixture
+def writer(app):
+    queues = []
+
+    def make(**kwargs):
+        options = dict(enabled=True, batch_window=0.05, timeout=5, checkpoint_interval=60)
+        options.update(kwargs)
+        queues.append(WriteQueue(**options))
+        return queues[-1]
+
+    yield make
+    for q in queues:
+        q.close()
+
+
+def note_contents():
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        return sorted(row[0] for row in conn.execute('SELECT content FROM notes'))
+    finally:
+        conn.close()
+
+
+def insert_note(q, content):
+    return q.execute('INSERT INTO notes (topic_id, content) VALUES (?, ?)', (1, content))
+
+
+class TestGroupCommit:
+    def test_concurrent_writes_share_commits(self, writer):
+        q = writer()
+        threads = [threading.Thread(target=insert_note, args=(q, f'note {i:02d}')) for i in range(40)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert note_contents() == [f'note {i:02d}' for i in range(40)]
+        stats = q.stats()
+        assert stats['writes'] == 40
+        assert stats['batches'] < 40
+        assert stats['max_batch_size'] > 1
+
+    def test_returns_result_once_committed(self, writer):
+        q = writer(batch_window=0)
+        note_id = insert_note(q, 'first')
+        from database import get_db_connection
+
+        conn = get_db_connection()
+        assert conn.execute('SELECT content FROM notes WHERE id = ?', (note_id,)).fetchone()[0] == 'first'
+        conn.close()
+
+    def test_failing_write_fails_alone(self, writer):
+        q = writer()
+        errors = []
+
+        def bad():
+            try:
+                q.execute('INSERT INTO notes (topic_id, content) VALUES (?, ?)', (1, None))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=insert_note, args=(q, 'kept')), threading.Thread(target=bad),
+                   threading.Thread(target=insert_note, args=(q, 'also kept'))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(errors) == 1
+        assert note_contents() == ['also kept', 'kept']
+
+    def test_timed_out_write_is_never_applied(self, writer):
+        q = writer(batch_window=0, timeout=0.05)
+        slow = threading.Thread(target=q.write, args=(lambda c: time.sleep(0.3),))
+        slow.start()
+        time.sleep(0.02)
+        with pytest.raises(WriteTimeout):
+            insert_note(q, 'too late')
+        slow.join()
+        time.sleep(0.05)
+        assert note_contents() == []
+        assert q.stats()['timeouts'] == 1
+
+    @pytest.mark.skipif(fcntl is None, reason='needs flock')
+    def test_batch_fails_when_lock_is_held_elsewhere(self, writer):
+        from database import get_pool
+
+        q = writer(batch_window=0, timeout=0.1)
+        with open(get_pool().path + '.write-lock', 'a') as other_process:
+            fcntl.flock(other_process, fcntl.LOCK_EX)
+            started = time.monotonic()
+            with pytest.raises(WriteTimeout):
+                insert_note(q, 'blocked')
+            assert time.monotonic() - started < 1
+            fcntl.flock(other_process, fcntl.LOCK_UN)
+        assert note_contents() == []
+        assert q.stats()['timeouts'] == 1
+        insert_note(q, 'after')
+        assert note_contents() == ['after']
+
+    def test_disabled_writes_inline(self, writer):
+        q = writer(enabled=False)
+        insert_note(q, 'inline')
+        assert note_contents() == ['inline']
+        assert q.stats()['inline'] == 1
+
+
+class TestCheckpoints:
+    def test_checkpoints_and_truncates_wal(self, writer):
+        from database import get_pool
+
+        q = writer(batch_window=0, checkpoint_interval=0, truncate_pages=1)
+        for i in range(5):
+            insert_note(q, f'note {i}')
+        deadline = time.monotonic() + 2
+        while q.stats()['truncations'] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert q.stats()['checkpoints'] >= 1
+        assert q.stats()['truncations'] >= 1
+        assert os.path.getsize(get_pool().path + '-wal') == 0
+
+
+class TestRoutes:
+    def test_note_and_card_posts_go_through_the_writer(self, client):
+        from write_queue import write_queue
+
+        before = write_queue.stats()['writes']
+        client.post('/notes', data={'content': 'Queued note'})
+        client.post('/flashcards', data={'term': 'VCN', 'definition': 'Virtual Cloud Network'})
+        assert 'Queued note' in client.get('/notes').get_data(as_text=True)
+        assert 'Virtual Cloud Network' in client.get('/flashcards').get_data(as_text=True)
+        assert write_queue.stats()['writes'] == before + 2
+
+    @pytest.mark.parametrize('error', [WriteQueueFull, WriteTimeout])
+    def test_backed_up_writer_answers_503_with_retry_after(self, client, monkeypatch, error):
+        from write_queue import write_queue
+
+        def backed_up(*args):
+            raise error('writer backed up')
+
+        monkeypatch.setattr(write_queue, 'execute', backed_up)
+        response = client.post('/notes', data={'content': 'Dropped note'})
+        assert response.status_code == 503
+        assert int(response.headers['Retry-After']) >= 1
+        assert 'Dropped note' not in client.get('/notes').get_data(as_text=True)
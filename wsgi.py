@@ -5,7 +5,9 @@ import os
 # Add src directory to path so imports work
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
-from app import app
+from app import create_app
+
+app = create_app()
 
 if __name__ == "__main__":
     app.run()